@@ -1,4 +1,5 @@
 import os
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
@@ -16,8 +17,74 @@ def create_app():
     app = Flask(__name__, instance_relative_config=True)
 
     app.config['SECRET_KEY'] = 'uma-chave-secreta-muito-dificil-de-adivinhar'
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(app.instance_path, "database.db")}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # URI (DATABASE_URL), pool, bind somente leitura e PRAGMAs do SQLite: ver banco.py
+    from .banco import configurar_banco, init_banco
+    configurar_banco(app)
+    # Threads que renderizam os relatórios PDF em segundo plano
+    app.config['RELATORIO_WORKERS'] = 2
+    # Linhas por PDF: o ReportLab mantém o documento inteiro em memória até o fim
+    app.config['RELATORIO_MAXIMO_LINHAS'] = int(os.environ.get('RELATORIO_MAXIMO_LINHAS', 100000))
+    # Segundos entre as pulsações de um job em processamento e sem pulsação até outro processo retomá-lo
+    app.config['RELATORIO_JOB_PULSACAO'] = 30
+    app.config['RELATORIO_JOB_TIMEOUT'] = 300
+    # Itens por página nas listagens de produtos (paginação por chave)
+    app.config['PRODUTOS_POR_PAGINA'] = 50
+    # Instrumentação: fração de requisições perfiladas com cProfile (0 desliga),
+    # limite para registrar rotas lentas no log e acesso ao /metrics: com token, só
+    # com ele; sem token, desligado, a menos que METRICAS_PUBLICO=1
+    app.config['PROFILER_AMOSTRAGEM'] = float(os.environ.get('PROFILER_AMOSTRAGEM', 0))
+    app.config['ROTA_LENTA_MS'] = 1000
+    app.config['METRICAS_TOKEN'] = os.environ.get('METRICAS_TOKEN')
+    app.config['METRICAS_PUBLICO'] = os.environ.get('METRICAS_PUBLICO') == '1'
+    # Busca por código de barras: cache em memória e Open Food Facts
+    app.config['BUSCA_CACHE_TAMANHO'] = 5000
+    app.config['BUSCA_CACHE_TTL'] = 600
+    app.config['BUSCA_CACHE_NEGATIVO_TTL'] = 3600
+    app.config['OPEN_FOOD_FACTS_URL'] = 'https://world.openfoodfacts.org/api/v2/product/{barcode}.json'
+    app.config['OPEN_FOOD_FACTS_TIMEOUT'] = 3.0
+    app.config['OPEN_FOOD_FACTS_TIMEOUT_MIN'] = 0.5
+    app.config['OPEN_FOOD_FACTS_POOL'] = 10
+    app.config['OPEN_FOOD_FACTS_LIMITE_FALHAS'] = 5
+    app.config['OPEN_FOOD_FACTS_TEMPO_ABERTO'] = 30
+    # Prazo total (s) das consultas externas de um cadastro em lote
+    app.config['LOTE_BUSCA_PRAZO'] = 5.0
+    # Ciclo de validade: dias antes do vencimento para rebaixar automaticamente,
+    # dias depois do vencimento para descartar e agendador em processo (opcional)
+    app.config['CICLO_DIAS_REBAIXA'] = 2
+    app.config['CICLO_DIAS_DESCARTE'] = 7
+    app.config['CICLO_AGENDADOR'] = os.environ.get('CICLO_AGENDADOR') == '1'
+    app.config['CICLO_INTERVALO_MINUTOS'] = 60
+    # Vencidos/descartados com validade há mais de N dias vão para o arquivo (flask arquivar)
+    app.config['ARQUIVO_RETENCAO_DIAS'] = int(os.environ.get('ARQUIVO_RETENCAO_DIAS', 180))
+    # Eventos em tempo real (SSE): conexões simultâneas por processo (sirva com
+    # gunicorn -k gevent para manter centenas abertas; em worker síncrono cada uma
+    # ocupa uma thread até SSE_DURACAO_MAXIMA segundos, ver eventos.py), intervalo de
+    # leitura da tabela de eventos, eventos pendentes por conexão antes de pedir ao
+    # cliente que recarregue e por quanto tempo os eventos ficam para reconexões
+    from .eventos import workers_assincronos
+    app.config['SSE_MAX_CONEXOES_SINCRONO'] = 4
+    app.config['SSE_MAX_CONEXOES_ASSINCRONO'] = 1000
+    padrao = app.config['SSE_MAX_CONEXOES_ASSINCRONO'] if workers_assincronos() else app.config['SSE_MAX_CONEXOES_SINCRONO']
+    app.config['SSE_MAX_CONEXOES'] = int(os.environ.get('SSE_MAX_CONEXOES', padrao))
+    app.config['SSE_DURACAO_MAXIMA'] = 300
+    app.config['SSE_INTERVALO_CONSULTA'] = 1.0
+    app.config['SSE_TAMANHO_FILA'] = 100
+    app.config['SSE_RETENCAO_MINUTOS'] = 60
+    # Segundos que o usuário logado (com loja e setor) fica em cache; alterações em
+    # qualquer processo já o invalidam pelos contadores de versão (ver identidade.py)
+    app.config['USUARIO_CACHE_TTL'] = 300
+    # Login: custo do bcrypt (hashes com outro custo são refeitos no próximo login),
+    # threads e verificações pendentes do pool de hash e limites de tentativas
+    # como (tentativas seguidas, fichas repostas por minuto)
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['LOGIN_HASH_WORKERS'] = int(os.environ.get('LOGIN_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    app.config['LOGIN_HASH_FILA'] = 32
+    app.config['LOGIN_HASH_TIMEOUT'] = 10
+    app.config['LOGIN_LIMITE_IP'] = (30, 60)
+    app.config['LOGIN_LIMITE_USUARIO'] = (5, 6)
+    # Tempo máximo de importação do create_app() (flask tempo-inicializacao)
+    app.config['INICIALIZACAO_ORCAMENTO_MS'] = float(os.environ.get('INICIALIZACAO_ORCAMENTO_MS', 1000))
 
     try:
         os.makedirs(app.instance_path)
@@ -25,9 +92,28 @@ def create_app():
         pass
 
     db.init_app(app)
+    init_banco(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
 
+    from .busca_produto import configurar_cache
+    from .identidade import configurar_cache_usuarios
+    from .autenticacao import configurar_autenticacao
+    configurar_cache(app)
+    configurar_cache_usuarios(app)
+    configurar_autenticacao(app)
+
+    from .eventos import init_eventos
+    init_eventos(app)
+
+    # Estáticos versionados e comprimidos, ETag das listagens (ver cache_http.py)
+    from .cache_http import init_cache_http
+    init_cache_http(app)
+
+    # Métricas por endpoint (/metrics), contagem de SQL e perfil amostrado
+    from .metricas import init_metricas
+    init_metricas(app, db)
+
     # Importa e registra os Blueprints (nossos conjuntos de rotas)
     from .routes import routes
     from .auth import auth_bp
@@ -35,13 +121,31 @@ def create_app():
     app.register_blueprint(routes)
     app.register_blueprint(auth_bp)
 
+    if app.config['CICLO_AGENDADOR']:
+        from .ciclo_validade import iniciar_agendador
+        iniciar_agendador(app)
+
     # Adiciona comandos customizados para inicializar o sistema
     @app.cli.command("init-db")
     def init_db_command():
         """Cria as tabelas e povoa os dados iniciais."""
-        from .models import Setor, Loja
+        from .models import Setor, Loja, Produto, ProdutoCatalogo, ProdutoArquivado, RelatorioJob
+        from sqlalchemy import inspect as inspecionar, text
         
         db.create_all()
+        # create_all não adiciona colunas nem índices em tabelas já existentes
+        colunas_novas = [('produto_catalogo', 'versao', 'INTEGER NOT NULL DEFAULT 0'), ('contador_versao', 'atualizado_em', 'DATETIME'), ('versao_dados', 'versao_perdas', 'INTEGER'), ('relatorio_job', 'truncado', 'BOOLEAN'), ('relatorio_job', 'processado_por', 'VARCHAR(100)'), ('relatorio_job', 'atualizado_em', 'DATETIME')]
+        for tabela, coluna, tipo in colunas_novas:
+            if coluna not in {c['name'] for c in inspecionar(db.engine).get_columns(tabela)}:
+                db.session.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}'))
+                db.session.commit()
+        # Chaves de idempotência eram únicas na rede inteira; agora são por usuário
+        if inspecionar(db.engine).has_table('registro_idempotencia'):
+            db.session.execute(text('INSERT INTO idempotencia_usuario (usuario_id, chave, criado_em) SELECT usuario_id, chave, criado_em FROM registro_idempotencia'))
+            db.session.execute(text('DROP TABLE registro_idempotencia'))
+            db.session.commit()
+        for index in list(Produto.__table__.indexes) + list(ProdutoCatalogo.__table__.indexes) + list(ProdutoArquivado.__table__.indexes) + list(RelatorioJob.__table__.indexes):
+            index.create(bind=db.engine, checkfirst=True)
         
         # Povoar setores
         setores_iniciais = ['Padaria', 'Açougue', 'Frios', 'Mercearia']
@@ -56,17 +160,40 @@ def create_app():
             db.session.add(loja_matriz)
             
         db.session.commit()
+
+        # Índices de busca textual (FTS5) e seus triggers
+        from .busca_texto import criar_indices
+        criar_indices()
+
+        # Preenche o resumo de validades para produtos cadastrados antes dele existir
+        from .models import ResumoValidade
+        from .resumo import reconstruir_resumo
+        if not ResumoValidade.query.first() and Produto.query.first():
+            reconstruir_resumo()
+        # ...e o agregado da análise de perdas
+        from .models import PerdaDiaria
+        from .perdas import reconstruir_perdas_diarias
+        if not PerdaDiaria.query.first() and Produto.query.first():
+            reconstruir_perdas_diarias()
+
+        # Marca como vencidos/descartados os produtos cadastrados antes do ciclo de validade
+        from .ciclo_validade import executar_ciclo
+        executar_ciclo(app)
         print("Banco de dados inicializado e dados padrão criados com sucesso.")
 
 
+    # Usuário e senha vêm das opções ou do ambiente, para rodar em scripts de
+    # provisionamento; nada é perguntado no terminal, o que faltar é erro de uso
     @app.cli.command("create-general-manager")
-    def create_manager():
-        """Cria o usuário gerente geral inicial."""
+    @click.option('--username', envvar='GERENTE_GERAL_USUARIO', help='E-mail de login (ou GERENTE_GERAL_USUARIO).')
+    @click.option('--password', envvar='GERENTE_GERAL_SENHA', help='Senha (ou GERENTE_GERAL_SENHA).')
+    def create_manager(username, password):
+        """Cria o usuário gerente geral inicial (não faz nada se ele já existir)."""
         from .models import Usuario
-        
-        username = input("Digite o e-mail do Gerente Geral: ")
-        password = input("Digite a senha do Gerente Geral: ")
-        
+
+        if not username or not password:
+            raise click.UsageError('Informe --username e --password (ou GERENTE_GERAL_USUARIO e GERENTE_GERAL_SENHA).')
+
         if Usuario.query.filter_by(username=username).first():
             print(f"Usuário '{username}' já existe.")
             return
@@ -78,4 +205,227 @@ def create_app():
         db.session.commit()
         print(f"Usuário Gerente Geral '{username}' criado com sucesso!")
 
+    @app.cli.command("importar-catalogo")
+    @click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--lote', type=int, default=5000, help='Linhas gravadas por transação.')
+    def importar_catalogo_command(arquivo, lote):
+        """Importa o cadastro de produtos do ERP (CSV ou XLSX com barcode, nome_produto, plu) para o catálogo."""
+        from .planilhas import importar_catalogo
+
+        resumo = importar_catalogo(arquivo, tamanho_lote=lote)
+        print(f"{resumo['importadas']} linha(s) importada(s) em {resumo['segundos']:.1f}s ({resumo['linhas_por_segundo']:.0f} linhas/s).")
+        if resumo['rejeitadas']:
+            print(f"{len(resumo['rejeitadas'])} linha(s) rejeitada(s):")
+            for numero, motivo in resumo['rejeitadas'][:50]:
+                print(f"  linha {numero}: {motivo}")
+            if len(resumo['rejeitadas']) > 50:
+                print(f"  ... e mais {len(resumo['rejeitadas']) - 50}.")
+
+    @app.cli.command("exportar")
+    @click.argument('tabela', type=click.Choice(['produtos', 'catalogo']))
+    @click.argument('arquivo', type=click.Path(dir_okay=False))
+    @click.option('--loja-id', type=int, default=None)
+    @click.option('--setor-id', type=int, default=None)
+    def exportar_command(tabela, arquivo, loja_id, setor_id):
+        """Exporta produtos ou o catálogo para CSV ou XLSX (pela extensão do arquivo)."""
+        import time
+        from . import planilhas
+
+        inicio = time.monotonic()
+        if tabela == 'produtos':
+            total = planilhas.exportar_para_arquivo(planilhas.COLUNAS_PRODUTOS, planilhas.consultar_produtos_exportacao(loja_id, setor_id), arquivo)
+        else:
+            total = planilhas.exportar_para_arquivo(planilhas.COLUNAS_CATALOGO, planilhas.consultar_catalogo_exportacao(), arquivo)
+        duracao = time.monotonic() - inicio
+        print(f"{total} linha(s) exportada(s) para {arquivo} em {duracao:.1f}s ({total / duracao if duracao else total:.0f} linhas/s).")
+
+    @app.cli.command("resumo-validade")
+    @click.option('--reconstruir', is_flag=True, help='Recalcula o resumo a partir da tabela de produtos.')
+    def resumo_validade_command(reconstruir):
+        """Verifica (ou reconstrói) o resumo de validades usado no dashboard do Gerente Geral."""
+        from .resumo import verificar_resumo, reconstruir_resumo
+
+        if reconstruir:
+            print(f"Resumo reconstruído com {reconstruir_resumo()} linha(s).")
+            return
+        divergencias = verificar_resumo()
+        if not divergencias:
+            print("Resumo de validades consistente com a tabela de produtos.")
+            return
+        print(f"{len(divergencias)} divergência(s) (chave, esperado, atual):")
+        for chave, esperado, atual in divergencias[:50]:
+            print(f"  {chave}: {esperado} != {atual}")
+        print("Execute 'flask resumo-validade --reconstruir' para corrigir.")
+
+    @app.cli.command("perdas")
+    @click.option('--reconstruir', is_flag=True, help='Recalcula o agregado inteiro a partir dos produtos e do arquivo.')
+    def perdas_command(reconstruir):
+        """Atualiza o agregado diário da análise de perdas (o ciclo-validade já faz isso ao fim da varredura)."""
+        import time
+        from .perdas import atualizar_perdas_diarias, reconstruir_perdas_diarias
+
+        inicio = time.monotonic()
+        if reconstruir:
+            print(f"Agregado de perdas reconstruído com {reconstruir_perdas_diarias()} linha(s) em {time.monotonic() - inicio:.1f}s.")
+            return
+        print(f"{atualizar_perdas_diarias()} dia(s) de loja/setor recalculado(s) em {time.monotonic() - inicio:.1f}s.")
+
+    @app.cli.command("indice-busca")
+    def indice_busca_command():
+        """Recria e reindexa os índices de busca textual (FTS5) de produtos e catálogo."""
+        from .busca_texto import criar_indices
+
+        if criar_indices(reconstruir=True):
+            print("Índices de busca reconstruídos.")
+        else:
+            print("Busca textual FTS5 disponível apenas com SQLite; a busca usará LIKE.")
+
+    @app.cli.command("relatorio-jobs")
+    @click.option('--limpar', is_flag=True, help='Remove os jobs finalizados e seus PDFs.')
+    @click.option('--dias', type=int, default=None, help='Com --limpar, remove só jobs mais antigos que N dias.')
+    def relatorio_jobs_command(limpar, dias):
+        """Lista a fila de relatórios em segundo plano ou limpa os jobs finalizados."""
+        from .models import RelatorioJob
+        from .jobs import limpar_jobs
+
+        if limpar:
+            print(f"{limpar_jobs(app, dias)} job(s) removido(s).")
+            return
+        for job in RelatorioJob.query.order_by(RelatorioJob.criado_em.desc()).all():
+            print(f"{job.id}  {job.status:<12} {job.criado_em:%d/%m/%Y %H:%M}  linhas={job.total_linhas or '-'}  {job.erro or ''}")
+
+    @app.cli.command("ciclo-validade")
+    @click.option('--historico', is_flag=True, help='Mostra as últimas execuções em vez de rodar a varredura.')
+    def ciclo_validade_command(historico):
+        """Avança o status dos produtos (Para Rebaixa -> Em Rebaixa -> Vencido -> Descartado)."""
+        from .models import ExecucaoCiclo
+        from .ciclo_validade import executar_ciclo
+
+        if historico:
+            for e in ExecucaoCiclo.query.order_by(ExecucaoCiclo.executado_em.desc()).limit(30):
+                print(f"{e.executado_em:%d/%m/%Y %H:%M}  rebaixados={e.rebaixados}  vencidos={e.vencidos}  descartados={e.descartados}  {e.duracao_ms} ms")
+            return
+        e = executar_ciclo(app)
+        print(f"{e.rebaixados} produto(s) rebaixado(s), {e.vencidos} vencido(s) e {e.descartados} descartado(s) em {e.duracao_ms} ms.")
+
+    @app.cli.command("arquivar")
+    @click.option('--dias', type=int, default=None, help='Retenção em dias (padrão: ARQUIVO_RETENCAO_DIAS).')
+    @click.option('--lote', type=int, default=5000, show_default=True, help='Produtos movidos por transação.')
+    @click.option('--verificar', is_flag=True, help='Só confere o arquivo, sem mover nada.')
+    def arquivar_command(dias, lote, verificar):
+        """Move vencidos e descartados antigos para o arquivo histórico (produto_arquivado)."""
+        from .arquivo import executar_arquivamento, verificar_arquivamento
+
+        dias = app.config['ARQUIVO_RETENCAO_DIAS'] if dias is None else dias
+        if not verificar:
+            r = executar_arquivamento(dias, lote)
+            print(f"{r['arquivados']} produto(s) arquivado(s) em {r['lotes']} lote(s), {r['segundos']:.1f}s.")
+        contagens, problemas = verificar_arquivamento(dias)
+        arquivados = ', '.join(f'{motivo}={total}' for motivo, total in sorted(contagens['arquivados'].items())) or 'nenhum'
+        print(f"Tabela principal: {contagens['ativos']} produto(s); arquivo: {arquivados}.")
+        if not problemas:
+            print(f"Arquivo consistente (retenção de {dias} dias).")
+            return
+        for problema in problemas:
+            print(f"  {problema}")
+
+    @app.cli.command("limpar-idempotencia")
+    @click.option('--dias', type=int, default=30, show_default=True)
+    def limpar_idempotencia_command(dias):
+        """Remove as chaves de idempotência dos cadastros offline mais antigas que N dias."""
+        from .catalogo_offline import limpar_chaves
+
+        print(f"{limpar_chaves(dias)} chave(s) removida(s).")
+
+    @app.cli.command("gerar-dados")
+    @click.option('--lojas', type=int, default=5, show_default=True)
+    @click.option('--produtos', type=int, default=100000, show_default=True)
+    @click.option('--catalogo', type=int, default=100000, show_default=True)
+    @click.option('--semente', type=int, default=42, show_default=True, help='Semente aleatória, para gerar sempre a mesma massa de dados.')
+    def gerar_dados_command(lojas, produtos, catalogo, semente):
+        """Povoa o banco com dados sintéticos (lojas, usuários de cada cargo, catálogo e produtos) para benchmarks."""
+        import time
+        from .benchmark import gerar_dados, SENHA, DOMINIO
+
+        inicio = time.monotonic()
+        gerar_dados(lojas, produtos, catalogo, semente)
+        print(f"{lojas} loja(s), {produtos} produto(s) e {catalogo} item(ns) de catálogo gerados em {time.monotonic() - inicio:.1f}s.")
+        print(f"Usuários: gerente_geral@{DOMINIO}, gerente.loja1@{DOMINIO}, ... (senha '{SENHA}').")
+
+    @app.cli.command("benchmark")
+    @click.option('--repeticoes', type=int, default=20, show_default=True)
+    @click.option('--cenario', default=None, help='Roda só os cenários cujo nome contém este trecho.')
+    @click.option('--saida', type=click.Path(dir_okay=False), default=None, help='Grava o resultado em JSON.')
+    @click.option('--comparar', type=click.Path(exists=True, dir_okay=False), default=None, help='JSON de uma execução anterior para comparar.')
+    def benchmark_command(repeticoes, cenario, saida, comparar):
+        """Mede p50/p95, comandos SQL por requisição e pico de memória das rotas principais (requer 'flask gerar-dados')."""
+        import json
+        from .benchmark import executar_benchmark, formatar_resultado, salvar_resultado
+
+        resultado = executar_benchmark(app, repeticoes, cenario)
+        anterior = None
+        if comparar:
+            with open(comparar, encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+        print(formatar_resultado(resultado, anterior))
+        if saida:
+            salvar_resultado(resultado, saida)
+            print(f"Resultado gravado em {saida}.")
+
+    @app.cli.command("benchmark-concorrencia")
+    @click.option('--segundos', type=int, default=10, show_default=True)
+    @click.option('--escritores', type=int, default=4, show_default=True)
+    def benchmark_concorrencia_command(segundos, escritores):
+        """Grava produtos em paralelo enquanto um relatório grande é lido (requer 'flask gerar-dados')."""
+        from .benchmark import estresse_concorrencia
+
+        r = estresse_concorrencia(app, segundos, escritores)
+        print(f"Leitor: {r['relatorios_lidos']} relatório(s), {r['linhas_lidas']} linha(s) lidas.")
+        print(f"Escritores: {r['escritas']} gravação(ões), {r['escritas_com_erro']} com erro; p50 {r['escrita_p50_ms']} ms, p95 {r['escrita_p95_ms']} ms.")
+
+    @app.cli.command("benchmark-login")
+    @click.option('--segundos', type=int, default=10, show_default=True)
+    @click.option('--clientes', type=int, default=16, show_default=True)
+    @click.option('--sem-limite', is_flag=True, help='Desliga o limite de tentativas para medir só o pool de hash.')
+    def benchmark_login_command(segundos, clientes, sem_limite):
+        """Mede logins simultâneos e a latência de um scanner ao mesmo tempo (requer 'flask gerar-dados')."""
+        from .benchmark import benchmark_login
+
+        r = benchmark_login(app, segundos, clientes, limitar=not sem_limite)
+        print(f"bcrypt custo {r['custo_bcrypt']}, {r['workers_hash']} thread(s) de hash, {r['clientes']} cliente(s), limite {'ligado' if r['limitado'] else 'desligado'}.")
+        print(f"Logins: {r['logins_ok_por_segundo']}/s; p50 {r['login_p50_ms']} ms, p95 {r['login_p95_ms']} ms; status {r['status_http']}.")
+        print(f"Scanner durante os logins: p50 {r['scanner_p50_ms']} ms, p95 {r['scanner_p95_ms']} ms.")
+
+    @app.cli.command("comprimir-estaticos")
+    def comprimir_estaticos_command():
+        """Gera as variantes .gz/.br dos arquivos estáticos (rode a cada deploy)."""
+        from .cache_http import comprimir_estaticos, brotli_disponivel
+
+        for arquivo, original, comprimido in comprimir_estaticos(app.static_folder):
+            print(f"{arquivo}: {original} -> {comprimido} bytes")
+        if not brotli_disponivel():
+            print("Pacote brotli não instalado: só as variantes .gz foram geradas (pip install brotli).")
+
+    @app.cli.command("tempo-inicializacao")
+    @click.option('--repeticoes', type=int, default=3, show_default=True)
+    @click.option('--orcamento-ms', type=float, default=None, help='Tempo máximo de importação (padrão: INICIALIZACAO_ORCAMENTO_MS).')
+    def tempo_inicializacao_command(repeticoes, orcamento_ms):
+        """Mede o tempo de importação do create_app() com python -X importtime; sai com erro acima do orçamento."""
+        from .benchmark import medir_inicializacao
+
+        orcamento_ms = orcamento_ms or app.config['INICIALIZACAO_ORCAMENTO_MS']
+        r = medir_inicializacao(os.path.dirname(app.root_path), repeticoes)
+        print(f"Importação do create_app(): {r['total_ms']} ms em {r['modulos']} módulo(s) (orçamento {orcamento_ms:.0f} ms).")
+        for pacote, ms in r['pacotes_ms'].items():
+            print(f"  {pacote:<24} {ms:>8.1f} ms")
+        problemas = []
+        if r['total_ms'] > orcamento_ms:
+            problemas.append(f"Acima do orçamento em {r['total_ms'] - orcamento_ms:.1f} ms.")
+        if r['sob_demanda_importados']:
+            problemas.append(f"Importados na inicialização, deveriam ser só no primeiro uso: {', '.join(r['sob_demanda_importados'])}.")
+        for problema in problemas:
+            print(problema)
+        if problemas:
+            raise SystemExit(1)
+
     return app
\ No newline at end of file
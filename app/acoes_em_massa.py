@@ -0,0 +1,87 @@
+from datetime import date, timedelta
+from sqlalchemy import true, false
+from .models import db, Produto
+from .ciclo_validade import STATUS_ATIVOS, STATUS_DESCARTADO, filtro_vencidos
+from .eventos import agendar_evento
+from .arquivo import arquivar_e_excluir, ajustar_resumo_das_linhas, registrar_versoes_das_linhas, MOTIVO_EXCLUSAO, MOTIVO_PURGA
+
+# --- AÇÕES EM MASSA SOBRE PRODUTOS ---
+# Alterar o status ou excluir vários produtos é um único UPDATE/DELETE com a
+# permissão do cargo no WHERE: ids de outra loja/setor simplesmente não são
+# afetados e entram na contagem de ignorados. O RETURNING devolve as linhas
+# alteradas, usadas para arquivar as excluídas (ver arquivo.py), ajustar o
+# resumo de validades, incrementar a versão dos dados e avisar os dashboards,
+# como os eventos do mapper fariam produto a produto.
+
+MAXIMO_IDS = 1000
+
+
+def escopo_do_usuario(usuario):
+    """Filtro SQL com os produtos que o cargo pode alterar ou excluir."""
+    produto = Produto.__table__
+    if usuario.role == 'gerente_geral':
+        return true()
+    if usuario.role == 'gerente':
+        return produto.c.loja_id == usuario.loja_id
+    if usuario.role == 'encarregado_setor':
+        return (produto.c.loja_id == usuario.loja_id) & (produto.c.setor_id == usuario.setor_id)
+    return false()
+
+
+def _dados_evento(linha):
+    return {'id': linha['id'], 'nome_produto': linha['nome_produto'], 'plu': linha['plu'], 'quantidade': linha['quantidade'],
+            'validade': linha['validade'].isoformat(), 'status': linha['status']}
+
+
+def alterar_status_em_massa(ids, novo_status, usuario):
+    """Move para `novo_status` os produtos ativos de `ids` dentro do escopo do usuário. Devolve quantos mudaram."""
+    if novo_status not in STATUS_ATIVOS:
+        raise ValueError(f'Status inválido: {novo_status}')
+    produto = Produto.__table__
+    conexao = db.session.connection()
+    # Só os ativos pela listagem: vencido pela validade (mesmo antes da varredura) não volta para a rebaixa
+    filtro = produto.c.id.in_(ids) & (produto.c.validade >= date.today()) & escopo_do_usuario(usuario)
+    alterados = []
+    # Um UPDATE por status de origem, para saber de qual linha do resumo cada produto sai
+    for origem in STATUS_ATIVOS:
+        if origem == novo_status:
+            continue
+        linhas = [dict(l._mapping) for l in conexao.execute(produto.update().where(filtro & (produto.c.status == origem)).values(status=novo_status).returning(*produto.c))]
+        ajustar_resumo_das_linhas(conexao, [dict(l, status=origem) for l in linhas], -1)
+        ajustar_resumo_das_linhas(conexao, linhas, 1)
+        alterados += linhas
+    registrar_versoes_das_linhas(conexao, alterados)
+    for l in alterados:
+        agendar_evento(db.session, 'status', l['loja_id'], l['setor_id'], _dados_evento(l))
+    db.session.commit()
+    return len(alterados)
+
+
+def _excluir(filtro, usuario_id, motivo, avisar=True):
+    linhas = arquivar_e_excluir(filtro, usuario_id, motivo)
+    if avisar:
+        for l in linhas:
+            agendar_evento(db.session, 'removido', l['loja_id'], l['setor_id'], {'id': l['id']})
+    db.session.commit()
+    return len(linhas)
+
+
+def excluir_em_massa(ids, usuario):
+    """Arquiva e exclui os produtos de `ids` dentro do escopo do usuário. Devolve quantos saíram."""
+    return _excluir(Produto.__table__.c.id.in_(ids) & escopo_do_usuario(usuario), usuario.id, MOTIVO_EXCLUSAO)
+
+
+def purgar_vencidos(usuario, dias, loja_id=None, hoje=None):
+    """Arquiva e exclui os vencidos/descartados com validade há mais de `dias` dias,
+    de uma loja ou (gerente geral, sem loja) de todas. Devolve quantos saíram.
+
+    Esses produtos não aparecem nas listagens com eventos em tempo real, então a
+    purga não publica um 'removido' por item. Vale o mesmo critério da listagem de
+    vencidos (filtro_vencidos): entram os ativos que venceram antes da varredura."""
+    produto = Produto.__table__
+    hoje = hoje or date.today()
+    limite = hoje - timedelta(days=dias)
+    filtro = (filtro_vencidos(hoje) | (produto.c.status == STATUS_DESCARTADO)) & (produto.c.validade < limite) & escopo_do_usuario(usuario)
+    if loja_id:
+        filtro = filtro & (produto.c.loja_id == loja_id)
+    return _excluir(filtro, usuario.id, MOTIVO_PURGA, avisar=False)
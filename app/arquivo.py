@@ -0,0 +1,95 @@
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, select
+from .models import db, Produto, ProdutoArquivado, registrar_alteracao_produto, ajustar_resumo_validade
+from .ciclo_validade import STATUS_VENCIDO, STATUS_DESCARTADO
+
+# --- ARQUIVO HISTÓRICO DE PRODUTOS ---
+# Produtos saem da tabela principal para produto_arquivado em três situações:
+# exclusão pelo usuário, purga de vencidos e retenção. Na retenção, os vencidos e
+# descartados com validade há mais de ARQUIVO_RETENCAO_DIAS dias são movidos em
+# lotes, cada lote na sua transação, para a tabela que os dashboards consultam
+# ficar com o conjunto de trabalho. Os relatórios PDF leem as duas tabelas
+# (relatorios.consultar_produtos_relatorio), então um período antigo continua
+# completo; excluídos e purgados ficam só para auditoria.
+
+MOTIVO_EXCLUSAO = 'exclusao'
+MOTIVO_PURGA = 'purga'
+MOTIVO_RETENCAO = 'retencao'
+STATUS_ARQUIVAVEIS = [STATUS_VENCIDO, STATUS_DESCARTADO]
+
+
+def ajustar_resumo_das_linhas(conexao, linhas, sinal):
+    resumo = defaultdict(lambda: [0, 0])
+    for l in linhas:
+        chave = resumo[(l['loja_id'], l['setor_id'], l['validade'], l['status'])]
+        chave[0] += sinal
+        chave[1] += sinal * l['quantidade']
+    for (loja_id, setor_id, validade, status), (itens, quantidade) in resumo.items():
+        ajustar_resumo_validade(conexao, loja_id, setor_id, validade, status, itens, quantidade)
+
+
+def registrar_versoes_das_linhas(conexao, linhas):
+    for loja_id, setor_id, dia in {(l['loja_id'], l['setor_id'], l['data_cadastro'].date()) for l in linhas}:
+        registrar_alteracao_produto(conexao, loja_id, setor_id, dia)
+
+
+def arquivar_e_excluir(filtro, usuario_id, motivo):
+    """DELETE ... RETURNING dos produtos do filtro, cópia para produto_arquivado e ajuste
+    do resumo e da versão dos dados, numa transação. Devolve as linhas removidas."""
+    produto = Produto.__table__
+    conexao = db.session.connection()
+    linhas = [dict(l._mapping) for l in conexao.execute(produto.delete().where(filtro).returning(*produto.c))]
+    if linhas:
+        agora = datetime.utcnow()
+        conexao.execute(ProdutoArquivado.__table__.insert(), [
+            dict({k: v for k, v in l.items() if k != 'id'}, produto_id=l['id'], arquivado_em=agora, arquivado_por_id=usuario_id, motivo_arquivamento=motivo)
+            for l in linhas])
+        ajustar_resumo_das_linhas(conexao, linhas, -1)
+        registrar_versoes_das_linhas(conexao, linhas)
+    return linhas
+
+
+def filtro_retencao(dias, hoje=None):
+    produto = Produto.__table__
+    limite = (hoje or date.today()) - timedelta(days=dias)
+    return produto.c.status.in_(STATUS_ARQUIVAVEIS) & (produto.c.validade < limite)
+
+
+def executar_arquivamento(dias, tamanho_lote=5000, hoje=None):
+    """Move os produtos fora da retenção em lotes de `tamanho_lote`, um commit por lote."""
+    produto = Produto.__table__
+    filtro = filtro_retencao(dias, hoje)
+    inicio, total, lotes = time.perf_counter(), 0, 0
+    while True:
+        ids = [i for (i,) in db.session.execute(select(produto.c.id).where(filtro).order_by(produto.c.id).limit(tamanho_lote))]
+        if not ids:
+            break
+        # O filtro se repete no DELETE: um produto alterado entre a leitura e o lote fica
+        total += len(arquivar_e_excluir(produto.c.id.in_(ids) & filtro, None, MOTIVO_RETENCAO))
+        db.session.commit()
+        lotes += 1
+    return {'arquivados': total, 'lotes': lotes, 'segundos': time.perf_counter() - inicio}
+
+
+def verificar_arquivamento(dias, hoje=None):
+    """Confere o arquivo. Devolve (contagens, problemas)."""
+    from .resumo import verificar_resumo
+    produto, arquivado = Produto.__table__, ProdutoArquivado.__table__
+    contagens = {
+        'ativos': db.session.execute(select(func.count()).select_from(produto)).scalar(),
+        'pendentes': db.session.execute(select(func.count()).select_from(produto).where(filtro_retencao(dias, hoje))).scalar(),
+        'arquivados': dict(db.session.execute(select(arquivado.c.motivo_arquivamento, func.count()).group_by(arquivado.c.motivo_arquivamento)).all()),
+    }
+    problemas = []
+    # O mesmo produto (id e data de cadastro) não pode estar nas duas tabelas
+    duplicados = db.session.execute(select(func.count()).select_from(produto.join(arquivado, (arquivado.c.produto_id == produto.c.id) & (arquivado.c.data_cadastro == produto.c.data_cadastro)))).scalar()
+    if duplicados:
+        problemas.append(f'{duplicados} produto(s) presentes na tabela principal e no arquivo.')
+    if contagens['pendentes']:
+        problemas.append(f"{contagens['pendentes']} produto(s) fora da retenção ainda na tabela principal; rode 'flask arquivar'.")
+    divergencias = verificar_resumo()
+    if divergencias:
+        problemas.append(f"{len(divergencias)} divergência(s) no resumo de validades; rode 'flask resumo-validade --reconstruir'.")
+    return contagens, problemas
@@ -0,0 +1,137 @@
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+from threading import Lock, BoundedSemaphore
+from . import bcrypt
+from .models import db, Usuario
+
+# --- AUTENTICAÇÃO: LIMITE DE TENTATIVAS E BCRYPT FORA DO WORKER ---
+# O bcrypt é lento de propósito (~250 ms com custo 12). Para uma troca de turno ou
+# uma rajada de tentativas não ocupar todos os workers, cada login passa por:
+#   1. baldes de fichas por IP e por usuário, em memória, que recusam o excesso
+#      (429) antes de qualquer hash;
+#   2. um pool limitado de threads para o bcrypt (a biblioteca libera o GIL), com
+#      no máximo LOGIN_HASH_FILA verificações pendentes; acima disso, 503;
+#   3. rehash transparente quando o custo do hash gravado difere de
+#      BCRYPT_LOG_ROUNDS.
+# Usuário inexistente também custa um hash, para o tempo de resposta não revelar
+# quais e-mails existem. Os limites são por processo; atrás de proxy, configure o
+# ProxyFix para o request.remote_addr ser o IP do cliente.
+
+
+class TentativasExcedidas(Exception):
+    def __init__(self, espera):
+        super().__init__(f'Tente novamente em {espera} s')
+        self.espera = espera
+
+
+class ServidorOcupado(Exception):
+    pass
+
+
+class LimitadorTokens:
+    """Balde de fichas por chave: `capacidade` tentativas seguidas, repostas a `por_minuto`."""
+
+    def __init__(self, capacidade, por_minuto, maximo_chaves=100000):
+        self.capacidade, self.por_segundo = capacidade, por_minuto / 60
+        self.maximo_chaves = maximo_chaves
+        self.ativo = True
+        self._baldes = OrderedDict()
+        self._lock = Lock()
+
+    def consumir(self, chave):
+        """Gasta uma ficha. Devolve 0 se a tentativa pode seguir, senão os segundos até a próxima ficha."""
+        if not self.ativo:
+            return 0
+        agora = time.monotonic()
+        with self._lock:
+            fichas, ultimo = self._baldes.pop(chave, (self.capacidade, agora))
+            fichas = min(self.capacidade, fichas + (agora - ultimo) * self.por_segundo)
+            espera = 0 if fichas >= 1 else int((1 - fichas) / self.por_segundo) + 1
+            self._baldes[chave] = (fichas - 1 if not espera else fichas, agora)
+            while len(self._baldes) > self.maximo_chaves:
+                self._baldes.popitem(last=False)
+        return espera
+
+    def liberar(self, chave):
+        with self._lock:
+            self._baldes.pop(chave, None)
+
+
+limite_ip = LimitadorTokens(capacidade=30, por_minuto=60)
+limite_usuario = LimitadorTokens(capacidade=5, por_minuto=6)
+_pool = {'executor': None, 'vagas': None, 'timeout': 10, 'custo': 12, 'hash_ficticio': None}
+
+
+def configurar_autenticacao(app):
+    (limite_ip.capacidade, por_minuto_ip), (limite_usuario.capacidade, por_minuto_usuario) = app.config['LOGIN_LIMITE_IP'], app.config['LOGIN_LIMITE_USUARIO']
+    limite_ip.por_segundo, limite_usuario.por_segundo = por_minuto_ip / 60, por_minuto_usuario / 60
+    if _pool['executor'] is None:
+        _pool['executor'] = ThreadPoolExecutor(max_workers=app.config['LOGIN_HASH_WORKERS'], thread_name_prefix='bcrypt')
+        _pool['vagas'] = BoundedSemaphore(app.config['LOGIN_HASH_FILA'])
+    _pool.update(timeout=app.config['LOGIN_HASH_TIMEOUT'], custo=app.config['BCRYPT_LOG_ROUNDS'])
+
+
+def custo_do_hash(password_hash):
+    # Formato $2b$<custo>$<salt+hash>
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _no_pool(funcao, *args):
+    vagas = _pool['vagas']
+    if not vagas.acquire(blocking=False):
+        raise ServidorOcupado()
+    try:
+        futuro = _pool['executor'].submit(funcao, *args)
+    except Exception:
+        vagas.release()
+        raise
+    # A vaga volta quando o hash termina, mesmo que a requisição desista antes
+    futuro.add_done_callback(lambda _: vagas.release())
+    try:
+        return futuro.result(timeout=_pool['timeout'])
+    except TempoEsgotado:
+        raise ServidorOcupado()
+
+
+def _conferir(password_hash, senha):
+    try:
+        return bcrypt.check_password_hash(password_hash, senha)
+    except ValueError:
+        # Hash corrompido ou senha acima de 72 bytes (bcrypt >= 5 recusa)
+        return False
+
+
+def _gerar_hash(senha):
+    return bcrypt.generate_password_hash(senha, _pool['custo']).decode('utf-8')
+
+
+def _hash_ficticio():
+    if _pool['hash_ficticio'] is None or custo_do_hash(_pool['hash_ficticio']) != _pool['custo']:
+        _pool['hash_ficticio'] = _no_pool(_gerar_hash, os.urandom(16).hex())
+    return _pool['hash_ficticio']
+
+
+def autenticar(username, senha, ip):
+    """Devolve o Usuario se a senha confere, senão None.
+
+    Levanta TentativasExcedidas (com a espera em segundos) ou ServidorOcupado."""
+    username, senha = username or '', senha or ''
+    espera = limite_ip.consumir(ip) or limite_usuario.consumir(username.lower())
+    if espera:
+        raise TentativasExcedidas(espera)
+    usuario = Usuario.query.filter_by(username=username).first()
+    if not _no_pool(_conferir, usuario.password_hash if usuario else _hash_ficticio(), senha) or usuario is None:
+        return None
+    limite_usuario.liberar(username.lower())
+    if custo_do_hash(usuario.password_hash) != _pool['custo']:
+        try:
+            usuario.password_hash = _no_pool(_gerar_hash, senha)
+            db.session.commit()
+        except ServidorOcupado:
+            pass  # o login vale; o rehash fica para o próximo
+    return usuario
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from .models import Usuario, db
+from .autenticacao import autenticar, TentativasExcedidas, ServidorOcupado
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -13,9 +14,17 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        user = Usuario.query.filter_by(username=username).first()
+        # Limite de tentativas e bcrypt no pool (ver autenticacao.py)
+        try:
+            user = autenticar(username, password, request.remote_addr)
+        except TentativasExcedidas as e:
+            flash(f'Muitas tentativas de login. Tente novamente em {e.espera} segundo(s).', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(e.espera)}
+        except ServidorOcupado:
+            flash('Muitos acessos ao mesmo tempo. Tente novamente em instantes.', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': '2'}
 
-        if user and user.check_password(password):
+        if user:
             login_user(user)
             flash('Login realizado com sucesso!', 'success')
             # Redireciona para a rota principal após o login
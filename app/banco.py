@@ -0,0 +1,87 @@
+import os
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from . import db
+
+# --- CONFIGURAÇÃO DO BANCO E CONEXÕES ---
+# A URI vem de DATABASE_URL (padrão: SQLite em instance/database.db). No SQLite
+# cada conexão recebe os PRAGMAs abaixo: com WAL os leitores não bloqueiam quem
+# grava, e o busy_timeout faz as escritas concorrentes esperarem a vez em vez de
+# falharem com "database is locked". Relatórios, exportações e o painel do Gerente
+# Geral leem pelo bind 'leitura' (somente leitura, ou uma réplica via
+# DATABASE_URL_LEITURA), fora da sessão usada pelas requisições que gravam.
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,  # negativo = KiB, ou seja 64 MB por conexão
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+
+def _url_somente_leitura(url):
+    """Mesmo arquivo SQLite aberto com mode=ro; outros bancos (e o SQLite em memória) usam a própria URL."""
+    partes = make_url(url)
+    if partes.get_backend_name() != 'sqlite' or not partes.database or partes.database == ':memory:' or partes.query.get('uri'):
+        return url
+    return f'sqlite:///file:{partes.database}?mode=ro&uri=true'
+
+
+def configurar_banco(app):
+    """Define URI, pool e bind de leitura. Deve ser chamado antes do db.init_app."""
+    url = os.environ.get('DATABASE_URL') or f'sqlite:///{os.path.join(app.instance_path, "database.db")}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    opcoes = {
+        'pool_size': int(os.environ.get('BANCO_POOL_TAMANHO', 10)),
+        'max_overflow': int(os.environ.get('BANCO_POOL_EXTRA', 10)),
+        'pool_timeout': int(os.environ.get('BANCO_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('BANCO_POOL_RECICLAR', 1800)),
+        'pool_pre_ping': make_url(url).get_backend_name() != 'sqlite',
+    }
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', opcoes)
+    app.config['BANCO_PRAGMAS'] = dict(PRAGMAS, busy_timeout=int(os.environ.get('BANCO_BUSY_TIMEOUT_MS', PRAGMAS['busy_timeout'])))
+    leitura = os.environ.get('DATABASE_URL_LEITURA') or _url_somente_leitura(url)
+    if leitura != url:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})['leitura'] = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], url=leitura)
+
+
+def _aplicar_pragmas(pragmas, somente_leitura):
+    def ao_conectar(conexao_dbapi, registro):
+        cursor = conexao_dbapi.cursor()
+        for nome, valor in pragmas.items():
+            # journal_mode grava no arquivo; a conexão somente leitura herda o modo da principal
+            if somente_leitura and nome == 'journal_mode':
+                continue
+            cursor.execute(f'PRAGMA {nome}={valor}')
+        if somente_leitura:
+            cursor.execute('PRAGMA query_only=1')
+        cursor.close()
+    return ao_conectar
+
+
+def init_banco(app):
+    """Registra os PRAGMAs nas engines SQLite. Chamado depois do db.init_app."""
+    with app.app_context():
+        for chave, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _aplicar_pragmas(app.config['BANCO_PRAGMAS'], chave == 'leitura'))
+
+
+@contextmanager
+def sessao_leitura():
+    """Sessão ligada ao bind de leitura, para consultas longas que não devem segurar a sessão principal."""
+    sessao = Session(bind=db.engines.get('leitura', db.engine))
+    try:
+        yield sessao
+    finally:
+        sessao.close()
+
+
+def linhas_leitura(consulta, *args, **kwargs):
+    """Itera `consulta(*args, sessao=...)` numa sessão de leitura que vive enquanto o gerador é consumido (respostas em streaming)."""
+    with sessao_leitura() as sessao:
+        yield from consulta(*args, sessao=sessao, **kwargs)
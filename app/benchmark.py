@@ -0,0 +1,388 @@
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func
+from .models import db, bcrypt, Loja, Setor, Usuario, Produto, ProdutoCatalogo, proxima_versao, marcar_versao
+from .cache_http import contador_produtos
+
+# --- DADOS SINTÉTICOS E BENCHMARK DAS ROTAS ---
+# `flask gerar-dados` povoa o banco com lojas, usuários de todos os cargos, catálogo
+# e produtos com distribuição de validades parecida com a de uma loja real.
+# `flask benchmark` percorre as rotas principais pelo test client do Flask e mede
+# latência (p50/p95), comandos SQL por requisição e pico de memória.
+# Rode sempre contra uma cópia do banco, nunca o de produção: os cenários de
+# cadastro gravam produtos. Os de relatório removem só os jobs que eles criaram.
+
+DOMINIO = 'benchmark.local'
+SENHA = 'benchmark'
+SETORES_PADRAO = ['Padaria', 'Açougue', 'Frios', 'Mercearia']
+PALAVRAS = ['Leite', 'Queijo', 'Presunto', 'Pão', 'Bolo', 'Iogurte', 'Carne', 'Frango', 'Linguiça', 'Manteiga', 'Requeijão', 'Mortadela', 'Café', 'Açúcar', 'Arroz', 'Feijão', 'Biscoito', 'Suco']
+MARCAS = ['Sadia', 'Perdigão', 'Nestlé', 'Italac', 'Seara', 'Aurora', 'Piracanjuba', 'Vigor', 'Tirolez', 'União']
+TAMANHO_LOTE = 10000
+
+
+def _validade(hoje, sorteio):
+    # 15% vencidos, 25% vencendo na semana, 60% com prazo maior
+    if sorteio < 0.15: return hoje - timedelta(days=random.randint(1, 60))
+    if sorteio < 0.40: return hoje + timedelta(days=random.randint(0, 7))
+    return hoje + timedelta(days=random.randint(8, 180))
+
+
+def _inserir_em_lotes(tabela, gerador, total):
+    lote = []
+    for linha in gerador:
+        lote.append(linha)
+        if len(lote) >= TAMANHO_LOTE:
+            db.session.execute(tabela.insert(), lote)
+            db.session.commit()
+            lote = []
+    if lote:
+        db.session.execute(tabela.insert(), lote)
+        db.session.commit()
+    return total
+
+
+def gerar_dados(lojas=5, produtos=100000, catalogo=100000, semente=42):
+    random.seed(semente)
+    hoje = date.today()
+    for nome in SETORES_PADRAO:
+        if not Setor.query.filter_by(nome=nome).first():
+            db.session.add(Setor(nome=nome))
+    db.session.commit()
+    setores = Setor.query.filter(Setor.nome.in_(SETORES_PADRAO)).all()
+
+    # Um único hash de senha para todos os usuários sintéticos (bcrypt é lento de propósito)
+    hash_senha = bcrypt.generate_password_hash(SENHA).decode('utf-8')
+    def usuario(username, role, loja_id=None, setor_id=None):
+        if not Usuario.query.filter_by(username=username).first():
+            db.session.add(Usuario(username=username, password_hash=hash_senha, role=role, loja_id=loja_id, setor_id=setor_id))
+
+    usuario(f'gerente_geral@{DOMINIO}', 'gerente_geral')
+    usuario(f'gerente_trocas@{DOMINIO}', 'gerente_trocas')
+    ids_lojas = []
+    for n in range(1, lojas + 1):
+        loja = Loja.query.filter_by(nome=f'Loja Benchmark {n}').first()
+        if not loja:
+            loja = Loja(nome=f'Loja Benchmark {n}', cidade='Cidade', estado='UF')
+            db.session.add(loja)
+            db.session.flush()
+        ids_lojas.append(loja.id)
+        usuario(f'gerente.loja{n}@{DOMINIO}', 'gerente', loja.id)
+        usuario(f'auxiliar.loja{n}@{DOMINIO}', 'auxiliar_gestao', loja.id)
+        for setor in setores:
+            usuario(f'encarregado.loja{n}.setor{setor.id}@{DOMINIO}', 'encarregado_setor', loja.id, setor.id)
+    db.session.commit()
+    criadores = {(u.loja_id, u.setor_id): u.id for u in Usuario.query.filter(Usuario.role == 'encarregado_setor', Usuario.username.like(f'%@{DOMINIO}')).all()}
+
+    inicio_barcode = (db.session.query(func.count(ProdutoCatalogo.id)).scalar() or 0) + 7890000000000
+    nomes = [f'{random.choice(PALAVRAS)} {random.choice(MARCAS)} {random.randint(1, 999)}g' for _ in range(5000)]
+    versao_catalogo = proxima_versao(db.session.connection(), 'catalogo')
+    _inserir_em_lotes(ProdutoCatalogo.__table__, ({'barcode': str(inicio_barcode + i), 'nome_produto': random.choice(nomes), 'plu': str(10000 + i), 'versao': versao_catalogo} for i in range(catalogo)), catalogo)
+
+    agora = datetime.utcnow()
+    def produtos_sinteticos():
+        for i in range(produtos):
+            loja_id, setor = random.choice(ids_lojas), random.choice(setores)
+            yield {'nome_produto': random.choice(nomes), 'plu': str(10000 + random.randint(0, max(catalogo - 1, 0))), 'quantidade': random.randint(1, 50),
+                   'validade': _validade(hoje, random.random()), 'status': 'Em Rebaixa' if random.random() < 0.3 else 'Para Rebaixa',
+                   'data_cadastro': agora - timedelta(minutes=random.randint(0, 90 * 24 * 60)), 'motivo_rebaixa': None,
+                   'loja_id': loja_id, 'setor_id': setor.id, 'criado_por_id': criadores[(loja_id, setor.id)]}
+    _inserir_em_lotes(Produto.__table__, produtos_sinteticos(), produtos)
+    for loja_id in ids_lojas:
+        marcar_versao(db.session.connection(), contador_produtos(loja_id))
+    db.session.commit()
+
+    # O INSERT em massa não passa pelos eventos do mapper: recalcula o resumo de validades e o de perdas
+    # e deixa a varredura marcar os vencidos/descartados como em produção
+    from .resumo import reconstruir_resumo
+    from .ciclo_validade import executar_ciclo
+    from .perdas import reconstruir_perdas_diarias
+    reconstruir_resumo()
+    reconstruir_perdas_diarias()
+    executar_ciclo(current_app)
+    return {'lojas': lojas, 'produtos': produtos, 'catalogo': catalogo}
+
+
+# --- BENCHMARK ---
+
+def _cenarios(app):
+    hoje = date.today()
+    inicio, fim = (hoje - timedelta(days=30)).isoformat(), hoje.isoformat()
+    loja = Loja.query.filter(Loja.nome.like('Loja Benchmark %')).order_by(Loja.id).first()
+    setor = Setor.query.filter_by(nome=SETORES_PADRAO[0]).first()
+    encarregado = f'encarregado.loja{loja.nome.rsplit(" ", 1)[1]}.setor{setor.id}@{DOMINIO}'
+    gerente = f'gerente.loja{loja.nome.rsplit(" ", 1)[1]}@{DOMINIO}'
+    auxiliar = f'auxiliar.loja{loja.nome.rsplit(" ", 1)[1]}@{DOMINIO}'
+    geral = f'gerente_geral@{DOMINIO}'
+    barcodes = [b for (b,) in db.session.query(ProdutoCatalogo.barcode).limit(200)]
+    lote = [{'barcode': b, 'quantidade': 1, 'validade': (hoje + timedelta(days=10)).isoformat(), 'setor_id': setor.id} for b in barcodes[:100]]
+    return [
+        ('dashboard_gerente', gerente, 'GET', '/gerente/dashboard', {}),
+        ('listar_produtos_encarregado', encarregado, 'GET', '/encarregado/produtos', {}),
+        ('vencidos_encarregado', encarregado, 'GET', '/encarregado/vencidos', {}),
+        ('vencidos_loja', gerente, 'GET', '/produtos/vencidos', {}),
+        ('vencidos_rede', geral, 'GET', '/produtos/vencidos', {}),
+        ('dashboard_gerente_geral', geral, 'GET', '/gerente-geral/dashboard', {}),
+        ('perdas_por_loja_ano', geral, 'GET', f'/api/perdas?por=loja&data_inicio={(hoje - timedelta(days=365)).isoformat()}&data_fim={fim}', {}),
+        ('top_perdas_ano', geral, 'GET', f'/api/perdas/top?n=20&data_inicio={(hoje - timedelta(days=365)).isoformat()}&data_fim={fim}', {}),
+        ('relatorio_setor_pdf', encarregado, 'PDF', f'/encarregado/relatorio/pdf?data_inicio={inicio}&data_fim={fim}', {}),
+        ('relatorio_loja_pdf', gerente, 'PDF', f'/gerente/relatorio/pdf?data_inicio={inicio}&data_fim={fim}', {}),
+        ('relatorio_geral_pdf', geral, 'PDF', f'/relatorio/pdf?data_inicio={inicio}&data_fim={fim}&loja_id=todas&setor_id=todos', {}),
+        ('buscar_produto', auxiliar, 'BARCODE', '/api/buscar-produto/{barcode}', {'barcodes': barcodes}),
+        ('cadastrar_produto', auxiliar, 'POST', '/produtos', {'data': {'nome_produto': 'Produto Benchmark', 'plu': '1', 'barcode': barcodes[0] if barcodes else '', 'quantidade': '3', 'validade': (hoje + timedelta(days=5)).isoformat(), 'setor_id': str(setor.id)}}),
+        ('cadastrar_lote_100', auxiliar, 'POST_JSON', '/api/produtos/lote', {'json': {'itens': lote}}),
+    ]
+
+
+def _executar(app, cliente, metodo, url, extras, iteracao):
+    if metodo == 'GET':
+        return cliente.get(url)
+    if metodo == 'POST':
+        return cliente.post(url, data=extras['data'])
+    if metodo == 'POST_JSON':
+        return cliente.post(url, json=extras['json'])
+    if metodo == 'BARCODE':
+        return cliente.get(url.format(barcode=extras['barcodes'][iteracao % len(extras['barcodes'])]))
+    # PDF: espera o job terminar e depois remove o job criado aqui, para a próxima
+    # repetição medir a renderização completa. Jobs que já existiam ficam intactos.
+    from .jobs import limpar_jobs
+    from .models import RelatorioJob
+    with app.app_context():
+        existentes = {i for (i,) in db.session.query(RelatorioJob.id)}
+    resposta = cliente.get(url, headers={'Accept': 'application/json'})
+    job_id = resposta.get_json()['id']
+    while True:
+        estado = cliente.get(f'/relatorios/jobs/{job_id}').get_json()
+        if estado['status'] in ('concluido', 'erro'):
+            break
+        time.sleep(0.01)
+    download = cliente.get(f'/relatorios/jobs/{job_id}/download')
+    _ = download.data
+    if job_id not in existentes:
+        with app.app_context():
+            limpar_jobs(app, ids=[job_id])
+    return download
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def executar_benchmark(app, repeticoes=20, filtro=None):
+    # O comando do CLI roda dentro de um app context, que o test client reaproveitaria
+    # (e com ele o current_user e a sessão do banco); por isso o benchmark usa outra thread.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_rodar_benchmark, app, repeticoes, filtro).result()
+
+
+def _rodar_benchmark(app, repeticoes, filtro):
+    contador = {'sql': 0}
+    def contar_sql(*args):
+        contador['sql'] += 1
+    with app.app_context():
+        engine = db.engine
+        cenarios = _cenarios(app)
+    event.listen(engine, 'before_cursor_execute', contar_sql)
+    # Não deixa o benchmark sair para a internet em códigos desconhecidos
+    from .open_food_facts import cliente_off
+    url_original, cliente_off.url = cliente_off.url, 'http://127.0.0.1:9/{barcode}'
+    clientes, resultados = {}, {}
+    try:
+        for nome, usuario, metodo, url, extras in cenarios:
+            if filtro and filtro not in nome:
+                continue
+            if usuario not in clientes:
+                clientes[usuario] = app.test_client()
+                clientes[usuario].post('/login', data={'username': usuario, 'password': SENHA})
+            cliente = clientes[usuario]
+            _executar(app, cliente, metodo, url, extras, 0)  # aquecimento
+            tempos, consultas, status = [], [], set()
+            for i in range(repeticoes):
+                contador['sql'] = 0
+                inicio = time.perf_counter()
+                resposta = _executar(app, cliente, metodo, url, extras, i + 1)
+                _ = resposta.data
+                tempos.append((time.perf_counter() - inicio) * 1000)
+                consultas.append(contador['sql'])
+                status.add(resposta.status_code)
+            # Memória medida numa passada separada, porque o tracemalloc deixa tudo mais lento
+            tracemalloc.start()
+            _ = _executar(app, cliente, metodo, url, extras, repeticoes + 1).data
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            resultados[nome] = {'repeticoes': repeticoes, 'p50_ms': round(_percentil(tempos, 50), 2), 'p95_ms': round(_percentil(tempos, 95), 2),
+                                'media_ms': round(statistics.mean(tempos), 2), 'consultas_por_requisicao': round(statistics.mean(consultas), 1),
+                                'pico_memoria_kb': round(pico / 1024, 1), 'status_http': sorted(status)}
+    finally:
+        cliente_off.url = url_original
+        event.remove(engine, 'before_cursor_execute', contar_sql)
+    with app.app_context():
+        return {'gerado_em': datetime.utcnow().isoformat(), 'python': platform.python_version(),
+                'produtos': db.session.query(func.count(Produto.id)).scalar(), 'catalogo': db.session.query(func.count(ProdutoCatalogo.id)).scalar(),
+                'cenarios': resultados}
+
+
+# --- ESTRESSE DE CONCORRÊNCIA ---
+# Um leitor percorre o relatório de toda a rede repetidamente pela conexão somente
+# leitura enquanto `escritores` threads cadastram produtos. Com WAL e busy_timeout
+# as gravações devem seguir sem erros de "database is locked".
+
+def estresse_concorrencia(app, segundos=10, escritores=4):
+    from sqlalchemy.exc import OperationalError
+    from .banco import sessao_leitura
+    from .relatorios import consultar_produtos_relatorio
+    fim = time.monotonic() + segundos
+    with app.app_context():
+        autor = Usuario.query.filter(Usuario.role == 'encarregado_setor', Usuario.username.like(f'%@{DOMINIO}')).first()
+        autor_id, loja_id, setor_id = autor.id, autor.loja_id, autor.setor_id
+    leitura = {'relatorios': 0, 'linhas': 0}
+
+    def ler():
+        with app.app_context():
+            while time.monotonic() < fim:
+                with sessao_leitura() as sessao:
+                    for _ in consultar_produtos_relatorio(datetime(2000, 1, 1), datetime(2100, 1, 1), sessao=sessao):
+                        leitura['linhas'] += 1
+                leitura['relatorios'] += 1
+
+    def escrever():
+        tempos, erros = [], 0
+        with app.app_context():
+            while time.monotonic() < fim:
+                inicio = time.perf_counter()
+                try:
+                    db.session.add(Produto(nome_produto='Estresse', plu='0', quantidade=1, validade=date.today() + timedelta(days=5), loja_id=loja_id, setor_id=setor_id, criado_por_id=autor_id))
+                    db.session.commit()
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                except OperationalError:
+                    db.session.rollback()
+                    erros += 1
+            db.session.remove()
+        return tempos, erros
+
+    with ThreadPoolExecutor(max_workers=escritores + 1) as executor:
+        leitor = executor.submit(ler)
+        futuros = [executor.submit(escrever) for _ in range(escritores)]
+        resultados = [f.result() for f in futuros]
+        leitor.result()
+    tempos = [t for lista, _ in resultados for t in lista]
+    return {'segundos': segundos, 'escritores': escritores, 'relatorios_lidos': leitura['relatorios'], 'linhas_lidas': leitura['linhas'],
+            'escritas': len(tempos), 'escritas_com_erro': sum(e for _, e in resultados),
+            'escrita_p50_ms': round(_percentil(tempos, 50), 2) if tempos else None, 'escrita_p95_ms': round(_percentil(tempos, 95), 2) if tempos else None}
+
+
+def benchmark_login(app, segundos=10, clientes=16, limitar=True):
+    """Logins simultâneos de `clientes` aparelhos (IPs distintos) enquanto um scanner
+    consulta códigos de barras; mede logins/s, latência do login e do scanner."""
+    from .autenticacao import limite_ip, limite_usuario
+    with app.app_context():
+        usernames = [u for (u,) in db.session.query(Usuario.username).filter(Usuario.username.like(f'%@{DOMINIO}')).order_by(Usuario.id)]
+        barcodes = [b for (b,) in db.session.query(ProdutoCatalogo.barcode).limit(200)]
+        scanner_usuario = next(u for u in usernames if u.startswith('auxiliar.'))
+    estado_limites = (limite_ip.ativo, limite_usuario.ativo)
+    limite_ip.ativo = limite_usuario.ativo = limitar
+    scanner = app.test_client()
+    scanner.post('/login', data={'username': scanner_usuario, 'password': SENHA})
+    fim = time.monotonic() + segundos
+
+    def logar(n):
+        tempos, status = [], {}
+        cliente = app.test_client()
+        cliente.environ_base['REMOTE_ADDR'] = f'10.0.{n // 256}.{n % 256}'
+        i = n
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            resposta = cliente.post('/login', data={'username': usernames[i % len(usernames)], 'password': SENHA})
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            status[resposta.status_code] = status.get(resposta.status_code, 0) + 1
+            cliente.get('/logout')
+            i += clientes
+        return tempos, status
+
+    def escanear():
+        tempos, i = [], 0
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            scanner.get(f'/api/buscar-produto/{barcodes[i % len(barcodes)]}')
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            i += 1
+            time.sleep(0.05)
+        return tempos
+
+    try:
+        with ThreadPoolExecutor(max_workers=clientes + 1) as executor:
+            futuro_scanner = executor.submit(escanear)
+            resultados = [f.result() for f in [executor.submit(logar, n) for n in range(clientes)]]
+            tempos_scanner = futuro_scanner.result()
+    finally:
+        limite_ip.ativo, limite_usuario.ativo = estado_limites
+    tempos = [t for lista, _ in resultados for t in lista]
+    status = {}
+    for _, parcial in resultados:
+        for codigo, total in parcial.items():
+            status[codigo] = status.get(codigo, 0) + total
+    return {'segundos': segundos, 'clientes': clientes, 'limitado': limitar, 'custo_bcrypt': app.config['BCRYPT_LOG_ROUNDS'],
+            'workers_hash': app.config['LOGIN_HASH_WORKERS'], 'logins_ok_por_segundo': round(status.get(302, 0) / segundos, 1), 'status_http': status,
+            'login_p50_ms': round(_percentil(tempos, 50), 1) if tempos else None, 'login_p95_ms': round(_percentil(tempos, 95), 1) if tempos else None,
+            'scanner_p50_ms': round(_percentil(tempos_scanner, 50), 1) if tempos_scanner else None, 'scanner_p95_ms': round(_percentil(tempos_scanner, 95), 1) if tempos_scanner else None}
+
+
+# --- TEMPO DE INICIALIZAÇÃO ---
+# Roda `from app import create_app; create_app()` em processos novos com
+# `python -X importtime` e soma o tempo próprio de cada módulo importado. O mesmo
+# custo é pago a cada worker iniciado e a cada comando da CLI. ReportLab, requests
+# e openpyxl só devem ser importados no primeiro uso (PDF, busca externa, XLSX).
+
+MODULOS_SOB_DEMANDA = ('reportlab', 'requests', 'openpyxl')
+
+
+def _importtime(raiz):
+    processo = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from app import create_app; create_app()'],
+                              cwd=raiz, env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [raiz, os.environ.get('PYTHONPATH')]))),
+                              capture_output=True, text=True, check=True)
+    # Linhas "import time: <próprio us> | <acumulado us> | <módulo>", o módulo indentado pela profundidade
+    modulos = {}
+    for linha in processo.stderr.splitlines():
+        partes = linha.split('|')
+        if linha.startswith('import time:') and len(partes) == 3 and partes[0].split(':')[1].strip().isdigit():
+            modulos[partes[2].strip()] = int(partes[0].split(':')[1])
+    return modulos
+
+
+def medir_inicializacao(raiz, repeticoes=3):
+    """Devolve o tempo de importação do create_app() (mediana das repetições), os
+    pacotes mais caros e os módulos sob demanda que foram importados mesmo assim."""
+    execucoes = sorted((_importtime(raiz) for _ in range(repeticoes)), key=lambda m: sum(m.values()))
+    mediana = execucoes[len(execucoes) // 2]
+    pacotes = {}
+    for modulo, proprio in mediana.items():
+        pacotes[modulo.split('.')[0]] = pacotes.get(modulo.split('.')[0], 0) + proprio
+    return {'total_ms': round(sum(mediana.values()) / 1000, 1), 'modulos': len(mediana),
+            'pacotes_ms': {p: round(t / 1000, 1) for p, t in sorted(pacotes.items(), key=lambda i: -i[1])[:10]},
+            'sob_demanda_importados': sorted({m.split('.')[0] for m in mediana if m.split('.')[0] in MODULOS_SOB_DEMANDA})}
+
+
+def formatar_resultado(resultado, anterior=None):
+    linhas = [f"{'cenário':<30} {'p50 ms':>9} {'p95 ms':>9} {'SQL/req':>8} {'pico KB':>9}"]
+    for nome, r in resultado['cenarios'].items():
+        linha = f"{nome:<30} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['consultas_por_requisicao']:>8.1f} {r['pico_memoria_kb']:>9.1f}"
+        antes = (anterior or {}).get('cenarios', {}).get(nome)
+        if antes and antes['p50_ms']:
+            linha += f"   p50 {(r['p50_ms'] / antes['p50_ms'] - 1) * 100:+.0f}% vs anterior"
+        linhas.append(linha)
+    return '\n'.join(linhas)
+
+
+def salvar_resultado(resultado, caminho):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
@@ -0,0 +1,188 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from sqlalchemy.exc import IntegrityError
+from .models import db, ProdutoCatalogo, proxima_versao
+from .open_food_facts import cliente_off, ErroConsultaExterna, CircuitoAberto
+from .metricas import medir
+
+# --- CACHE DA BUSCA POR CÓDIGO DE BARRAS ---
+# Camadas consultadas em ordem: cache em memória (LRU + TTL), cache negativo de
+# códigos desconhecidos, catálogo interno no banco e, por último, o Open Food Facts.
+# Resultados externos são gravados no ProdutoCatalogo para as próximas buscas.
+
+
+class CacheLRU:
+    def __init__(self, tamanho_maximo, ttl):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._itens = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._itens[chave]
+                self.misses += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+
+    def remover(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            return {'itens': len(self._itens), 'hits': self.hits, 'misses': self.misses}
+
+
+cache_produtos = CacheLRU(tamanho_maximo=5000, ttl=600)
+cache_negativo = CacheLRU(tamanho_maximo=5000, ttl=3600)
+contadores = {'catalogo': 0, 'externo_encontrado': 0, 'externo_nao_encontrado': 0, 'externo_erro': 0, 'circuito_aberto': 0}
+_contadores_lock = Lock()
+# Consultas externas em paralelo do cadastro em lote (uma por conexão do pool do cliente)
+_executor_lote = ThreadPoolExecutor(max_workers=10, thread_name_prefix='busca-lote')
+NAO_ENCONTRADO = {"encontrado": False, "mensagem": "Produto não encontrado."}
+
+
+def _contar(origem):
+    with _contadores_lock:
+        contadores[origem] += 1
+
+
+def configurar_cache(app):
+    cache_produtos.tamanho_maximo = app.config['BUSCA_CACHE_TAMANHO']
+    cache_produtos.ttl = app.config['BUSCA_CACHE_TTL']
+    cache_negativo.tamanho_maximo = app.config['BUSCA_CACHE_TAMANHO']
+    cache_negativo.ttl = app.config['BUSCA_CACHE_NEGATIVO_TTL']
+    cliente_off.configurar(app)
+
+
+def invalidar_barcode(barcode):
+    """Chamado quando o catálogo interno muda para o código informado."""
+    cache_produtos.remover(barcode)
+    cache_negativo.remover(barcode)
+
+
+def _resultado_catalogo(item, barcode):
+    return {"nome": item.nome_produto, "plu": item.plu or barcode, "encontrado": True, "fonte": "Catálogo Interno"}
+
+
+def buscar_produto(barcode):
+    resultado = cache_produtos.get(barcode)
+    if resultado:
+        return resultado
+    resultado = cache_negativo.get(barcode)
+    if resultado:
+        return resultado
+
+    item = ProdutoCatalogo.query.filter_by(barcode=barcode).first()
+    if item:
+        _contar('catalogo')
+        resultado = _resultado_catalogo(item, barcode)
+        cache_produtos.set(barcode, resultado)
+        return resultado
+
+    try:
+        with medir('busca_externa'):
+            nome = cliente_off.buscar_nome(barcode)
+    except CircuitoAberto:
+        # API instável: responde na hora como não encontrado, sem ocupar o worker
+        _contar('circuito_aberto')
+        return NAO_ENCONTRADO
+    except ErroConsultaExterna:
+        # Falha de rede não entra no cache negativo: a próxima leitura tenta de novo
+        _contar('externo_erro')
+        return {"encontrado": False, "mensagem": "Erro de conexão com a API."}
+
+    if nome is None:
+        _contar('externo_nao_encontrado')
+        cache_negativo.set(barcode, NAO_ENCONTRADO)
+        return NAO_ENCONTRADO
+
+    _contar('externo_encontrado')
+    if not ProdutoCatalogo.query.filter_by(barcode=barcode).first():
+        db.session.add(ProdutoCatalogo(barcode=barcode, nome_produto=nome[:200], plu=barcode))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Outro worker gravou o mesmo código ao mesmo tempo
+            db.session.rollback()
+    resultado = {"nome": nome, "plu": barcode, "encontrado": True, "fonte": "Open Food Facts"}
+    cache_produtos.set(barcode, resultado)
+    return resultado
+
+
+def buscar_nomes_externos(barcodes, prazo):
+    """Consulta vários códigos no Open Food Facts em paralelo, sem gravar nada no banco.
+
+    Devolve {barcode: nome, ou None se o produto não existe}. Códigos com erro, com o
+    disjuntor aberto ou sem resposta em `prazo` segundos (no total) ficam de fora."""
+    resultados, futuros = {}, {}
+    for barcode in set(barcodes):
+        if cache_negativo.get(barcode):
+            resultados[barcode] = None
+        else:
+            futuros[_executor_lote.submit(cliente_off.buscar_nome, barcode)] = barcode
+    concluidos, atrasados = wait(futuros, timeout=prazo)
+    for futuro in atrasados:
+        futuro.cancel()
+    for futuro in concluidos:
+        barcode = futuros[futuro]
+        try:
+            nome = futuro.result()
+        except CircuitoAberto:
+            _contar('circuito_aberto')
+            continue
+        except ErroConsultaExterna:
+            _contar('externo_erro')
+            continue
+        _contar('externo_encontrado' if nome else 'externo_nao_encontrado')
+        if nome is None:
+            cache_negativo.set(barcode, NAO_ENCONTRADO)
+        resultados[barcode] = nome
+    return resultados
+
+
+def estatisticas():
+    with _contadores_lock:
+        origens = dict(contadores)
+    return {'cache': cache_produtos.estatisticas(), 'cache_negativo': cache_negativo.estatisticas(), 'origens': origens, 'open_food_facts': cliente_off.estatisticas()}
+
+
+def salvar_catalogo(itens):
+    """Upsert de vários itens do catálogo com um único INSERT ... ON CONFLICT (executemany).
+
+    `itens` é um dict barcode -> (nome_produto, plu). Não faz commit.
+    """
+    if not itens:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(ProdutoCatalogo.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=['barcode'], set_={'nome_produto': stmt.excluded.nome_produto, 'plu': stmt.excluded.plu, 'versao': stmt.excluded.versao})
+    # O lote inteiro entra numa única versão do catálogo (INSERT em massa não passa pelo mapper)
+    versao = proxima_versao(db.session.connection(), 'catalogo')
+    db.session.execute(stmt, [{'barcode': barcode, 'nome_produto': nome[:200], 'plu': plu, 'versao': versao} for barcode, (nome, plu) in itens.items()])
+    for barcode in itens:
+        invalidar_barcode(barcode)
@@ -0,0 +1,88 @@
+import re
+from sqlalchemy import text, or_
+from sqlalchemy.exc import OperationalError
+from .models import db, Produto, ProdutoCatalogo
+
+# --- BUSCA TEXTUAL (SQLite FTS5) ---
+# Índices FTS5 de conteúdo externo sobre produto_catalogo (nome, PLU e código de
+# barras) e produto (nome e PLU), mantidos por triggers, o que cobre também os
+# INSERTs em massa do cadastro em lote e da importação. O tokenizador unicode61
+# com remove_diacritics ignora acentos ("acucar" encontra "Açúcar") e os índices
+# de prefixo deixam o autocompletar rápido mesmo com milhões de linhas.
+
+INDICES = {
+    'catalogo_fts': ('produto_catalogo', ['nome_produto', 'plu', 'barcode']),
+    'produto_fts': ('produto', ['nome_produto', 'plu']),
+}
+
+
+def _ddl(nome, tabela, colunas):
+    lista = ', '.join(colunas)
+    novos = ', '.join(f'new.{c}' for c in colunas)
+    antigos = ', '.join(f'old.{c}' for c in colunas)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {nome} USING fts5({lista}, content='{tabela}', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+        f"CREATE TRIGGER IF NOT EXISTS {nome}_ai AFTER INSERT ON {tabela} BEGIN INSERT INTO {nome}(rowid, {lista}) VALUES (new.id, {novos}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {nome}_ad AFTER DELETE ON {tabela} BEGIN INSERT INTO {nome}({nome}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); END",
+        # Só reindexa quando muda uma coluna indexada (a varredura de status atualiza milhões de linhas)
+        f"DROP TRIGGER IF EXISTS {nome}_au",
+        f"CREATE TRIGGER {nome}_au AFTER UPDATE OF {lista} ON {tabela} BEGIN INSERT INTO {nome}({nome}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); INSERT INTO {nome}(rowid, {lista}) VALUES (new.id, {novos}); END",
+    ]
+
+
+def disponivel():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def criar_indices(reconstruir=False):
+    """Cria as tabelas FTS5 e os triggers. Com `reconstruir`, reindexa todo o conteúdo."""
+    if not disponivel():
+        return False
+    with db.engine.begin() as conexao:
+        for nome, (tabela, colunas) in INDICES.items():
+            novo = not conexao.execute(text("SELECT 1 FROM sqlite_master WHERE name = :nome"), {'nome': nome}).first()
+            for comando in _ddl(nome, tabela, colunas):
+                conexao.execute(text(comando))
+            if novo or reconstruir:
+                conexao.execute(text(f"INSERT INTO {nome}({nome}) VALUES ('rebuild')"))
+    return True
+
+
+def _expressao_fts(termo):
+    # Cada palavra vira um prefixo entre aspas; caracteres especiais do FTS5 são descartados
+    palavras = re.findall(r'\w+', termo)
+    return ' '.join(f'"{p}"*' for p in palavras)
+
+
+def buscar_catalogo(termo, limite=10):
+    expressao = _expressao_fts(termo)
+    if not expressao:
+        return []
+    if disponivel():
+        try:
+            linhas = db.session.execute(text("SELECT c.barcode, c.nome_produto, c.plu FROM catalogo_fts JOIN produto_catalogo c ON c.id = catalogo_fts.rowid WHERE catalogo_fts MATCH :q ORDER BY rank LIMIT :limite"), {'q': expressao, 'limite': limite}).all()
+            return [{'barcode': b, 'nome_produto': n, 'plu': p} for b, n, p in linhas]
+        except OperationalError:
+            db.session.rollback()
+    # Sem FTS5 (outro banco ou índice ainda não criado): busca simples por prefixo/trecho
+    linhas = ProdutoCatalogo.query.filter(or_(ProdutoCatalogo.nome_produto.ilike(f'%{termo}%'), ProdutoCatalogo.barcode.startswith(termo), ProdutoCatalogo.plu.startswith(termo))).limit(limite).all()
+    return [{'barcode': c.barcode, 'nome_produto': c.nome_produto, 'plu': c.plu} for c in linhas]
+
+
+def buscar_produtos(termo, loja_id=None, setor_id=None, limite=20):
+    """Devolve os ids de Produto que casam com o termo, respeitando o escopo informado."""
+    expressao = _expressao_fts(termo)
+    if not expressao:
+        return []
+    if disponivel():
+        filtros, parametros = '', {'q': expressao, 'limite': limite}
+        if loja_id: filtros += ' AND p.loja_id = :loja_id'; parametros['loja_id'] = loja_id
+        if setor_id: filtros += ' AND p.setor_id = :setor_id'; parametros['setor_id'] = setor_id
+        try:
+            return [l[0] for l in db.session.execute(text(f"SELECT p.id FROM produto_fts JOIN produto p ON p.id = produto_fts.rowid WHERE produto_fts MATCH :q{filtros} ORDER BY rank LIMIT :limite"), parametros)]
+        except OperationalError:
+            db.session.rollback()
+    query = Produto.query.with_entities(Produto.id).filter(or_(Produto.nome_produto.ilike(f'%{termo}%'), Produto.plu.startswith(termo)))
+    if loja_id: query = query.filter(Produto.loja_id == loja_id)
+    if setor_id: query = query.filter(Produto.setor_id == setor_id)
+    return [l[0] for l in query.limit(limite)]
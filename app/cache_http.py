@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from datetime import date, datetime, time, timezone
+from functools import wraps
+from threading import Lock
+from flask import current_app, request, session, g, make_response, send_from_directory, abort, Response
+from flask_login import current_user
+from werkzeug.security import safe_join
+from sqlalchemy import func
+from .models import db, Loja, Setor, ContadorVersao
+from .identidade import Referencia
+
+# --- CACHE HTTP ---
+# Três camadas: arquivos estáticos com a impressão digital (hash do conteúdo) na
+# URL e cache imutável de um ano, com variantes .br/.gz geradas por
+# `flask comprimir-estaticos`; ETag nas listagens e APIs JSON calculada a partir
+# dos contadores de versão (ContadorVersao), respondendo 304 sem consultar os
+# produtos; e lojas/setores em memória, recarregados quando a versão
+# 'referencias' muda (qualquer gravação em Loja/Setor, em qualquer processo).
+
+UM_ANO = 365 * 24 * 60 * 60
+# Preferência do servidor quando o navegador aceita as duas
+CODIFICACOES = (('br', '.br'), ('gzip', '.gz'))
+EXTENSOES_COMPRIMIVEIS = ('.js', '.css', '.svg', '.json', '.html', '.txt', '.map')
+TAMANHO_MINIMO_COMPRESSAO = 1024
+
+
+# --- ESTÁTICOS VERSIONADOS ---
+
+_impressoes = {}
+
+
+def impressao_estatico(pasta, arquivo):
+    """Hash curto do conteúdo; recalculado só quando o mtime muda."""
+    caminho = safe_join(pasta, arquivo)
+    try:
+        mtime = os.stat(caminho).st_mtime_ns
+    except (TypeError, OSError):
+        return None
+    guardada = _impressoes.get(caminho)
+    if guardada is None or guardada[0] != mtime:
+        with open(caminho, 'rb') as f:
+            guardada = (mtime, hashlib.md5(f.read()).hexdigest()[:12])
+        _impressoes[caminho] = guardada
+    return guardada[1]
+
+
+def _versionar_url(endpoint, values):
+    # url_for('static', filename=...) passa a gerar /static/js/x.js?v=<hash>
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        impressao = impressao_estatico(current_app.static_folder, values['filename'])
+        if impressao:
+            values['v'] = impressao
+
+
+def _variante_atualizada(caminho, sufixo):
+    try:
+        return os.stat(caminho + sufixo).st_mtime_ns >= os.stat(caminho).st_mtime_ns
+    except OSError:
+        return False
+
+
+def servir_estatico(filename):
+    """Substitui a view 'static': entrega a variante comprimida aceita pelo navegador
+    e marca como imutável a URL cuja impressão confere com o arquivo atual."""
+    pasta = current_app.static_folder
+    caminho = safe_join(pasta, filename)
+    if caminho is None or not os.path.isfile(caminho):
+        abort(404)
+    impressao = impressao_estatico(pasta, filename)
+    max_age = UM_ANO if impressao and request.args.get('v') == impressao else None
+    variantes = [(codificacao, sufixo) for codificacao, sufixo in CODIFICACOES if _variante_atualizada(caminho, sufixo)]
+    aceita = next(((c, s) for c, s in variantes if c in request.accept_encodings), None)
+    if aceita:
+        tipo, _ = mimetypes.guess_type(filename)
+        resposta = send_from_directory(pasta, filename + aceita[1], mimetype=tipo or 'application/octet-stream', max_age=max_age)
+        resposta.headers['Content-Encoding'] = aceita[0]
+    else:
+        resposta = send_from_directory(pasta, filename, max_age=max_age)
+    if max_age:
+        resposta.cache_control.public = True
+        resposta.cache_control.immutable = True
+    if variantes:
+        resposta.vary.add('Accept-Encoding')
+    return resposta
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def brotli_disponivel():
+    return _brotli() is not None
+
+
+def comprimir_estaticos(pasta):
+    """Grava as variantes .gz (e .br, se o pacote brotli estiver instalado) dos arquivos de texto.
+
+    Devolve a lista de arquivos gerados. Variantes maiores que o original não são gravadas."""
+    brotli, gerados = _brotli(), []
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in arquivos:
+            caminho = os.path.join(raiz, nome)
+            if not nome.endswith(EXTENSOES_COMPRIMIVEIS) or os.path.getsize(caminho) < TAMANHO_MINIMO_COMPRESSAO:
+                continue
+            with open(caminho, 'rb') as f:
+                conteudo = f.read()
+            compressores = [('.gz', lambda dados: gzip.compress(dados, compresslevel=9, mtime=0))]
+            if brotli:
+                compressores.append(('.br', lambda dados: brotli.compress(dados, quality=11)))
+            for sufixo, comprimir in compressores:
+                comprimido = comprimir(conteudo)
+                if len(comprimido) < len(conteudo):
+                    with open(caminho + sufixo, 'wb') as f:
+                        f.write(comprimido)
+                    gerados.append((os.path.relpath(caminho + sufixo, pasta), len(conteudo), len(comprimido)))
+    return gerados
+
+
+# --- ETAG DAS LISTAGENS E APIS ---
+
+def contador_produtos(loja_id=None):
+    """Nome do contador dos produtos de uma loja; sem loja, soma todas as lojas."""
+    return f'produtos:{loja_id}' if loja_id else 'produtos:*'
+
+
+def versoes_dados(nomes):
+    """{nome: (valor, atualizado_em)} dos contadores, lidos uma vez por requisição."""
+    memo = g.setdefault('versoes_dados', {})
+    faltando = [n for n in nomes if n not in memo]
+    if faltando:
+        tabela = ContadorVersao.__table__
+        simples = [n for n in faltando if not n.endswith(':*')]
+        for n in faltando:
+            memo[n] = (0, None)
+        if simples:
+            for nome, valor, atualizado_em in db.session.execute(db.select(tabela.c.nome, tabela.c.valor, tabela.c.atualizado_em).where(tabela.c.nome.in_(simples))):
+                memo[nome] = (valor, atualizado_em)
+        for n in faltando:
+            if n.endswith(':*'):
+                valor, atualizado_em = db.session.execute(db.select(func.sum(tabela.c.valor), func.max(tabela.c.atualizado_em)).where(tabela.c.nome.like(n[:-1] + '%'))).one()
+                memo[n] = (valor or 0, atualizado_em)
+    return memo
+
+
+def condicional(*contadores):
+    """Responde 304 quando a página (ou o JSON) não mudou desde a última visita.
+
+    `contadores` são nomes de ContadorVersao ou funções que devolvem o nome na
+    requisição. A ETag junta as versões com o usuário, o cargo, a URL, o Accept e o
+    dia (os dias restantes mudam à meia-noite). Respostas com mensagens flash
+    pendentes não entram no cache."""
+    def decorador(view):
+        @wraps(view)
+        def envoltorio(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(*args, **kwargs)
+            nomes = [c() if callable(c) else c for c in contadores]
+            versoes = versoes_dados(nomes)
+            hoje = date.today()
+            partes = [str(versoes[n][0]) for n in nomes] + [str(current_user.get_id()), current_user.role, request.full_path, request.headers.get('Accept', ''), hoje.isoformat()]
+            etag = hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()[:20]
+            if request.if_none_match.contains(etag):
+                resposta = Response(status=304)
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code != 200 or '_flashes' in session:
+                    return resposta
+            # Last-Modified é informativo: a validação é sempre pela ETag, que inclui o usuário
+            alteracoes = [versoes[n][1].replace(tzinfo=timezone.utc) for n in nomes if versoes[n][1]]
+            resposta.last_modified = max(alteracoes + [datetime.combine(hoje, time.min).astimezone(timezone.utc)])
+            resposta.set_etag(etag)
+            resposta.cache_control.private = True
+            resposta.cache_control.no_cache = True
+            resposta.vary.update(['Accept', 'Cookie'])
+            return resposta
+        return envoltorio
+    return decorador
+
+
+# --- LOJAS E SETORES EM MEMÓRIA ---
+
+_referencias = {'versao': None, 'lojas': [], 'setores': []}
+_referencias_lock = Lock()
+
+
+def referencias():
+    """(lojas, setores) ordenados por nome, como Referencia(id, nome)."""
+    versao = versoes_dados(['referencias'])['referencias'][0]
+    with _referencias_lock:
+        if _referencias['versao'] != versao:
+            lojas = [Referencia(*linha) for linha in db.session.query(Loja.id, Loja.nome).order_by(Loja.nome)]
+            setores = [Referencia(*linha) for linha in db.session.query(Setor.id, Setor.nome).order_by(Setor.nome)]
+            _referencias.update(versao=versao, lojas=lojas, setores=setores)
+        return _referencias['lojas'], _referencias['setores']
+
+
+def init_cache_http(app):
+    app.url_defaults(_versionar_url)
+    app.view_functions['static'] = servir_estatico
@@ -0,0 +1,90 @@
+from datetime import datetime
+from collections import defaultdict, Counter
+from flask import current_app
+from .models import db, Produto, Setor, ProdutoCatalogo, RegistroIdempotencia, registrar_alteracao_produto, ajustar_resumo_validade
+from .busca_produto import buscar_nomes_externos, salvar_catalogo
+from .eventos import agendar_evento
+
+# --- CADASTRO DE PRODUTOS EM LOTE ---
+# Valida todos os itens antes de gravar qualquer um; se algum falhar, nada é salvo
+# e a resposta lista os erros por posição. Os produtos entram num único INSERT
+# dentro da mesma transação do upsert do catálogo. Códigos fora do catálogo são
+# consultados no Open Food Facts em paralelo, com prazo total LOTE_BUSCA_PRAZO, e
+# os nomes encontrados entram no catálogo só junto com o lote.
+
+TAMANHO_MAXIMO_LOTE = 500
+
+
+def validar_itens(itens, usuario):
+    """Devolve (linhas_produto, catalogo, erros)."""
+    setores_validos = {s.id for s in Setor.query.all()}
+    barcodes = {str(item.get('barcode')).strip() for item in itens if isinstance(item, dict) and item.get('barcode')}
+    catalogo_existente = {c.barcode: c for c in ProdutoCatalogo.query.filter(ProdutoCatalogo.barcode.in_(barcodes)).all()} if barcodes else {}
+    desconhecidos = [str(item['barcode']).strip() for item in itens if isinstance(item, dict) and item.get('barcode') and not item.get('nome_produto')]
+    externos = buscar_nomes_externos([b for b in desconhecidos if b not in catalogo_existente], current_app.config['LOTE_BUSCA_PRAZO'])
+    linhas, catalogo, erros = [], {}, []
+    agora = datetime.utcnow()
+
+    for posicao, item in enumerate(itens):
+        if not isinstance(item, dict):
+            erros.append({'posicao': posicao, 'erro': 'Item inválido.'})
+            continue
+        barcode = str(item.get('barcode') or '').strip()
+        nome, plu = item.get('nome_produto'), item.get('plu')
+        if barcode and not nome:
+            if barcode in catalogo_existente:
+                nome, plu = catalogo_existente[barcode].nome_produto, plu or catalogo_existente[barcode].plu
+            elif barcode not in externos:
+                erros.append({'posicao': posicao, 'barcode': barcode, 'erro': 'Não foi possível consultar o produto agora; informe o nome e o PLU ou reenvie.'})
+                continue
+            elif externos[barcode]:
+                nome, plu = externos[barcode], plu or barcode
+                catalogo[barcode] = (nome, plu)
+        plu = plu or barcode
+        setor_id = usuario.setor_id if usuario.role == 'encarregado_setor' else item.get('setor_id')
+        try:
+            quantidade = int(item.get('quantidade'))
+            validade = datetime.strptime(item.get('validade') or '', '%Y-%m-%d').date()
+            setor_id = int(setor_id)
+        except (TypeError, ValueError):
+            erros.append({'posicao': posicao, 'barcode': barcode, 'erro': 'Quantidade, validade (AAAA-MM-DD) e setor são obrigatórios.'})
+            continue
+        if not nome or not plu:
+            erros.append({'posicao': posicao, 'barcode': barcode, 'erro': 'Produto não encontrado no catálogo; informe o nome e o PLU.'})
+            continue
+        if quantidade <= 0 or setor_id not in setores_validos:
+            erros.append({'posicao': posicao, 'barcode': barcode, 'erro': 'Quantidade ou setor inválido.'})
+            continue
+        if barcode and item.get('nome_produto'):
+            catalogo[barcode] = (nome, plu)
+        linhas.append({'nome_produto': nome[:200], 'plu': plu, 'quantidade': quantidade, 'validade': validade, 'status': 'Para Rebaixa', 'data_cadastro': agora, 'motivo_rebaixa': item.get('motivo_rebaixa'), 'loja_id': usuario.loja_id, 'setor_id': setor_id, 'criado_por_id': usuario.id})
+    return linhas, catalogo, erros
+
+
+def cadastrar_lote(linhas, catalogo, chaves=(), usuario_id=None):
+    """Grava o lote numa única transação. O INSERT em massa não dispara os eventos
+    do mapper, então a versão dos dados e o resumo de validades são atualizados
+    aqui, uma vez por chave em vez de uma vez por produto. As chaves de
+    idempotência entram na mesma transação: um reenvio concorrente do mesmo lote
+    falha com IntegrityError e nada é gravado duas vezes."""
+    if not linhas:
+        # Fila offline reenviada já toda gravada: nada a fazer
+        return
+    salvar_catalogo(catalogo)
+    if chaves:
+        db.session.execute(RegistroIdempotencia.__table__.insert(), [{'chave': c, 'usuario_id': usuario_id, 'criado_em': datetime.utcnow()} for c in chaves])
+    db.session.execute(Produto.__table__.insert(), linhas)
+    conexao = db.session.connection()
+    for loja_id, setor_id, dia in {(l['loja_id'], l['setor_id'], l['data_cadastro'].date()) for l in linhas}:
+        registrar_alteracao_produto(conexao, loja_id, setor_id, dia)
+    resumo = defaultdict(lambda: [0, 0])
+    for l in linhas:
+        chave = resumo[(l['loja_id'], l['setor_id'], l['validade'], l['status'])]
+        chave[0] += 1
+        chave[1] += l['quantidade']
+    for (loja_id, setor_id, validade, status), (itens, quantidade) in resumo.items():
+        ajustar_resumo_validade(conexao, loja_id, setor_id, validade, status, itens, quantidade)
+    por_setor = Counter((l['loja_id'], l['setor_id']) for l in linhas)
+    for (loja_id, setor_id), total in por_setor.items():
+        agendar_evento(db.session, 'lote', loja_id, setor_id, {'quantidade': total})
+    db.session.commit()
@@ -0,0 +1,69 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from threading import Lock
+from .models import db, ProdutoCatalogo, RegistroIdempotencia, versao_atual
+from .banco import sessao_leitura
+
+# --- SNAPSHOT DO CATÁLOGO PARA O SCANNER OFFLINE ---
+# O scanner guarda o catálogo no IndexedDB e consulta os códigos localmente. Cada
+# gravação no catálogo recebe a próxima versão (ContadorVersao 'catalogo'), então
+# o cliente pede só o que mudou depois da versão que já tem (?desde=N). O snapshot
+# completo é compacto (listas [barcode, nome, plu]), vai em gzip e fica em memória
+# até a versão mudar. O catálogo não tem exclusões, então o delta só traz upserts.
+
+_cache_completo = {'versao': None, 'corpo': None}
+_cache_lock = Lock()
+
+
+def _serializar(versao, completo, itens):
+    conteudo = json.dumps({'versao': versao, 'completo': completo, 'itens': itens}, ensure_ascii=False, separators=(',', ':'))
+    return gzip.compress(conteudo.encode('utf-8'), compresslevel=6)
+
+
+def snapshot(desde=0):
+    """Devolve (versao, corpo_gzip). `desde` 0 (ou maior que a versão atual, após restaurar o banco) gera o snapshot completo."""
+    with sessao_leitura() as sessao:
+        versao = versao_atual(sessao.connection(), 'catalogo')
+        colunas = sessao.query(ProdutoCatalogo.barcode, ProdutoCatalogo.nome_produto, ProdutoCatalogo.plu)
+        if desde and desde <= versao:
+            itens = [list(l) for l in colunas.filter(ProdutoCatalogo.versao > desde).order_by(ProdutoCatalogo.versao)]
+            return versao, _serializar(versao, False, itens)
+        with _cache_lock:
+            if _cache_completo['versao'] != versao:
+                itens = [list(l) for l in colunas.order_by(ProdutoCatalogo.id).yield_per(5000)]
+                _cache_completo.update(versao=versao, corpo=_serializar(versao, True, itens))
+            return versao, _cache_completo['corpo']
+
+
+# --- IDEMPOTÊNCIA DOS CADASTROS OFFLINE ---
+
+def _chave_valida(chave):
+    return isinstance(chave, str) and 0 < len(chave) <= 64
+
+
+def separar_repetidos(itens, usuario_id):
+    """Remove os itens cuja chave de idempotência o usuário já gravou (ou repetida no próprio lote).
+
+    Devolve (itens_novos, total_repetidos)."""
+    chaves = {item['chave'] for item in itens if isinstance(item, dict) and _chave_valida(item.get('chave'))}
+    gravadas = {c for (c,) in db.session.query(RegistroIdempotencia.chave).filter(RegistroIdempotencia.usuario_id == usuario_id, RegistroIdempotencia.chave.in_(chaves))} if chaves else set()
+    novos, vistas = [], set()
+    for item in itens:
+        chave = item.get('chave') if isinstance(item, dict) and _chave_valida(item.get('chave')) else None
+        if chave and (chave in gravadas or chave in vistas):
+            continue
+        if chave:
+            vistas.add(chave)
+        novos.append(item)
+    return novos, len(itens) - len(novos)
+
+
+def chaves_do_lote(itens):
+    return [item['chave'] for item in itens if isinstance(item, dict) and _chave_valida(item.get('chave'))]
+
+
+def limpar_chaves(dias):
+    removidas = RegistroIdempotencia.query.filter(RegistroIdempotencia.criado_em < datetime.utcnow() - timedelta(days=dias)).delete(synchronize_session=False)
+    db.session.commit()
+    return removidas
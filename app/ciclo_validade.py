@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, select
+from .models import db, Produto, ResumoValidade, ExecucaoCiclo, registrar_alteracao_produto, ajustar_resumo_validade
+from .eventos import gravar_evento, limpar_eventos
+
+# --- CICLO DE VIDA DO STATUS (VARREDURA DE VALIDADES) ---
+# Para Rebaixa -> Em Rebaixa -> Vencido -> Descartado. Cada transição é um único
+# UPDATE por status e faixa de validade. Como o UPDATE em massa não passa pelos
+# eventos do mapper, a varredura move as linhas do resumo de validades e
+# incrementa a versão dos dados dos relatórios. Rode `flask ciclo-validade` no
+# cron (logo após a meia-noite) ou ligue o agendador em processo com
+# CICLO_AGENDADOR=1. As listagens não dependem da varredura: filtram pelo status
+# e pela validade juntos (filtro_ativos/filtro_vencidos, no índice status+validade),
+# então um produto que venceu hoje já sai dos ativos antes de a varredura rodar.
+
+STATUS_ATIVOS = ['Para Rebaixa', 'Em Rebaixa']
+STATUS_VENCIDO = 'Vencido'
+STATUS_DESCARTADO = 'Descartado'
+
+
+def filtro_ativos(hoje=None):
+    return Produto.status.in_(STATUS_ATIVOS) & (Produto.validade >= (hoje or date.today()))
+
+
+def filtro_vencidos(hoje=None):
+    hoje = hoje or date.today()
+    return (Produto.status == STATUS_VENCIDO) | (Produto.status.in_(STATUS_ATIVOS) & (Produto.validade < hoje))
+
+
+def status_para_validade(app, status, validade, hoje=None):
+    """Status de um produto cuja validade foi editada, pelas mesmas regras da varredura.
+
+    Um vencido (ou descartado) com validade nova volta a Para Rebaixa; Em Rebaixa
+    definido pelo gerente é mantido enquanto o produto estiver na validade."""
+    hoje = hoje or date.today()
+    if validade < hoje:
+        return status if status == STATUS_DESCARTADO else STATUS_VENCIDO
+    if status not in STATUS_ATIVOS:
+        status = 'Para Rebaixa'
+    if status == 'Para Rebaixa' and validade <= hoje + timedelta(days=app.config['CICLO_DIAS_REBAIXA']):
+        return 'Em Rebaixa'
+    return status
+
+
+def _transicoes(hoje, dias_rebaixa, dias_descarte):
+    """(nome, status de origem, novo status, condição sobre a coluna de validade)."""
+    return [
+        ('vencidos', STATUS_ATIVOS, STATUS_VENCIDO, lambda validade: validade < hoje),
+        ('descartados', [STATUS_VENCIDO], STATUS_DESCARTADO, lambda validade: validade < hoje - timedelta(days=dias_descarte)),
+        ('rebaixados', ['Para Rebaixa'], 'Em Rebaixa', lambda validade: validade.between(hoje, hoje + timedelta(days=dias_rebaixa))),
+    ]
+
+
+def _como_data(valor):
+    # func.date devolve texto no SQLite
+    return valor if isinstance(valor, date) else date.fromisoformat(valor)
+
+
+def _aplicar_transicao(conexao, origem, destino, condicao):
+    produto, resumo = Produto.__table__, ResumoValidade.__table__
+    filtro = produto.c.status.in_(origem) & condicao(produto.c.validade)
+    dias_alterados = conexao.execute(select(produto.c.loja_id, produto.c.setor_id, func.date(produto.c.data_cadastro)).where(filtro).distinct()).all()
+    if not dias_alterados:
+        return 0, set()
+    total = conexao.execute(produto.update().where(filtro).values(status=destino)).rowcount
+    for loja_id, setor_id, dia in dias_alterados:
+        registrar_alteracao_produto(conexao, loja_id, setor_id, _como_data(dia))
+    # A condição depende só da validade, então cada linha do resumo muda de status inteira
+    filtro_resumo = resumo.c.status.in_(origem) & condicao(resumo.c.validade)
+    for linha in conexao.execute(select(resumo).where(filtro_resumo)).all():
+        ajustar_resumo_validade(conexao, linha.loja_id, linha.setor_id, linha.validade, destino, linha.total_itens, linha.total_quantidade)
+    conexao.execute(resumo.delete().where(filtro_resumo))
+    return total, {(loja_id, setor_id) for loja_id, setor_id, _ in dias_alterados}
+
+
+def executar_ciclo(app, hoje=None):
+    """Aplica todas as transições numa transação e registra a execução. Devolve o ExecucaoCiclo."""
+    hoje = hoje or date.today()
+    inicio = time.perf_counter()
+    contagens, afetados = {}, defaultdict(list)
+    with db.engine.begin() as conexao:
+        for nome, origem, destino, condicao in _transicoes(hoje, app.config['CICLO_DIAS_REBAIXA'], app.config['CICLO_DIAS_DESCARTE']):
+            contagens[nome], chaves = _aplicar_transicao(conexao, origem, destino, condicao)
+            for chave in chaves:
+                afetados[chave].append(nome)
+        # Avisa os dashboards abertos de cada loja/setor alterado para recarregarem a lista
+        for (loja_id, setor_id), transicoes in afetados.items():
+            gravar_evento(conexao, 'ciclo', loja_id, setor_id, {'transicoes': transicoes})
+        # Eventos antigos só serviam a reconexões SSE que já não acontecem mais
+        limpar_eventos(conexao, timedelta(minutes=app.config['SSE_RETENCAO_MINUTOS']))
+    execucao = ExecucaoCiclo(executado_em=datetime.utcnow(), referencia=hoje, duracao_ms=int((time.perf_counter() - inicio) * 1000), **contagens)
+    db.session.add(execucao)
+    db.session.commit()
+    # Consolida a análise de perdas aqui, para a consulta dela não gravar nada
+    from .perdas import atualizar_perdas_diarias
+    atualizar_perdas_diarias()
+    return execucao
+
+
+# --- AGENDADOR EM PROCESSO (OPCIONAL) ---
+# Uma thread por processo; com vários workers cada um varre, o que é seguro porque
+# as transições são condicionais (o segundo UPDATE não encontra mais linhas).
+
+_agendador = None
+
+
+def iniciar_agendador(app):
+    global _agendador
+    if _agendador is not None:
+        return _agendador
+    intervalo = app.config['CICLO_INTERVALO_MINUTOS'] * 60
+    parar = threading.Event()
+
+    def laco():
+        while not parar.wait(intervalo):
+            with app.app_context():
+                try:
+                    execucao = executar_ciclo(app)
+                    app.logger.info('Ciclo de validade: %d rebaixado(s), %d vencido(s), %d descartado(s) em %d ms', execucao.rebaixados, execucao.vencidos, execucao.descartados, execucao.duracao_ms)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Falha no ciclo de validade')
+                finally:
+                    db.session.remove()
+
+    _agendador = threading.Thread(target=laco, name='ciclo-validade', daemon=True)
+    _agendador.parar = parar
+    _agendador.start()
+    return _agendador
@@ -0,0 +1,210 @@
+import json
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from threading import Lock
+from flask import current_app
+from sqlalchemy import event, func, inspect, select
+from .models import db, Produto, EventoProduto
+
+# --- EVENTOS EM TEMPO REAL (SERVER-SENT EVENTS) ---
+# As alterações de produtos são gravadas na tabela evento_produto dentro da mesma
+# transação (um rollback as descarta), seja qual for o processo que grava: workers,
+# `flask ciclo-validade` no cron ou o agendador. Em cada processo com conexões SSE
+# abertas, uma thread lê os eventos novos a cada SSE_INTERVALO_CONSULTA segundos
+# (uma consulta pela chave primária, na conexão somente leitura) e os repassa às
+# filas das conexões, cada uma assinando uma loja (e opcionalmente um setor). O id
+# do evento é o da tabela, então o Last-Event-ID vale em qualquer worker. A limpeza
+# dos eventos antigos (SSE_RETENCAO_MINUTOS) roda na varredura do ciclo de validade.
+#
+# Implantação: cada conexão aberta fica parada em fila.get() até o próximo evento.
+# Com workers assíncronos (gunicorn -k gevent, que aplica o monkey patch antes de
+# carregar a aplicação) isso é uma greenlet barata e o limite padrão por processo
+# passa a SSE_MAX_CONEXOES_ASSINCRONO; com workers síncronos cada conexão prende
+# uma thread, e o limite cai para SSE_MAX_CONEXOES_SINCRONO. Acima do limite a
+# conexão recebe só um `retry:` e é encerrada: o navegador tenta de novo depois
+# sem perder o Last-Event-ID. Cada conexão dura no máximo SSE_DURACAO_MAXIMA
+# segundos antes de o navegador reconectar (talvez em outro worker).
+
+TIPOS = ('criado', 'editado', 'status', 'removido', 'lote', 'ciclo')
+LIMITE_REENVIO = 500
+
+
+class Assinatura:
+    def __init__(self, loja_id, setor_id, tamanho):
+        self.loja_id, self.setor_id = loja_id, setor_id
+        self.fila = queue.Queue(maxsize=tamanho)
+        self.atrasada = False
+
+    def aceita(self, loja_id, setor_id):
+        return (self.loja_id is None or self.loja_id == loja_id) and (self.setor_id is None or self.setor_id == setor_id)
+
+
+class Broker:
+    """Conexões SSE deste processo e a thread que lê a tabela de eventos para elas."""
+
+    def __init__(self, engine, intervalo=1.0, tamanho_fila=100, logger=None):
+        self.engine, self.intervalo, self.tamanho_fila, self.logger = engine, intervalo, tamanho_fila, logger
+        self._lock = Lock()
+        self._assinaturas = set()
+        self._leitor = None
+        self._parar = threading.Event()
+
+    def assinar(self, loja_id=None, setor_id=None):
+        assinatura = Assinatura(loja_id, setor_id, self.tamanho_fila)
+        with self._lock:
+            self._assinaturas.add(assinatura)
+            if self._leitor is None:
+                self._leitor = threading.Thread(target=self._acompanhar, args=(ultimo_evento(self.engine),), name='eventos-sse', daemon=True)
+                self._leitor.start()
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+    def conexoes(self):
+        with self._lock:
+            return len(self._assinaturas)
+
+    def parar(self):
+        self._parar.set()
+
+    def distribuir(self, evento):
+        with self._lock:
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            if assinatura.aceita(evento[2], evento[3]):
+                try:
+                    assinatura.fila.put_nowait(evento)
+                except queue.Full:
+                    # Cliente lento: em vez de crescer a fila, avisa para recarregar a página
+                    assinatura.atrasada = True
+
+    def _acompanhar(self, ultimo_id):
+        while not self._parar.wait(self.intervalo):
+            try:
+                for evento in eventos_desde(self.engine, ultimo_id):
+                    ultimo_id = evento[0]
+                    self.distribuir(evento)
+            except Exception:
+                # Banco indisponível por um instante: registra e tenta de novo na próxima volta
+                if self.logger is not None:
+                    self.logger.exception('Falha ao ler os eventos SSE')
+                self._parar.wait(self.intervalo)
+
+
+def _tabela():
+    return EventoProduto.__table__
+
+
+def ultimo_evento(engine):
+    with engine.connect() as conexao:
+        return conexao.execute(select(func.max(_tabela().c.id))).scalar() or 0
+
+
+def eventos_desde(engine, ultimo_id, limite=LIMITE_REENVIO):
+    tabela = _tabela()
+    consulta = select(tabela.c.id, tabela.c.tipo, tabela.c.loja_id, tabela.c.setor_id, tabela.c.dados).where(tabela.c.id > ultimo_id).order_by(tabela.c.id).limit(limite)
+    with engine.connect() as conexao:
+        return [(i, tipo, loja_id, setor_id, json.loads(dados)) for i, tipo, loja_id, setor_id, dados in conexao.execute(consulta)]
+
+
+def limpar_eventos(conexao, retencao):
+    """Apaga os eventos mais antigos que `retencao` (precisa de uma conexão com escrita)."""
+    return conexao.execute(_tabela().delete().where(_tabela().c.criado_em < datetime.utcnow() - retencao)).rowcount
+
+
+def workers_assincronos():
+    """Se o processo roda com o monkey patch do gevent (gunicorn -k gevent)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def obter_broker():
+    return current_app.extensions['eventos']
+
+
+def resposta_lotada():
+    """Corpo do stream quando o processo já está no limite: só o intervalo de reconexão."""
+    # Espera entre 15 e 45 s, para as reconexões não chegarem todas juntas
+    return f'retry: {random.randint(15000, 45000)}\n: lotado\n\n'
+
+
+def formatar_evento(evento):
+    evento_id, tipo, loja_id, setor_id, dados = evento
+    return f"id: {evento_id}\nevent: {tipo}\ndata: {json.dumps(dict(dados, loja_id=loja_id, setor_id=setor_id))}\n\n"
+
+
+def transmitir(broker, assinatura, ultimo_id, perdidos=(), intervalo_ping=15, duracao_maxima=300):
+    """Gerador da resposta text/event-stream. Não usa o banco nem o contexto da requisição.
+
+    `perdidos` são os eventos gravados desde o Last-Event-ID; o que chegar à fila com
+    id já enviado é ignorado. Ao fim de `duracao_maxima` segundos encerra a resposta
+    para o navegador reconectar e liberar a thread."""
+    fim = time.monotonic() + duracao_maxima
+    try:
+        # O id sem dados só atualiza o Last-Event-ID do navegador para a reconexão
+        yield f'retry: 5000\nid: {ultimo_id}\n\n'
+        for evento in perdidos:
+            ultimo_id = evento[0]
+            yield formatar_evento(evento)
+        while time.monotonic() < fim:
+            if assinatura.atrasada:
+                yield 'event: recarregar\ndata: {}\n\n'
+                return
+            try:
+                evento = assinatura.fila.get(timeout=min(intervalo_ping, max(fim - time.monotonic(), 0.01)))
+            except queue.Empty:
+                yield ': ping\n\n'
+                continue
+            if evento[0] > ultimo_id:
+                ultimo_id = evento[0]
+                yield formatar_evento(evento)
+    finally:
+        broker.cancelar(assinatura)
+
+
+# --- GRAVAÇÃO A PARTIR DO BANCO ---
+
+def gravar_evento(conexao, tipo, loja_id, setor_id, dados):
+    conexao.execute(_tabela().insert().values(tipo=tipo, loja_id=loja_id, setor_id=setor_id, dados=json.dumps(dados), criado_em=datetime.utcnow()))
+
+
+def agendar_evento(sessao, tipo, loja_id, setor_id, dados):
+    """Grava o evento na transação da sessão: só é entregue se o commit acontecer."""
+    gravar_evento(sessao.connection(), tipo, loja_id, setor_id, dados)
+
+
+def _dados_produto(produto):
+    return {'id': produto.id, 'nome_produto': produto.nome_produto, 'plu': produto.plu, 'quantidade': produto.quantidade,
+            'validade': produto.validade.isoformat(), 'status': produto.status}
+
+
+def _ao_inserir(mapper, connection, produto):
+    gravar_evento(connection, 'criado', produto.loja_id, produto.setor_id, _dados_produto(produto))
+
+
+def _ao_atualizar(mapper, connection, produto):
+    tipo = 'status' if inspect(produto).attrs.status.history.has_changes() else 'editado'
+    gravar_evento(connection, tipo, produto.loja_id, produto.setor_id, _dados_produto(produto))
+
+
+def _ao_excluir(mapper, connection, produto):
+    gravar_evento(connection, 'removido', produto.loja_id, produto.setor_id, {'id': produto.id})
+
+
+def init_eventos(app):
+    with app.app_context():
+        engine = db.engines.get('leitura', db.engine)
+    app.extensions['eventos'] = Broker(engine, app.config['SSE_INTERVALO_CONSULTA'], app.config['SSE_TAMANHO_FILA'], app.logger)
+    if event.contains(Produto, 'after_insert', _ao_inserir):
+        return
+    event.listen(Produto, 'after_insert', _ao_inserir)
+    event.listen(Produto, 'after_update', _ao_atualizar)
+    event.listen(Produto, 'after_delete', _ao_excluir)
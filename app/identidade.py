@@ -0,0 +1,62 @@
+from collections import namedtuple
+from flask_login import UserMixin
+from .models import db, Usuario, Loja, Setor
+from .busca_produto import CacheLRU
+
+# --- USUÁRIO DA SESSÃO EM CACHE ---
+# O current_user das requisições autenticadas é um UsuarioSessao montado com uma
+# única consulta (usuário + nomes da loja e do setor) e guardado em memória por
+# até USUARIO_CACHE_TTL segundos. A cada requisição os contadores 'usuarios' e
+# 'referencias' (ContadorVersao, lidos pela chave primária junto com os da ETag)
+# dizem se a cópia ainda vale: editar/excluir usuário ou editar loja/setor em
+# qualquer processo incrementa o contador na mesma transação, e a próxima
+# requisição em todos os processos já recarrega o usuário.
+
+Referencia = namedtuple('Referencia', 'id nome')
+
+
+class UsuarioSessao(UserMixin):
+    """Cópia somente leitura do usuário logado, com loja e setor já resolvidos."""
+
+    def __init__(self, id, username, role, loja_id, setor_id, loja_nome, setor_nome):
+        self.id, self.username, self.role = id, username, role
+        self.loja_id, self.setor_id = loja_id, setor_id
+        self.loja = Referencia(loja_id, loja_nome) if loja_id else None
+        self.setor = Referencia(setor_id, setor_nome) if setor_id else None
+
+    @property
+    def nome_display(self):
+        return Usuario.formatar_nome_display(self.username)
+
+    def __repr__(self):
+        return f'<UsuarioSessao {self.username}>'
+
+
+cache_usuarios = CacheLRU(tamanho_maximo=10000, ttl=300)
+
+
+def configurar_cache_usuarios(app):
+    cache_usuarios.ttl = app.config['USUARIO_CACHE_TTL']
+
+
+def carregar_usuario(usuario_id):
+    from .cache_http import versoes_dados
+    versoes = versoes_dados(['usuarios', 'referencias'])
+    versao = (versoes['usuarios'][0], versoes['referencias'][0])
+    em_cache = cache_usuarios.get(usuario_id)
+    if em_cache is not None and em_cache[0] == versao:
+        return em_cache[1]
+    linha = db.session.query(Usuario.id, Usuario.username, Usuario.role, Usuario.loja_id, Usuario.setor_id, Loja.nome, Setor.nome).outerjoin(Loja, Usuario.loja_id == Loja.id).outerjoin(Setor, Usuario.setor_id == Setor.id).filter(Usuario.id == usuario_id).first()
+    if linha is None:
+        return None
+    usuario = UsuarioSessao(*linha)
+    cache_usuarios.set(usuario_id, (versao, usuario))
+    return usuario
+
+
+def invalidar_usuario(usuario_id=None):
+    """Remove um usuário do cache, ou todos (quando muda o nome de uma loja ou setor)."""
+    if usuario_id is None:
+        cache_usuarios.limpar()
+    else:
+        cache_usuarios.remover(usuario_id)
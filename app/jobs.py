@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from .models import db, RelatorioJob, VersaoDados
+from .banco import sessao_leitura
+from .relatorios import consultar_produtos_relatorio, linhas_relatorio, draw_pdf_report
+from .perdas import resumo_para_relatorio
+
+# --- FILA DE RELATÓRIOS EM SEGUNDO PLANO ---
+# Os pedidos de relatório viram registros RelatorioJob (persistidos no banco da
+# pasta instance) e são renderizados por um pool de threads. O PDF pronto fica em
+# instance/relatorios/<chave>.pdf; como a chave inclui a versão dos dados do
+# período, pedidos idênticos reaproveitam o arquivo até algum produto mudar.
+# Com vários workers, o job em processamento guarda o dono (host:pid) e uma
+# pulsação: outro processo só o retoma se o dono morreu (mesmo host) ou se a
+# pulsação parou há RELATORIO_JOB_TIMEOUT segundos, e o dono antigo, ao perceber
+# que perdeu o job, descarta o que desenhou. Um índice único parcial impede dois
+# jobs ativos com a mesma chave.
+
+STATUS_ATIVOS_JOB = ['pendente', 'processando']
+_executor = None
+_executor_lock = Lock()
+
+
+def pasta_relatorios(app):
+    pasta = os.path.join(app.instance_path, 'relatorios')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def caminho_arquivo(app, job):
+    return os.path.join(pasta_relatorios(app), f'{job.chave}.pdf')
+
+
+def _dono():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _abandonado(job, timeout):
+    host, _, pid = (job.processado_por or '').rpartition(':')
+    if host == socket.gethostname() and pid.isdigit() and int(pid) != os.getpid() and not _processo_vivo(int(pid)):
+        return True
+    return job.atualizado_em is None or job.atualizado_em < datetime.utcnow() - timedelta(seconds=timeout)
+
+
+def _liberar_abandonados(app, jobs):
+    """Devolve à fila os jobs 'processando' cujo dono parou. Devolve quantos foram liberados."""
+    liberados = 0
+    for job in jobs:
+        if job.status == 'processando' and _abandonado(job, app.config['RELATORIO_JOB_TIMEOUT']):
+            # Condicional: se o dono pulsou ou outro processo já retomou, nada muda
+            liberados += RelatorioJob.query.filter_by(id=job.id, status='processando', processado_por=job.processado_por, atualizado_em=job.atualizado_em).update(
+                {'status': 'pendente', 'processado_por': None}, synchronize_session=False)
+    db.session.commit()
+    return liberados
+
+
+def _obter_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config.get('RELATORIO_WORKERS', 2), thread_name_prefix='relatorio')
+            # Retoma jobs pendentes e os que ficaram pela metade quando o dono parou
+            _liberar_abandonados(app, RelatorioJob.query.filter_by(status='processando').all())
+            for job in RelatorioJob.query.filter_by(status='pendente').all():
+                _executor.submit(_executar_job, app, job.id)
+    return _executor
+
+
+def versao_dos_dados(inicio, fim, loja_id=None, setor_id=None):
+    query = db.session.query(func.coalesce(func.sum(VersaoDados.versao), 0)).filter(VersaoDados.dia.between(inicio.date(), fim.date()))
+    if loja_id: query = query.filter(VersaoDados.loja_id == loja_id)
+    if setor_id: query = query.filter(VersaoDados.setor_id == setor_id)
+    return query.scalar()
+
+
+def calcular_chave(parametros, versao):
+    conteudo = json.dumps(parametros, sort_keys=True) + f'|{versao}'
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def enfileirar_relatorio(app, parametros):
+    """Devolve o job existente para os mesmos parâmetros/dados ou cria um novo."""
+    inicio, fim = _periodo(parametros)
+    chave = calcular_chave(parametros, versao_dos_dados(inicio, fim, parametros.get('loja_id'), parametros.get('setor_id')))
+    job = RelatorioJob.query.filter(RelatorioJob.chave == chave, RelatorioJob.status != 'erro').order_by(RelatorioJob.criado_em.desc()).first()
+    # O executor é criado antes do novo job para que a retomada de pendentes não o envie duas vezes
+    executor = _obter_executor(app)
+    if job and job.status == 'processando' and _liberar_abandonados(app, [job]):
+        executor.submit(_executar_job, app, job.id)
+    if job and (job.status != 'concluido' or os.path.exists(caminho_arquivo(app, job))):
+        return job
+    job = RelatorioJob(id=uuid.uuid4().hex, chave=chave, status='pendente', parametros=json.dumps(parametros))
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Pedido idêntico simultâneo em outra requisição: usa o job que ela criou
+        db.session.rollback()
+        return RelatorioJob.query.filter(RelatorioJob.chave == chave, RelatorioJob.status.in_(STATUS_ATIVOS_JOB)).first()
+    executor.submit(_executar_job, app, job.id)
+    return job
+
+
+def _periodo(parametros):
+    inicio = datetime.strptime(parametros['data_inicio'], '%Y-%m-%d')
+    fim = datetime.combine(datetime.strptime(parametros['data_fim'], '%Y-%m-%d').date(), datetime.max.time())
+    return inicio, fim
+
+
+class JobRetomado(Exception):
+    pass
+
+
+def _com_pulsacao(linhas, job_id, dono, intervalo):
+    """Repassa as linhas atualizando a pulsação do job; para se outro processo o retomou."""
+    proxima = time.monotonic() + intervalo
+    for linha in linhas:
+        if time.monotonic() >= proxima:
+            if not RelatorioJob.query.filter_by(id=job_id, processado_por=dono).update({'atualizado_em': datetime.utcnow()}, synchronize_session=False):
+                db.session.rollback()
+                raise JobRetomado()
+            db.session.commit()
+            proxima = time.monotonic() + intervalo
+        yield linha
+
+
+def _executar_job(app, job_id):
+    with app.app_context():
+        # Marca o job como em processamento só se ninguém o pegou antes
+        dono = _dono()
+        assumido = RelatorioJob.query.filter_by(id=job_id, status='pendente').update({'status': 'processando', 'processado_por': dono, 'atualizado_em': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        job = db.session.get(RelatorioJob, job_id)
+        if not assumido or job is None:
+            db.session.remove()
+            return
+        parametros = json.loads(job.parametros)
+        destino = caminho_arquivo(app, job)
+        temporario = f'{destino}.{job.id}.{os.getpid()}.tmp'
+        do_dono = RelatorioJob.query.filter_by(id=job_id, processado_por=dono)
+        try:
+            inicio, fim = _periodo(parametros)
+            # A leitura longa do relatório usa a conexão somente leitura; com WAL as gravações seguem em paralelo
+            with sessao_leitura() as sessao, open(temporario, 'wb') as arquivo:
+                resumo = resumo_para_relatorio(inicio, fim, parametros.get('loja_id'), parametros.get('setor_id'), sessao) if parametros.get('resumo_perdas') else None
+                # Uma linha além do máximo, para o PDF saber que a lista foi cortada
+                maximo = app.config['RELATORIO_MAXIMO_LINHAS']
+                query = consultar_produtos_relatorio(inicio, fim, loja_id=parametros.get('loja_id'), setor_id=parametros.get('setor_id'), sessao=sessao, limite=maximo + 1 if maximo else None)
+                linhas = _com_pulsacao(linhas_relatorio(query), job_id, dono, app.config['RELATORIO_JOB_PULSACAO'])
+                total, truncado = draw_pdf_report(arquivo, parametros['titulo'], f"Produtos cadastrados de {parametros['data_inicio']} a {parametros['data_fim']}", linhas, resumo, maximo)
+            # Só o dono atual publica o PDF e conclui o job
+            if do_dono.update({'status': 'concluido', 'total_linhas': total, 'truncado': truncado, 'concluido_em': datetime.utcnow()}, synchronize_session=False):
+                os.replace(temporario, destino)
+            db.session.commit()
+        except JobRetomado:
+            pass
+        except Exception as e:
+            db.session.rollback()
+            do_dono.update({'status': 'erro', 'erro': str(e)[:255], 'concluido_em': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            db.session.remove()
+
+
+def job_para_dict(job):
+    return {'id': job.id, 'status': job.status, 'total_linhas': job.total_linhas, 'truncado': bool(job.truncado), 'erro': job.erro, 'criado_em': job.criado_em.isoformat(), 'concluido_em': job.concluido_em.isoformat() if job.concluido_em else None}
+
+
+def pode_acessar_job(job, usuario):
+    """Um job pode ser compartilhado entre usuários com o mesmo escopo de cargo."""
+    parametros = json.loads(job.parametros)
+    escopo = parametros['escopo']
+    if escopo == 'geral': return usuario.role in ['gerente_geral', 'gerente_trocas']
+    if escopo == 'loja': return usuario.role == 'gerente' and usuario.loja_id == parametros['loja_id']
+    return usuario.role == 'encarregado_setor' and usuario.loja_id == parametros['loja_id'] and usuario.setor_id == parametros['setor_id']
+
+
+def limpar_jobs(app, dias=None, ids=None):
+    """Remove jobs finalizados (e seus PDFs) mais antigos que `dias`, ou todos se `dias` for None; `ids` restringe a esses jobs."""
+    query = RelatorioJob.query.filter(RelatorioJob.status.in_(['concluido', 'erro']))
+    if dias is not None:
+        query = query.filter(RelatorioJob.criado_em < datetime.utcnow() - timedelta(days=dias))
+    if ids is not None:
+        query = query.filter(RelatorioJob.id.in_(ids))
+    removidos = 0
+    for job in query.all():
+        caminho = caminho_arquivo(app, job)
+        compartilhado = RelatorioJob.query.filter(RelatorioJob.chave == job.chave, RelatorioJob.id != job.id).count()
+        if os.path.exists(caminho) and not compartilhado:
+            os.remove(caminho)
+        db.session.delete(job)
+        removidos += 1
+    db.session.commit()
+    return removidos
@@ -0,0 +1,187 @@
+import cProfile
+import hmac
+import os
+import random
+import time
+from contextlib import contextmanager
+from threading import Lock
+from flask import g, request, Response, abort, current_app, has_request_context
+from sqlalchemy import event
+
+# --- INSTRUMENTAÇÃO: LATÊNCIA, SQL E PERFIL POR REQUISIÇÃO ---
+# Histogramas em memória por endpoint, expostos em /metrics no formato texto do
+# Prometheus. Os eventos do engine contam os comandos SQL e o tempo gasto no banco
+# de cada requisição; uma amostra configurável das requisições pode ser gravada
+# com o cProfile em instance/perfis para análise com pstats/snakeviz.
+# Só um perfil por vez no processo: no Python 3.12+ um segundo cProfile ativo em
+# outra thread levanta ValueError, então a requisição sorteada com outro perfil em
+# andamento segue sem perfil. O /metrics expõe nomes de rotas e volumes: pede o
+# METRICAS_TOKEN e, sem ele, fica desligado (METRICAS_PUBLICO=1 libera sem token).
+
+_perfil_ativo = Lock()
+
+LIMITES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, limites=LIMITES_PADRAO):
+        self.nome, self.ajuda, self.limites = nome, ajuda, limites
+        self._series = {}
+        self._lock = Lock()
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            serie = self._series.setdefault(chave, {'baldes': [0] * len(self.limites), 'soma': 0.0, 'total': 0})
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie['baldes'][i] += 1
+            serie['soma'] += valor
+            serie['total'] += 1
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            for chave, serie in sorted(self._series.items()):
+                rotulos = ','.join(f'{k}="{v}"' for k, v in chave)
+                separador = ',' if rotulos else ''
+                for limite, quantidade in zip(self.limites, serie['baldes']):
+                    linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="{limite}"}} {quantidade}')
+                linhas.append(f'{self.nome}_bucket{{{rotulos}{separador}le="+Inf"}} {serie["total"]}')
+                linhas.append(f'{self.nome}_sum{{{rotulos}}} {serie["soma"]:.6f}')
+                linhas.append(f'{self.nome}_count{{{rotulos}}} {serie["total"]}')
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, ajuda):
+        self.nome, self.ajuda = nome, ajuda
+        self._series = {}
+        self._lock = Lock()
+
+    def somar(self, valor=1, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            self._series[chave] = self._series.get(chave, 0) + valor
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} counter']
+        with self._lock:
+            for chave, valor in sorted(self._series.items()):
+                rotulos = ','.join(f'{k}="{v}"' for k, v in chave)
+                linhas.append(f'{self.nome}{{{rotulos}}} {valor:g}')
+        return linhas
+
+
+latencia_requisicao = Histograma('http_request_duration_seconds', 'Latência das requisições por endpoint.')
+comandos_sql_requisicao = Histograma('sql_statements_per_request', 'Comandos SQL executados por requisição.', limites=(1, 2, 5, 10, 20, 50, 100, 500))
+comandos_sql = Contador('sql_statements_total', 'Comandos SQL executados.')
+tempo_sql = Contador('sql_duration_seconds_total', 'Tempo total gasto no banco.')
+tempo_operacao = Histograma('operation_duration_seconds', 'Duração de operações internas (renderização de PDF, busca externa).')
+METRICAS = [latencia_requisicao, comandos_sql_requisicao, comandos_sql, tempo_sql, tempo_operacao]
+
+
+@contextmanager
+def medir(operacao):
+    """Mede um trecho de código: `with medir('pdf_render'): ...`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempo_operacao.observar(time.perf_counter() - inicio, operacao=operacao)
+
+
+def _endpoint():
+    return (request.endpoint or 'desconhecido') if has_request_context() else 'segundo_plano'
+
+
+def _antes_do_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('inicio_sql', []).append(time.perf_counter())
+
+
+def _depois_do_sql(conn, cursor, statement, parameters, context, executemany):
+    duracao = time.perf_counter() - conn.info['inicio_sql'].pop()
+    endpoint = _endpoint()
+    comandos_sql.somar(endpoint=endpoint)
+    tempo_sql.somar(duracao, endpoint=endpoint)
+    if has_request_context() and 'sql_comandos' in g:
+        g.sql_comandos += 1
+        g.sql_tempo += duracao
+
+
+def _erro_no_sql(contexto):
+    # Comando que falhou não chega ao after_cursor_execute: descarta o início dele
+    inicios = contexto.connection.info.get('inicio_sql') if contexto.connection is not None else None
+    if inicios:
+        inicios.pop()
+
+
+def _antes_da_requisicao():
+    g.inicio_requisicao = time.perf_counter()
+    g.sql_comandos, g.sql_tempo = 0, 0.0
+    g.perfil = None
+    amostragem = current_app.config.get('PROFILER_AMOSTRAGEM', 0)
+    if amostragem and random.random() < amostragem and _perfil_ativo.acquire(blocking=False):
+        g.perfil = cProfile.Profile()
+        g.perfil.enable()
+
+
+def _encerrar_perfil():
+    perfil, g.perfil = g.get('perfil'), None
+    if perfil is not None:
+        perfil.disable()
+        _perfil_ativo.release()
+    return perfil
+
+
+def _depois_da_requisicao(resposta):
+    if 'inicio_requisicao' not in g:
+        return resposta
+    duracao = time.perf_counter() - g.inicio_requisicao
+    endpoint = _endpoint()
+    latencia_requisicao.observar(duracao, endpoint=endpoint)
+    comandos_sql_requisicao.observar(g.sql_comandos, endpoint=endpoint)
+    resposta.headers['Server-Timing'] = f'app;dur={duracao * 1000:.1f}, db;dur={g.sql_tempo * 1000:.1f};desc="{g.sql_comandos} sql"'
+    limite_lento = current_app.config.get('ROTA_LENTA_MS')
+    if limite_lento and duracao * 1000 > limite_lento:
+        current_app.logger.warning('Rota lenta %s: %.0f ms, %d comandos SQL (%.0f ms no banco)', endpoint, duracao * 1000, g.sql_comandos, g.sql_tempo * 1000)
+    perfil = _encerrar_perfil()
+    if perfil is not None:
+        pasta = os.path.join(current_app.instance_path, 'perfis')
+        os.makedirs(pasta, exist_ok=True)
+        perfil.dump_stats(os.path.join(pasta, f'{endpoint}-{int(time.time() * 1000)}.prof'))
+    return resposta
+
+
+def _fim_da_requisicao(erro):
+    # Requisição que não passou pelo after_request (erro) não pode prender o perfil
+    _encerrar_perfil()
+
+
+def _pode_ver_metricas():
+    token = current_app.config.get('METRICAS_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    # Atrás de um proxy reverso todo acesso chega de 127.0.0.1: sem token só com opt-in
+    return bool(current_app.config.get('METRICAS_PUBLICO'))
+
+
+def _exportar_metricas():
+    if not _pode_ver_metricas():
+        abort(401 if current_app.config.get('METRICAS_TOKEN') else 404)
+    linhas = []
+    for metrica in METRICAS:
+        linhas.extend(metrica.exportar())
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_metricas(app, db):
+    app.before_request(_antes_da_requisicao)
+    app.after_request(_depois_da_requisicao)
+    app.teardown_request(_fim_da_requisicao)
+    app.add_url_rule('/metrics', 'metricas', _exportar_metricas)
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _antes_do_sql)
+            event.listen(engine, 'after_cursor_execute', _depois_do_sql)
+            event.listen(engine, 'handle_error', _erro_no_sql)
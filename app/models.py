@@ -1,10 +1,13 @@
 from . import db, bcrypt, login_manager
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
 from datetime import datetime
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    # Usuário em cache com loja/setor resolvidos (ver identidade.py)
+    from .identidade import carregar_usuario
+    return carregar_usuario(int(user_id))
 
 class Loja(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -31,6 +34,8 @@ class ProdutoCatalogo(db.Model):
     barcode = db.Column(db.String(50), unique=True, nullable=False)
     nome_produto = db.Column(db.String(200), nullable=False)
     plu = db.Column(db.String(50))
+    # Versão do catálogo em que o item foi gravado (snapshot incremental do scanner offline)
+    versao = db.Column(db.Integer, nullable=False, default=0, index=True)
     def __repr__(self):
         return f'<Catalogo {self.nome_produto}>'
 
@@ -52,9 +57,14 @@ class Usuario(db.Model, UserMixin):
     # --- NOVA PROPRIEDADE PARA EXIBIR O NOME ---
     @property
     def nome_display(self):
-        if '@' in self.username:
-            return self.username.split('@')[0].capitalize()
-        return self.username
+        return Usuario.formatar_nome_display(self.username)
+
+    # Usado quando só o username foi carregado (ex.: consultas por colunas dos relatórios)
+    @staticmethod
+    def formatar_nome_display(username):
+        if '@' in username:
+            return username.split('@')[0].capitalize()
+        return username
 
     def __repr__(self):
         return f'<Usuario {self.username}>'
@@ -74,5 +84,254 @@ class Produto(db.Model):
     # --- NOVO CAMPO PARA GUARDAR O CRIADOR DO PRODUTO ---
     criado_por_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
 
+    # Índices compostos seguindo os filtros usados pelos dashboards e relatórios
+    __table_args__ = (
+        db.Index('ix_produto_loja_setor_validade', 'loja_id', 'setor_id', 'validade'),
+        db.Index('ix_produto_loja_status_validade', 'loja_id', 'status', 'validade'),
+        db.Index('ix_produto_validade', 'validade'),
+        db.Index('ix_produto_loja_setor_status_validade', 'loja_id', 'setor_id', 'status', 'validade'),
+        db.Index('ix_produto_status_validade', 'status', 'validade'),
+        db.Index('ix_produto_data_cadastro', 'data_cadastro'),
+        # Série semanal dos produtos com mais perdas (perdas.py)
+        db.Index('ix_produto_plu_data_cadastro', 'plu', 'data_cadastro'),
+    )
+
+    def __repr__(self):
+        return f'<Produto {self.nome_produto}>'
+
+# --- PRODUTOS ARQUIVADOS ---
+# Cópia dos produtos removidos da tabela principal (exclusões e purgas), para
+# auditoria. Guarda o id original em produto_id (o SQLite pode reaproveitar ids
+# excluídos) e não tem chaves estrangeiras, então sobrevive à exclusão da loja ou
+# do usuário.
+class ProdutoArquivado(db.Model):
+    __tablename__ = 'produto_arquivado'
+    id = db.Column(db.Integer, primary_key=True)
+    produto_id = db.Column(db.Integer, nullable=False, index=True)
+    nome_produto = db.Column(db.String(200), nullable=False)
+    plu = db.Column(db.String(50), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    validade = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    data_cadastro = db.Column(db.DateTime, nullable=False)
+    motivo_rebaixa = db.Column(db.String(255), nullable=True)
+    loja_id = db.Column(db.Integer, nullable=False)
+    setor_id = db.Column(db.Integer, nullable=False)
+    criado_por_id = db.Column(db.Integer, nullable=False)
+    arquivado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    arquivado_por_id = db.Column(db.Integer, nullable=True)
+    motivo_arquivamento = db.Column(db.String(20), nullable=False)
+
+    # Os relatórios filtram o arquivo como a tabela principal: motivo, loja/setor e data de cadastro
+    __table_args__ = (
+        db.Index('ix_produto_arquivado_arquivado_em', 'arquivado_em'),
+        db.Index('ix_produto_arquivado_motivo_data_cadastro', 'motivo_arquivamento', 'data_cadastro'),
+        db.Index('ix_produto_arquivado_loja_setor_data_cadastro', 'loja_id', 'setor_id', 'data_cadastro'),
+        db.Index('ix_produto_arquivado_plu_data_cadastro', 'plu', 'data_cadastro'),
+    )
+
+    def __repr__(self):
+        return f'<ProdutoArquivado {self.nome_produto} ({self.motivo_arquivamento})>'
+
+# --- JOBS DE RELATÓRIO EM SEGUNDO PLANO ---
+class RelatorioJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    # Hash dos parâmetros + versão dos dados: pedidos idênticos compartilham o mesmo PDF
+    chave = db.Column(db.String(64), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    parametros = db.Column(db.Text, nullable=False)
+    total_linhas = db.Column(db.Integer, nullable=True)
+    # O PDF parou em RELATORIO_MAXIMO_LINHAS (ver relatorios.py)
+    truncado = db.Column(db.Boolean, nullable=True)
+    erro = db.Column(db.String(255), nullable=True)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    concluido_em = db.Column(db.DateTime, nullable=True)
+    # Processo (host:pid) que está desenhando o PDF e sua última pulsação (ver jobs.py)
+    processado_por = db.Column(db.String(100), nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=True)
+
+    # No máximo um job pendente ou em processamento por chave
+    __table_args__ = (
+        db.Index('ux_relatorio_job_chave_ativa', 'chave', unique=True,
+                 sqlite_where=db.text("status IN ('pendente', 'processando')"), postgresql_where=db.text("status IN ('pendente', 'processando')")),
+    )
+
     def __repr__(self):
-        return f'<Produto {self.nome_produto}>'
\ No newline at end of file
+        return f'<RelatorioJob {self.id} {self.status}>'
+
+# Registro de cada varredura do ciclo de validade (ver ciclo_validade.py)
+class ExecucaoCiclo(db.Model):
+    __tablename__ = 'execucao_ciclo'
+    id = db.Column(db.Integer, primary_key=True)
+    executado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    referencia = db.Column(db.Date, nullable=False)
+    rebaixados = db.Column(db.Integer, nullable=False, default=0)
+    vencidos = db.Column(db.Integer, nullable=False, default=0)
+    descartados = db.Column(db.Integer, nullable=False, default=0)
+    duracao_ms = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ExecucaoCiclo {self.referencia} {self.vencidos}/{self.descartados}>'
+
+# Alterações de produtos para as conexões SSE de todos os processos (ver eventos.py)
+class EventoProduto(db.Model):
+    __tablename__ = 'evento_produto'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    loja_id = db.Column(db.Integer)
+    setor_id = db.Column(db.Integer)
+    dados = db.Column(db.Text, nullable=False)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+# Contador de alterações por loja/setor/dia de cadastro, usado para invalidar o cache de relatórios
+class VersaoDados(db.Model):
+    __tablename__ = 'versao_dados'
+    loja_id = db.Column(db.Integer, primary_key=True)
+    setor_id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+    # Última versão já consolidada em perda_diaria (ver perdas.py)
+    versao_perdas = db.Column(db.Integer, nullable=True)
+
+def registrar_alteracao_produto(connection, loja_id, setor_id, dia):
+    tabela = VersaoDados.__table__
+    filtro = (tabela.c.loja_id == loja_id) & (tabela.c.setor_id == setor_id) & (tabela.c.dia == dia)
+    resultado = connection.execute(tabela.update().where(filtro).values(versao=tabela.c.versao + 1))
+    if resultado.rowcount == 0:
+        connection.execute(tabela.insert().values(loja_id=loja_id, setor_id=setor_id, dia=dia, versao=1))
+    # Versão por loja usada nas ETags das listagens (ver cache_http.py)
+    marcar_versao(connection, f'produtos:{loja_id}')
+
+# --- PERDAS POR DIA DE CADASTRO (AGREGADO) ---
+# Cadastrado / em rebaixa / perdido por loja, setor, dia de cadastro e autor,
+# recalculado por perdas.atualizar_perdas_diarias para os dias cuja versão em
+# versao_dados mudou. As análises da rede, por loja, setor ou autor leem daqui.
+class PerdaDiaria(db.Model):
+    __tablename__ = 'perda_diaria'
+    loja_id = db.Column(db.Integer, primary_key=True)
+    setor_id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, primary_key=True)
+    criado_por_id = db.Column(db.Integer, primary_key=True)
+    itens_cadastrados = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_cadastrada = db.Column(db.Integer, nullable=False, default=0)
+    itens_rebaixa = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_rebaixa = db.Column(db.Integer, nullable=False, default=0)
+    itens_perdidos = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_perdida = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_perda_diaria_dia', 'dia'),
+    )
+
+# --- RESUMO DE VALIDADES (AGREGADO INCREMENTAL) ---
+# Quantidade de itens por loja/setor/data de validade/status, mantida a cada
+# alteração de produto. As faixas de vencimento (vencido, 0-3 dias...) mudam com
+# o dia, então são calculadas na consulta a partir da validade, sobre esta
+# tabela pequena em vez da tabela de produtos.
+class ResumoValidade(db.Model):
+    __tablename__ = 'resumo_validade'
+    loja_id = db.Column(db.Integer, primary_key=True)
+    setor_id = db.Column(db.Integer, primary_key=True)
+    validade = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    total_itens = db.Column(db.Integer, nullable=False, default=0)
+    total_quantidade = db.Column(db.Integer, nullable=False, default=0)
+
+def ajustar_resumo_validade(connection, loja_id, setor_id, validade, status, itens, quantidade):
+    tabela = ResumoValidade.__table__
+    filtro = (tabela.c.loja_id == loja_id) & (tabela.c.setor_id == setor_id) & (tabela.c.validade == validade) & (tabela.c.status == status)
+    resultado = connection.execute(tabela.update().where(filtro).values(total_itens=tabela.c.total_itens + itens, total_quantidade=tabela.c.total_quantidade + quantidade))
+    if resultado.rowcount == 0:
+        connection.execute(tabela.insert().values(loja_id=loja_id, setor_id=setor_id, validade=validade, status=status, total_itens=itens, total_quantidade=quantidade))
+    elif itens < 0:
+        connection.execute(tabela.delete().where(filtro & (tabela.c.total_itens <= 0)))
+
+def _valor_anterior(produto, atributo):
+    historico = inspect(produto).attrs[atributo].history
+    return historico.deleted[0] if historico.deleted else getattr(produto, atributo)
+
+@event.listens_for(Produto, 'after_insert')
+def _produto_inserido(mapper, connection, produto):
+    registrar_alteracao_produto(connection, produto.loja_id, produto.setor_id, (produto.data_cadastro or datetime.utcnow()).date())
+    ajustar_resumo_validade(connection, produto.loja_id, produto.setor_id, produto.validade, produto.status, 1, produto.quantidade)
+
+@event.listens_for(Produto, 'after_update')
+def _produto_atualizado(mapper, connection, produto):
+    registrar_alteracao_produto(connection, produto.loja_id, produto.setor_id, (produto.data_cadastro or datetime.utcnow()).date())
+    anterior = [_valor_anterior(produto, a) for a in ('loja_id', 'setor_id', 'validade', 'status', 'quantidade')]
+    atual = [produto.loja_id, produto.setor_id, produto.validade, produto.status, produto.quantidade]
+    if anterior != atual:
+        ajustar_resumo_validade(connection, *anterior[:4], -1, -anterior[4])
+        ajustar_resumo_validade(connection, *atual[:4], 1, atual[4])
+
+@event.listens_for(Produto, 'after_delete')
+def _produto_excluido(mapper, connection, produto):
+    registrar_alteracao_produto(connection, produto.loja_id, produto.setor_id, (produto.data_cadastro or datetime.utcnow()).date())
+    ajustar_resumo_validade(connection, produto.loja_id, produto.setor_id, produto.validade, produto.status, -1, -produto.quantidade)
+
+# --- CONTADORES DE VERSÃO ---
+# Um valor por nome ('catalogo', 'referencias', 'produtos:<loja>') incrementado a
+# cada gravação. O UPDATE pega o lock de escrita antes da leitura, então duas
+# transações não recebem o mesmo valor.
+class ContadorVersao(db.Model):
+    __tablename__ = 'contador_versao'
+    nome = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime)
+
+def marcar_versao(connection, nome):
+    tabela = ContadorVersao.__table__
+    agora = datetime.utcnow()
+    if connection.execute(tabela.update().where(tabela.c.nome == nome).values(valor=tabela.c.valor + 1, atualizado_em=agora)).rowcount == 0:
+        connection.execute(tabela.insert().values(nome=nome, valor=1, atualizado_em=agora))
+
+def proxima_versao(connection, nome):
+    marcar_versao(connection, nome)
+    tabela = ContadorVersao.__table__
+    return connection.execute(db.select(tabela.c.valor).where(tabela.c.nome == nome)).scalar()
+
+def versao_atual(connection, nome):
+    tabela = ContadorVersao.__table__
+    return connection.execute(db.select(tabela.c.valor).where(tabela.c.nome == nome)).scalar() or 0
+
+@event.listens_for(ProdutoCatalogo, 'before_insert')
+def _catalogo_inserido(mapper, connection, item):
+    item.versao = proxima_versao(connection, 'catalogo')
+
+@event.listens_for(ProdutoCatalogo, 'before_update')
+def _catalogo_atualizado(mapper, connection, item):
+    estado = inspect(item)
+    if estado.attrs.nome_produto.history.has_changes() or estado.attrs.plu.history.has_changes():
+        item.versao = proxima_versao(connection, 'catalogo')
+
+# Lojas e setores em cache nos processos (ver cache_http.referencias)
+@event.listens_for(Loja, 'after_insert')
+@event.listens_for(Loja, 'after_update')
+@event.listens_for(Loja, 'after_delete')
+@event.listens_for(Setor, 'after_insert')
+@event.listens_for(Setor, 'after_update')
+@event.listens_for(Setor, 'after_delete')
+def _referencia_alterada(mapper, connection, item):
+    marcar_versao(connection, 'referencias')
+
+# Usuários da sessão em cache nos processos (ver identidade.py). Só os campos da
+# cópia em cache contam: a troca de senha (e o rehash no login) não invalida nada
+CAMPOS_USUARIO_SESSAO = ('username', 'role', 'loja_id', 'setor_id')
+
+@event.listens_for(Usuario, 'after_update')
+def _usuario_alterado(mapper, connection, usuario):
+    estado = inspect(usuario)
+    if any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_USUARIO_SESSAO):
+        marcar_versao(connection, 'usuarios')
+
+@event.listens_for(Usuario, 'after_delete')
+def _usuario_excluido(mapper, connection, usuario):
+    marcar_versao(connection, 'usuarios')
+
+# Chaves de idempotência dos cadastros feitos offline: reenviar a mesma fila não duplica produtos.
+# As chaves são geradas em cada aparelho, então só são únicas por usuário.
+class RegistroIdempotencia(db.Model):
+    __tablename__ = 'idempotencia_usuario'
+    usuario_id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(64), primary_key=True)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
@@ -0,0 +1,152 @@
+import time
+from threading import Event, Lock
+
+# --- CLIENTE DO OPEN FOOD FACTS ---
+# Uma única sessão com pool de conexões persistentes, compartilhada pelos workers.
+# Buscas simultâneas do mesmo código esperam a mesma chamada externa; o timeout se
+# adapta à latência observada e um disjuntor (circuit breaker) faz as buscas
+# falharem na hora enquanto a API estiver instável. A sessão (e o requests) só é
+# criada na primeira consulta externa.
+
+
+class ErroConsultaExterna(Exception):
+    pass
+
+
+class CircuitoAberto(ErroConsultaExterna):
+    pass
+
+
+class _Chamada:
+    def __init__(self):
+        self.concluida = Event()
+        self.resultado = None
+        self.erro = None
+
+
+class ClienteOpenFoodFacts:
+    def __init__(self, url='https://world.openfoodfacts.org/api/v2/product/{barcode}.json', timeout_minimo=1.0, timeout_maximo=10.0, limite_falhas=5, tempo_aberto=30.0, tamanho_pool=10):
+        self.url = url
+        self.timeout_minimo = timeout_minimo
+        self.timeout_maximo = timeout_maximo
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.latencia_media = None
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self._chamadas = {}
+        self._sondando = False
+        self._lock = Lock()
+        self.tamanho_pool = tamanho_pool
+        self.sessao = None
+
+    def _obter_sessao(self):
+        with self._lock:
+            if self.sessao is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                self.sessao = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.tamanho_pool, max_retries=0)
+                self.sessao.mount('https://', adaptador)
+                self.sessao.mount('http://', adaptador)
+            return self.sessao
+
+    def configurar(self, app):
+        self.url = app.config['OPEN_FOOD_FACTS_URL']
+        self.timeout_minimo = app.config['OPEN_FOOD_FACTS_TIMEOUT_MIN']
+        self.timeout_maximo = app.config['OPEN_FOOD_FACTS_TIMEOUT']
+        self.limite_falhas = app.config['OPEN_FOOD_FACTS_LIMITE_FALHAS']
+        self.tempo_aberto = app.config['OPEN_FOOD_FACTS_TEMPO_ABERTO']
+        if self.tamanho_pool != app.config['OPEN_FOOD_FACTS_POOL']:
+            self.tamanho_pool, self.sessao = app.config['OPEN_FOOD_FACTS_POOL'], None
+
+    # --- Timeout adaptativo: 4x a latência média, dentro dos limites configurados ---
+    # Um timeout entra na média como timeout_maximo, senão o timeout só diminuiria e,
+    # com o upstream mais lento, todas as chamadas estourariam sem nunca reajustar.
+    @property
+    def timeout(self):
+        if self.latencia_media is None:
+            return self.timeout_maximo
+        return min(self.timeout_maximo, max(self.timeout_minimo, self.latencia_media * 4))
+
+    def _registrar_sucesso(self, latencia):
+        with self._lock:
+            self.latencia_media = latencia if self.latencia_media is None else 0.8 * self.latencia_media + 0.2 * latencia
+            self.falhas_seguidas = 0
+
+    def _registrar_falha(self, tempo_esgotado=False):
+        with self._lock:
+            if tempo_esgotado and self.latencia_media is not None:
+                self.latencia_media = 0.8 * self.latencia_media + 0.2 * self.timeout_maximo
+            self.falhas_seguidas += 1
+            if self.falhas_seguidas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto
+
+    @property
+    def estado(self):
+        if self.falhas_seguidas < self.limite_falhas:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self.aberto_ate else 'meio_aberto'
+
+    def buscar_nome(self, barcode):
+        """Devolve o nome do produto, None se não existir, ou levanta ErroConsultaExterna."""
+        sonda = False
+        with self._lock:
+            chamada = self._chamadas.get(barcode)
+            lider = chamada is None
+            if lider:
+                if self.falhas_seguidas >= self.limite_falhas:
+                    # Aberto: falha na hora. Meio aberto: uma única consulta de teste por vez
+                    if time.monotonic() < self.aberto_ate or self._sondando:
+                        raise CircuitoAberto('Open Food Facts indisponível no momento.')
+                    self._sondando = sonda = True
+                chamada = self._chamadas[barcode] = _Chamada()
+        if not lider:
+            # Sem resposta a tempo não é "não encontrado": o chamador não deve guardar no cache negativo
+            if not chamada.concluida.wait(self.timeout_maximo):
+                raise ErroConsultaExterna('Tempo esgotado esperando a consulta em andamento.')
+            if chamada.erro:
+                raise chamada.erro
+            return chamada.resultado
+        try:
+            # A consulta de teste do meio aberto usa o timeout cheio, não o ajustado pelas falhas
+            chamada.resultado = self._consultar(barcode, self.timeout_maximo if sonda else self.timeout)
+        except Exception as e:
+            chamada.erro = e if isinstance(e, ErroConsultaExterna) else ErroConsultaExterna(str(e))
+            raise
+        finally:
+            with self._lock:
+                del self._chamadas[barcode]
+                if sonda:
+                    self._sondando = False
+            chamada.concluida.set()
+        return chamada.resultado
+
+    def _consultar(self, barcode, timeout):
+        import requests
+        sessao = self._obter_sessao()
+        inicio = time.monotonic()
+        try:
+            response = sessao.get(self.url.format(barcode=barcode), timeout=timeout)
+            if response.status_code >= 500:
+                raise ErroConsultaExterna(f'Open Food Facts respondeu {response.status_code}.')
+            data = response.json() if response.status_code == 200 else {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._registrar_falha(tempo_esgotado=isinstance(e, requests.exceptions.Timeout))
+            raise ErroConsultaExterna(str(e)) from e
+        except ErroConsultaExterna:
+            self._registrar_falha()
+            raise
+        self._registrar_sucesso(time.monotonic() - inicio)
+        if data.get("status") == 1 and data.get("product"):
+            produto = data.get("product")
+            nome = (produto.get("product_name_pt") or produto.get("product_name", "")).strip()
+            if nome:
+                return nome
+        return None
+
+    def estatisticas(self):
+        return {'estado': self.estado, 'falhas_seguidas': self.falhas_seguidas, 'timeout_atual': round(self.timeout, 3), 'latencia_media': round(self.latencia_media, 3) if self.latencia_media is not None else None}
+
+
+cliente_off = ClienteOpenFoodFacts()
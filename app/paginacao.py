@@ -0,0 +1,89 @@
+from datetime import datetime
+from flask import request, current_app, url_for
+from sqlalchemy import and_, or_
+from .models import Produto
+
+# --- PAGINAÇÃO POR CHAVE (KEYSET) E FILTROS DAS LISTAGENS DE PRODUTOS ---
+# As listagens são ordenadas por (validade, id) e a próxima página começa depois
+# do último item da página atual (?apos=AAAA-MM-DD_id). Assim cada página custa o
+# mesmo, seja a primeira ou a milésima, usando os índices de validade.
+
+LIMITE_MAXIMO = 200
+
+
+def _data(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+    except ValueError:
+        return None
+
+
+def filtros_da_requisicao():
+    args = request.args
+    return {
+        'setor_id': args.get('setor_id', type=int),
+        'loja_id': args.get('loja_id', type=int),
+        'status': args.get('status') or None,
+        'validade_de': _data(args.get('validade_de')),
+        'validade_ate': _data(args.get('validade_ate')),
+        'busca': (args.get('busca') or '').strip() or None,
+    }
+
+
+def aplicar_filtros(query, filtros):
+    if filtros.get('setor_id'): query = query.filter(Produto.setor_id == filtros['setor_id'])
+    if filtros.get('loja_id'): query = query.filter(Produto.loja_id == filtros['loja_id'])
+    if filtros.get('status'): query = query.filter(Produto.status == filtros['status'])
+    if filtros.get('validade_de'): query = query.filter(Produto.validade >= filtros['validade_de'])
+    if filtros.get('validade_ate'): query = query.filter(Produto.validade <= filtros['validade_ate'])
+    if filtros.get('busca'): query = query.filter(Produto.nome_produto.ilike(f"%{filtros['busca']}%"))
+    return query
+
+
+def _ler_cursor(cursor):
+    try:
+        validade, produto_id = cursor.split('_')
+        return datetime.strptime(validade, '%Y-%m-%d').date(), int(produto_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def paginar(query, cursor=None, decrescente=False, limite=None):
+    """Devolve (produtos, proximo_cursor). proximo_cursor é None na última página."""
+    limite = max(1, min(limite or request.args.get('limite', type=int) or current_app.config['PRODUTOS_POR_PAGINA'], LIMITE_MAXIMO))
+    posicao = _ler_cursor(cursor)
+    if posicao:
+        validade, produto_id = posicao
+        if decrescente:
+            query = query.filter(or_(Produto.validade < validade, and_(Produto.validade == validade, Produto.id < produto_id)))
+        else:
+            query = query.filter(or_(Produto.validade > validade, and_(Produto.validade == validade, Produto.id > produto_id)))
+    ordem = (Produto.validade.desc(), Produto.id.desc()) if decrescente else (Produto.validade, Produto.id)
+    produtos = query.order_by(*ordem).limit(limite + 1).all()
+    proximo = None
+    if len(produtos) > limite:
+        produtos = produtos[:limite]
+        proximo = f"{produtos[-1].validade.isoformat()}_{produtos[-1].id}"
+    return produtos, proximo
+
+
+def quer_json():
+    return request.args.get('formato') == 'json' or request.accept_mimetypes.best == 'application/json'
+
+
+def produto_para_dict(produto):
+    return {
+        'id': produto.id, 'nome_produto': produto.nome_produto, 'plu': produto.plu, 'quantidade': produto.quantidade,
+        'validade': produto.validade.isoformat(), 'status': produto.status, 'motivo_rebaixa': produto.motivo_rebaixa,
+        'data_cadastro': produto.data_cadastro.isoformat(), 'loja_id': produto.loja_id, 'loja': produto.loja.nome,
+        'setor_id': produto.setor_id, 'setor': produto.setor.nome, 'cadastrado_por': produto.criado_por.nome_display,
+    }
+
+
+def url_pagina(parametro, valor=None):
+    """URL da listagem atual mantendo os filtros e trocando só o cursor `parametro` (usado nos templates)."""
+    args = request.args.to_dict()
+    args.pop(parametro, None)
+    if valor:
+        args[parametro] = valor
+    return url_for(request.endpoint, **args)
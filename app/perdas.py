@@ -0,0 +1,293 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import Date, case, cast, func, literal, select, tuple_, union_all, bindparam
+from sqlalchemy.exc import IntegrityError
+from .models import db, Produto, ProdutoArquivado, PerdaDiaria, VersaoDados, Loja, Setor, Usuario, marcar_versao
+from .banco import sessao_leitura
+from .metricas import medir
+from .ciclo_validade import STATUS_VENCIDO, STATUS_DESCARTADO
+from .arquivo import MOTIVO_RETENCAO, MOTIVO_PURGA
+
+# --- ANÁLISE DE PERDAS ---
+# Quanto foi cadastrado, quanto está em rebaixa e quanto se perdeu (vencido ou
+# descartado), por semana de cadastro e por loja, setor, autor ou produto (PLU).
+# Entram a tabela principal e o arquivo (retenção e purga, que só levam
+# vencidos/descartados; exclusões feitas pelo usuário são correções e ficam de
+# fora). O status é o atual de cada produto, já que o histórico de transições
+# não é gravado: um vencido que passou pela rebaixa conta só como perda.
+#
+# Rede, loja, setor e autor leem o agregado perda_diaria (uma linha por
+# loja/setor/dia/autor), então um ano da rede inteira soma alguns milhares de
+# linhas. O agregado é recalculado pela varredura do ciclo de validade (cron ou
+# agendador) e por `flask perdas`, só nos dias cuja versão em versao_dados mudou;
+# a análise em si só lê, e reflete os cadastros até a última varredura. Por
+# produto não há agregado (seria uma linha por produto e dia): o ranking soma por
+# PLU só os vencidos/descartados (índice por status), ordena e corta no banco, e
+# as métricas completas, com a série semanal, são lidas só para os PLUs
+# devolvidos (índice por PLU e data de cadastro).
+
+STATUS_PERDA = [STATUS_VENCIDO, STATUS_DESCARTADO]
+STATUS_REBAIXA = 'Em Rebaixa'
+DIMENSOES = ('rede', 'loja', 'setor', 'criador', 'produto')
+METRICAS = ('itens_cadastrados', 'quantidade_cadastrada', 'itens_rebaixa', 'quantidade_rebaixa', 'itens_perdidos', 'quantidade_perdida')
+SEMANAS_TENDENCIA = 4
+
+
+def _semana(coluna):
+    """Segunda-feira da semana de `coluna`, calculada no banco."""
+    if db.engine.dialect.name == 'sqlite':
+        # 'weekday 0' avança até o domingo; 6 dias antes é a segunda-feira
+        return func.date(coluna, 'weekday 0', '-6 days')
+    return cast(func.date_trunc('week', coluna), Date)
+
+
+def _como_data(valor):
+    # func.date devolve texto no SQLite
+    return valor if isinstance(valor, date) else date.fromisoformat(valor)
+
+
+# --- ORIGEM: PRODUTOS E ARQUIVO ---
+
+def _selecionar(tabela, filtros):
+    consulta = select(tabela.loja_id, tabela.setor_id, tabela.criado_por_id, tabela.plu, tabela.nome_produto, tabela.data_cadastro, tabela.status, tabela.quantidade)
+    for filtro in filtros:
+        consulta = consulta.where(filtro(tabela))
+    return consulta
+
+
+def _produtos(*filtros):
+    """Subconsulta com os produtos da tabela principal e do arquivo; cada filtro recebe a tabela."""
+    arquivados = _selecionar(ProdutoArquivado, filtros).where(ProdutoArquivado.motivo_arquivamento.in_([MOTIVO_RETENCAO, MOTIVO_PURGA]))
+    return union_all(_selecionar(Produto, filtros), arquivados).subquery()
+
+
+def _periodo(inicio, fim):
+    return lambda tabela: tabela.data_cadastro.between(inicio, fim)
+
+
+def _escopo(loja_id, setor_id):
+    filtros = []
+    if loja_id: filtros.append(lambda tabela: tabela.loja_id == loja_id)
+    if setor_id: filtros.append(lambda tabela: tabela.setor_id == setor_id)
+    return filtros
+
+
+def _somas(origem):
+    perda, rebaixa = origem.c.status.in_(STATUS_PERDA), origem.c.status == STATUS_REBAIXA
+    return [func.count().label('itens_cadastrados'), func.coalesce(func.sum(origem.c.quantidade), 0).label('quantidade_cadastrada'),
+            func.sum(case((rebaixa, 1), else_=0)).label('itens_rebaixa'), func.sum(case((rebaixa, origem.c.quantidade), else_=0)).label('quantidade_rebaixa'),
+            func.sum(case((perda, 1), else_=0)).label('itens_perdidos'), func.sum(case((perda, origem.c.quantidade), else_=0)).label('quantidade_perdida')]
+
+
+# --- AGREGADO DIÁRIO (perda_diaria) ---
+
+def _consolidar(conexao, filtros, dia=None):
+    """INSERT ... SELECT das linhas de perda_diaria dos produtos que passam nos filtros."""
+    origem = _produtos(*filtros)
+    coluna_dia = literal(dia, Date) if dia else func.date(origem.c.data_cadastro)
+    agrupamento = [origem.c.loja_id, origem.c.setor_id, origem.c.criado_por_id] + ([] if dia else [coluna_dia])
+    consulta = select(origem.c.loja_id, origem.c.setor_id, coluna_dia, origem.c.criado_por_id, *_somas(origem)).group_by(*agrupamento)
+    return conexao.execute(PerdaDiaria.__table__.insert().from_select(['loja_id', 'setor_id', 'dia', 'criado_por_id', *METRICAS], consulta)).rowcount
+
+
+def atualizar_perdas_diarias():
+    """Recalcula perda_diaria nos loja/setor/dia cuja versão dos dados mudou desde a
+    última consolidação. Devolve quantos foram recalculados."""
+    versao, perda = VersaoDados.__table__, PerdaDiaria.__table__
+    pendentes = db.session.execute(select(versao.c.loja_id, versao.c.setor_id, versao.c.dia, versao.c.versao).where(versao.c.versao_perdas.is_(None) | (versao.c.versao_perdas != versao.c.versao))).all()
+    if not pendentes:
+        return 0
+    por_dia = defaultdict(list)
+    for loja_id, setor_id, dia, _ in pendentes:
+        por_dia[dia].append((loja_id, setor_id))
+    conexao = db.session.connection()
+    try:
+        for dia, chaves in por_dia.items():
+            conexao.execute(perda.delete().where((perda.c.dia == dia) & tuple_(perda.c.loja_id, perda.c.setor_id).in_(chaves)))
+            _consolidar(conexao, [_periodo(datetime.combine(dia, time.min), datetime.combine(dia, time.max)), lambda tabela, chaves=chaves: tuple_(tabela.loja_id, tabela.setor_id).in_(chaves)], dia)
+        # Só marca como consolidada a versão lida: uma gravação no meio do caminho deixa o dia pendente
+        conexao.execute(versao.update().where((versao.c.loja_id == bindparam('b_loja')) & (versao.c.setor_id == bindparam('b_setor')) & (versao.c.dia == bindparam('b_dia')) & (versao.c.versao == bindparam('b_versao'))).values(versao_perdas=bindparam('b_versao')),
+                        [{'b_loja': l, 'b_setor': s, 'b_dia': d, 'b_versao': v} for l, s, d, v in pendentes])
+        # A ETag de /api/perdas inclui este contador: o agregado mudou sem mudar os produtos
+        marcar_versao(conexao, 'perdas')
+        db.session.commit()
+    except IntegrityError:
+        # Outro processo consolidou os mesmos dias ao mesmo tempo
+        db.session.rollback()
+    return len(pendentes)
+
+
+def reconstruir_perdas_diarias():
+    """Recalcula a tabela perda_diaria inteira numa única transação. Devolve o número de linhas."""
+    versao = VersaoDados.__table__
+    conexao = db.session.connection()
+    conexao.execute(PerdaDiaria.__table__.delete())
+    total = _consolidar(conexao, [])
+    conexao.execute(versao.update().values(versao_perdas=versao.c.versao))
+    marcar_versao(conexao, 'perdas')
+    db.session.commit()
+    return total
+
+
+# --- CONSULTAS DA ANÁLISE ---
+
+def _consulta_diaria(por, inicio, fim, loja_id, setor_id):
+    perda = PerdaDiaria.__table__
+    chave = {'rede': [], 'loja': [perda.c.loja_id], 'setor': [perda.c.setor_id], 'criador': [perda.c.criado_por_id]}[por]
+    semana = _semana(perda.c.dia)
+    consulta = select(*chave, semana, *[func.sum(perda.c[m]) for m in METRICAS]).where(perda.c.dia.between(inicio.date(), fim.date())).group_by(*chave, semana)
+    if loja_id: consulta = consulta.where(perda.c.loja_id == loja_id)
+    if setor_id: consulta = consulta.where(perda.c.setor_id == setor_id)
+    return consulta
+
+
+def _ranking_produtos(inicio, fim, loja_id, setor_id):
+    origem = _produtos(_periodo(inicio, fim), *_escopo(loja_id, setor_id), lambda tabela: tabela.status.in_(STATUS_PERDA))
+    quantidade = func.sum(origem.c.quantidade)
+    return select(origem.c.plu, func.max(origem.c.nome_produto), quantidade).group_by(origem.c.plu).order_by(quantidade.desc(), origem.c.plu)
+
+
+def _series_produtos(plus, inicio, fim, loja_id, setor_id):
+    origem = _produtos(_periodo(inicio, fim), *_escopo(loja_id, setor_id), lambda tabela: tabela.plu.in_(plus))
+    semana = _semana(origem.c.data_cadastro)
+    return select(origem.c.plu, semana, *_somas(origem)).group_by(origem.c.plu, semana)
+
+
+def _nomes(sessao, por, chaves):
+    if por == 'loja': return dict(sessao.query(Loja.id, Loja.nome).filter(Loja.id.in_(chaves)).all())
+    if por == 'setor': return dict(sessao.query(Setor.id, Setor.nome).filter(Setor.id.in_(chaves)).all())
+    if por == 'criador': return {i: Usuario.formatar_nome_display(u) for i, u in sessao.query(Usuario.id, Usuario.username).filter(Usuario.id.in_(chaves)).all()}
+    return {}
+
+
+def _metricas(valores):
+    return dict(zip(METRICAS, valores))
+
+
+def _taxa(metricas):
+    """Fração da quantidade cadastrada que se perdeu."""
+    return round(metricas['quantidade_perdida'] / metricas['quantidade_cadastrada'], 4) if metricas['quantidade_cadastrada'] else 0.0
+
+
+def semanas_do_periodo(inicio, fim):
+    """Segundas-feiras de `inicio` a `fim`, inclusive."""
+    segunda = inicio.date() - timedelta(days=inicio.weekday())
+    semanas = []
+    while segunda <= fim.date():
+        semanas.append(segunda)
+        segunda += timedelta(days=7)
+    return semanas
+
+
+def analisar_perdas(inicio, fim, por='loja', loja_id=None, setor_id=None, sessao=None, limite=None):
+    """Métricas de perda por `por` (ver DIMENSOES) e semana de cadastro, nos dias de `inicio` a `fim`.
+
+    Devolve {'semanas', 'linhas', 'total_linhas', 'totais', 'por_semana'}. As linhas
+    vêm da maior para a menor quantidade perdida, no máximo `limite`, cada uma com
+    a chave, o nome, os totais, a taxa de perda e a série semanal. Por produto, só
+    entram os PLUs com alguma perda no período."""
+    if por not in DIMENSOES:
+        raise ValueError(f'Dimensão inválida: {por}')
+    semanas = semanas_do_periodo(inicio, fim)
+    with medir('analise_perdas'):
+        if sessao is None:
+            with sessao_leitura() as sessao:
+                return _analisar(sessao, semanas, por, inicio, fim, loja_id, setor_id, limite)
+        return _analisar(sessao, semanas, por, inicio, fim, loja_id, setor_id, limite)
+
+
+def _analisar(sessao, semanas, por, inicio, fim, loja_id, setor_id, limite):
+    # Acumula em listas e guarda só as semanas com cadastro; os dicionários são
+    # montados no fim, apenas para as linhas devolvidas
+    indice, largura = {s: i for i, s in enumerate(semanas)}, len(METRICAS)
+
+    def somar(destino, valores):
+        for i, valor in enumerate(valores):
+            destino[i] += valor or 0
+
+    por_semana = [[0] * largura for _ in semanas]
+    for semana, *valores in sessao.execute(_consulta_diaria('rede', inicio, fim, loja_id, setor_id)):
+        somar(por_semana[indice[_como_data(semana)]], valores)
+    totais = [sum(s[i] for s in por_semana) for i in range(largura)]
+
+    if por == 'rede':
+        acumulado = {None: ['Rede', totais, dict(enumerate(por_semana))]}
+        total_linhas = 1
+    elif por == 'produto':
+        ranking = _ranking_produtos(inicio, fim, loja_id, setor_id)
+        acumulado = {plu: [nome, [0] * largura, {}] for plu, nome, _ in sessao.execute(ranking.limit(limite))}
+        total_linhas = sessao.execute(select(func.count()).select_from(ranking.order_by(None).subquery())).scalar() if limite else len(acumulado)
+        if acumulado:
+            for plu, semana, *valores in sessao.execute(_series_produtos(list(acumulado), inicio, fim, loja_id, setor_id)):
+                _, total, serie = acumulado[plu]
+                somar(total, valores)
+                somar(serie.setdefault(indice[_como_data(semana)], [0] * largura), valores)
+    else:
+        acumulado = {}
+        for chave, semana, *valores in sessao.execute(_consulta_diaria(por, inicio, fim, loja_id, setor_id)):
+            _, total, serie = acumulado.setdefault(chave, [None, [0] * largura, {}])
+            somar(total, valores)
+            somar(serie.setdefault(indice[_como_data(semana)], [0] * largura), valores)
+        total_linhas = len(acumulado)
+
+    ordenadas = sorted(acumulado.items(), key=lambda item: -item[1][1][METRICAS.index('quantidade_perdida')])[:limite]
+    nomes = _nomes(sessao, por, [c for c, _ in ordenadas])
+    linhas = []
+    for chave, (nome, total, serie) in ordenadas:
+        total = _metricas(total)
+        linhas.append({'chave': chave, 'nome': nome or nomes.get(chave, f'#{chave}'), 'total': total, 'taxa_perda': _taxa(total),
+                       'semanas': [_metricas(serie.get(i, [0] * largura)) for i in range(len(semanas))]})
+    totais = _metricas(totais)
+    return {'semanas': semanas, 'linhas': linhas, 'total_linhas': total_linhas, 'totais': dict(totais, taxa_perda=_taxa(totais)),
+            'por_semana': [_metricas(s) for s in por_semana]}
+
+
+# --- TENDÊNCIAS E RANKING ---
+
+def tendencia(serie):
+    """Inclinação (mínimos quadrados) da série semanal, em unidades por semana."""
+    n = len(serie)
+    if n < 2:
+        return 0.0
+    media_x, media_y = (n - 1) / 2, sum(serie) / n
+    return round(sum((x - media_x) * (y - media_y) for x, y in enumerate(serie)) / sum((x - media_x) ** 2 for x in range(n)), 2)
+
+
+def variacao_recente(serie, semanas=SEMANAS_TENDENCIA):
+    """Perda das últimas `semanas` contra as `semanas` anteriores (fração; None sem base)."""
+    recente, anterior = sum(serie[-semanas:]), sum(serie[-2 * semanas:-semanas])
+    return round((recente - anterior) / anterior, 4) if anterior else None
+
+
+def top_perdas(inicio, fim, n=10, loja_id=None, setor_id=None, sessao=None):
+    """Os `n` produtos (PLU) com a maior quantidade perdida, com taxa de perda e tendência."""
+    analise = analisar_perdas(inicio, fim, 'produto', loja_id, setor_id, sessao, limite=n)
+    produtos = []
+    for linha in analise['linhas']:
+        serie = [s['quantidade_perdida'] for s in linha['semanas']]
+        produtos.append({'plu': linha['chave'], 'nome_produto': linha['nome'], **linha['total'], 'taxa_perda': linha['taxa_perda'],
+                         'tendencia': tendencia(serie), 'variacao_recente': variacao_recente(serie), 'perda_semanal': serie})
+    serie_rede = [s['quantidade_perdida'] for s in analise['por_semana']]
+    return {'semanas': analise['semanas'], 'produtos': produtos, 'totais': analise['totais'],
+            'tendencia': tendencia(serie_rede), 'variacao_recente': variacao_recente(serie_rede)}
+
+
+def analise_para_dict(analise):
+    """Versão serializável de analisar_perdas/top_perdas: datas ISO e a semana em cada ponto da série."""
+    semanas = [s.isoformat() for s in analise['semanas']]
+    resultado = dict(analise, semanas=semanas)
+    if 'linhas' in analise:
+        resultado['linhas'] = [dict(l, semanas=[dict(m, semana=s) for s, m in zip(semanas, l['semanas'])]) for l in analise['linhas']]
+    if 'por_semana' in analise:
+        resultado['por_semana'] = [dict(m, semana=s) for s, m in zip(semanas, analise['por_semana'])]
+    return resultado
+
+
+def resumo_para_relatorio(inicio, fim, loja_id=None, setor_id=None, sessao=None, n=10):
+    """Dados da seção de perdas do relatório geral: totais, uma linha por loja (ou por
+    setor, com a loja filtrada) e os `n` produtos com maior perda."""
+    por = 'setor' if loja_id else 'loja'
+    analise = analisar_perdas(inicio, fim, por, loja_id, setor_id, sessao)
+    top = top_perdas(inicio, fim, n, loja_id, setor_id, sessao)
+    return {'por': por, 'linhas': analise['linhas'], 'totais': analise['totais'], 'produtos': top['produtos'],
+            'tendencia': top['tendencia'], 'variacao_recente': top['variacao_recente']}
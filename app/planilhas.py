@@ -0,0 +1,148 @@
+import csv
+import io
+import os
+import tempfile
+import time
+from .models import db, Produto, ProdutoCatalogo, Usuario, Loja, Setor
+from .busca_produto import salvar_catalogo
+
+# --- IMPORTAÇÃO E EXPORTAÇÃO EM CSV/XLSX ---
+# A leitura e a escrita são feitas linha a linha com geradores, então o consumo
+# de memória não depende do tamanho do arquivo ou da tabela. O suporte a XLSX usa
+# o openpyxl, importado só quando necessário.
+
+TAMANHO_LOTE_IMPORTACAO = 5000
+COLUNAS_CATALOGO = ['barcode', 'nome_produto', 'plu']
+COLUNAS_PRODUTOS = ['id', 'loja', 'setor', 'nome_produto', 'plu', 'quantidade', 'validade', 'status', 'motivo_rebaixa', 'data_cadastro', 'cadastrado_por']
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise RuntimeError('Suporte a XLSX requer o pacote openpyxl (pip install openpyxl).')
+    return openpyxl
+
+
+def formato_do_arquivo(caminho):
+    return 'xlsx' if caminho.lower().endswith('.xlsx') else 'csv'
+
+
+def ler_linhas(caminho):
+    """Gera (numero_da_linha, dict) a partir de um CSV (separador , ou ;) ou XLSX com cabeçalho."""
+    if formato_do_arquivo(caminho) == 'xlsx':
+        livro = _openpyxl().load_workbook(caminho, read_only=True)
+        try:
+            linhas = livro.active.iter_rows(values_only=True)
+            cabecalho = [str(c or '').strip().lower() for c in next(linhas, [])]
+            for numero, valores in enumerate(linhas, start=2):
+                yield numero, {cabecalho[i]: ('' if v is None else str(v)) for i, v in enumerate(valores) if i < len(cabecalho)}
+        finally:
+            livro.close()
+        return
+    with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+        amostra = arquivo.read(4096)
+        arquivo.seek(0)
+        separador = ';' if amostra.count(';') > amostra.count(',') else ','
+        leitor = csv.DictReader(arquivo, delimiter=separador)
+        leitor.fieldnames = [c.strip().lower() for c in leitor.fieldnames or []]
+        for numero, linha in enumerate(leitor, start=2):
+            yield numero, linha
+
+
+def importar_catalogo(caminho, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+    """Faz upsert do arquivo no ProdutoCatalogo em lotes. Devolve um resumo da importação."""
+    inicio = time.monotonic()
+    lote, importadas, rejeitadas = {}, 0, []
+    for numero, linha in ler_linhas(caminho):
+        barcode = (linha.get('barcode') or '').strip()
+        nome = (linha.get('nome_produto') or '').strip()
+        plu = (linha.get('plu') or '').strip() or None
+        if not barcode or not nome or len(barcode) > 50:
+            rejeitadas.append((numero, 'barcode e nome_produto são obrigatórios (barcode até 50 caracteres)'))
+            continue
+        lote[barcode] = (nome, plu)
+        if len(lote) >= tamanho_lote:
+            salvar_catalogo(lote)
+            db.session.commit()
+            importadas += len(lote)
+            lote = {}
+    if lote:
+        salvar_catalogo(lote)
+        db.session.commit()
+        importadas += len(lote)
+    duracao = time.monotonic() - inicio
+    return {'importadas': importadas, 'rejeitadas': rejeitadas, 'segundos': duracao, 'linhas_por_segundo': importadas / duracao if duracao else importadas}
+
+
+# --- EXPORTAÇÃO ---
+
+def consultar_produtos_exportacao(loja_id=None, setor_id=None, sessao=None):
+    query = (sessao or db.session).query(Produto.id, Loja.nome, Setor.nome, Produto.nome_produto, Produto.plu, Produto.quantidade, Produto.validade, Produto.status, Produto.motivo_rebaixa, Produto.data_cadastro, Usuario.username).join(Loja, Produto.loja_id == Loja.id).join(Setor, Produto.setor_id == Setor.id).join(Usuario, Produto.criado_por_id == Usuario.id)
+    if loja_id: query = query.filter(Produto.loja_id == loja_id)
+    if setor_id: query = query.filter(Produto.setor_id == setor_id)
+    return query.order_by(Produto.id).yield_per(TAMANHO_LOTE_IMPORTACAO)
+
+
+def consultar_catalogo_exportacao(sessao=None):
+    return (sessao or db.session).query(ProdutoCatalogo.barcode, ProdutoCatalogo.nome_produto, ProdutoCatalogo.plu).order_by(ProdutoCatalogo.id).yield_per(TAMANHO_LOTE_IMPORTACAO)
+
+
+def _formatar(valor):
+    if valor is None: return ''
+    if hasattr(valor, 'isoformat'): return valor.isoformat(sep=' ') if hasattr(valor, 'hour') else valor.isoformat()
+    return valor
+
+
+def gerar_csv(colunas, linhas):
+    """Gera o CSV em pedaços de texto, reaproveitando um único buffer."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(colunas)
+    for numero, linha in enumerate(linhas, start=1):
+        escritor.writerow([_formatar(v) for v in linha])
+        if numero % 1000 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0); buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gravar_xlsx(colunas, linhas, destino):
+    """Grava em modo write-only do openpyxl, que descarrega as linhas em disco conforme escreve."""
+    livro = _openpyxl().Workbook(write_only=True)
+    planilha = livro.create_sheet()
+    planilha.append(colunas)
+    total = 0
+    for linha in linhas:
+        planilha.append([_formatar(v) for v in linha])
+        total += 1
+    livro.save(destino)
+    return total
+
+
+def exportar_para_arquivo(colunas, linhas, caminho):
+    if formato_do_arquivo(caminho) == 'xlsx':
+        return gravar_xlsx(colunas, linhas, caminho)
+    total = 0
+    def contar(linhas):
+        nonlocal total
+        for linha in linhas:
+            total += 1
+            yield linha
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        for pedaco in gerar_csv(colunas, contar(linhas)):
+            arquivo.write(pedaco)
+    return total
+
+
+def xlsx_temporario(colunas, linhas):
+    """Devolve o caminho de um XLSX temporário; quem chama remove o arquivo depois de enviar."""
+    _openpyxl()
+    descritor, caminho = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descritor)
+    try:
+        gravar_xlsx(colunas, linhas, caminho)
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
@@ -0,0 +1,151 @@
+from sqlalchemy import select, union_all, func
+from .models import db, Produto, ProdutoArquivado, Usuario
+from .metricas import medir
+from .arquivo import MOTIVO_RETENCAO
+
+# --- MOTOR DE RELATÓRIOS PDF ---
+# As linhas são lidas do banco em lotes e desenhadas direto no canvas, sem montar
+# a lista completa de produtos. O canvas do ReportLab, porém, guarda todas as
+# páginas em memória até o save() (cerca de 0,4 KB por linha), então o relatório
+# para em RELATORIO_MAXIMO_LINHAS e a última página indica a exportação CSV, que
+# é gerada em streaming, para a lista completa. A renderização roda na fila de jobs (ver jobs.py),
+# que grava o PDF em disco para ser enviado ao cliente em streaming. Produtos
+# movidos para o arquivo pela retenção (ver arquivo.py) entram no relatório junto
+# com os da tabela principal. O relatório geral abre com uma página de resumo de
+# perdas (ver perdas.py). O ReportLab só é importado quando um PDF é desenhado,
+# para não pesar na inicialização da aplicação e dos comandos da CLI.
+
+TAMANHO_LOTE = 1000
+
+
+def _selecionar(tabela, coluna_id, inicio, fim, loja_id, setor_id):
+    # O autor pode ter sido excluído depois do arquivamento
+    consulta = select(tabela.loja_id, tabela.setor_id, tabela.data_cadastro, coluna_id.label('ordem'), tabela.nome_produto, tabela.validade, tabela.status,
+                      func.coalesce(Usuario.username, '-').label('username')).outerjoin(Usuario, tabela.criado_por_id == Usuario.id).where(tabela.data_cadastro.between(inicio, fim))
+    if loja_id: consulta = consulta.where(tabela.loja_id == loja_id)
+    if setor_id: consulta = consulta.where(tabela.setor_id == setor_id)
+    return consulta
+
+
+def consultar_produtos_relatorio(inicio, fim, loja_id=None, setor_id=None, sessao=None, limite=None):
+    """Consulta só as colunas que o relatório usa (tabela principal + arquivo), lida do banco em lotes.
+
+    Com `limite`, o LIMIT vai para o SQL: o banco ordena só as primeiras linhas em vez da união inteira."""
+    arquivados = _selecionar(ProdutoArquivado, ProdutoArquivado.produto_id, inicio, fim, loja_id, setor_id).where(ProdutoArquivado.motivo_arquivamento == MOTIVO_RETENCAO)
+    uniao = union_all(_selecionar(Produto, Produto.id, inicio, fim, loja_id, setor_id), arquivados).subquery()
+    query = (sessao or db.session).query(uniao.c.data_cadastro, uniao.c.nome_produto, uniao.c.validade, uniao.c.status, uniao.c.username)
+    query = query.order_by(uniao.c.loja_id, uniao.c.setor_id, uniao.c.data_cadastro, uniao.c.ordem)
+    if limite:
+        query = query.limit(limite)
+    return query.yield_per(TAMANHO_LOTE)
+
+
+def linhas_relatorio(query):
+    for data_cadastro, nome_produto, validade, status, username in query:
+        yield {'criado_por': Usuario.formatar_nome_display(username), 'data_cadastro': data_cadastro.strftime('%d/%m/%Y'), 'nome_produto': nome_produto[:45], 'validade': validade.strftime('%d/%m/%Y'), 'status': status}
+
+
+# --- FUNÇÃO HELPER PARA DESENHAR O PDF ---
+def draw_pdf_report(buffer, titulo_principal, subtitulo, linhas, resumo_perdas=None, maximo_linhas=None):
+    """Desenha o relatório e devolve (linhas desenhadas, se parou no limite `maximo_linhas`)."""
+    with medir('pdf_render'):
+        return _desenhar_pdf(buffer, titulo_principal, subtitulo, linhas, resumo_perdas, maximo_linhas)
+
+def _porcentagem(fracao):
+    return '-' if fracao is None else f"{fracao * 100:.1f}%".replace('.', ',')
+
+def _tendencia(unidades_por_semana):
+    return f"{unidades_por_semana:+.1f}".replace('.', ',') + " un./sem."
+
+def _desenhar_resumo_perdas(p, titulo_principal, subtitulo, resumo):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    width, height = letter
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(inch, height - inch, titulo_principal)
+    p.setFont("Helvetica", 10)
+    p.drawString(inch, height - inch - 20, subtitulo)
+    y = height - inch - 55
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(inch, y, "Resumo de Perdas")
+    totais = resumo['totais']
+    p.setFont("Helvetica", 9); y -= 18
+    p.drawString(inch, y, f"Cadastrado: {totais['quantidade_cadastrada']} un. ({totais['itens_cadastrados']} itens)   Em rebaixa: {totais['quantidade_rebaixa']} un.   Perdido: {totais['quantidade_perdida']} un. ({_porcentagem(totais['taxa_perda'])})")
+    y -= 14
+    p.drawString(inch, y, f"Tendência da perda: {_tendencia(resumo['tendencia'])}   Últimas 4 semanas x 4 anteriores: {_porcentagem(resumo['variacao_recente'])}")
+
+    colunas = [(0, "Loja" if resumo['por'] == 'loja' else "Setor"), (220, "Cadastrado"), (300, "Em Rebaixa"), (380, "Perdido"), (450, "% Perda")]
+    y -= 28
+    p.setFont("Helvetica-Bold", 9)
+    for x, rotulo in colunas: p.drawString(inch + x, y, rotulo)
+    y -= 5; p.line(inch, y, width - inch, y)
+    p.setFont("Helvetica", 8); y -= 13
+    for linha in resumo['linhas']:
+        if y < inch + 200: break
+        t = linha['total']
+        for (x, _), valor in zip(colunas, [str(linha['nome'])[:40], t['quantidade_cadastrada'], t['quantidade_rebaixa'], t['quantidade_perdida'], _porcentagem(linha['taxa_perda'])]):
+            p.drawString(inch + x, y, str(valor))
+        y -= 13
+
+    colunas = [(0, "PLU"), (60, "Produto"), (300, "Perdido"), (370, "% Perda"), (440, "Tendência")]
+    y -= 20
+    p.setFont("Helvetica-Bold", 9)
+    p.drawString(inch, y, "Produtos com maior perda"); y -= 16
+    for x, rotulo in colunas: p.drawString(inch + x, y, rotulo)
+    y -= 5; p.line(inch, y, width - inch, y)
+    p.setFont("Helvetica", 8); y -= 13
+    for produto in resumo['produtos']:
+        if y < inch: break
+        for (x, _), valor in zip(colunas, [produto['plu'], produto['nome_produto'][:45], produto['quantidade_perdida'], _porcentagem(produto['taxa_perda']), _tendencia(produto['tendencia'])]):
+            p.drawString(inch + x, y, str(valor))
+        y -= 13
+    if not resumo['produtos']:
+        p.drawString(inch, y, "Nenhuma perda no período.")
+    p.showPage()
+
+def _desenhar_pdf(buffer, titulo_principal, subtitulo, linhas, resumo_perdas=None, maximo_linhas=None):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    p = canvas.Canvas(buffer, pagesize=letter, pageCompression=1)
+    width, height = letter
+    p.setTitle(titulo_principal)
+    if resumo_perdas:
+        _desenhar_resumo_perdas(p, titulo_principal, subtitulo, resumo_perdas)
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(inch, height - inch, titulo_principal)
+    p.setFont("Helvetica", 10)
+    p.drawString(inch, height - inch - 20, subtitulo)
+    y = height - inch - 60
+    p.setFont("Helvetica-Bold", 9)
+    p.drawString(inch, y, "Cadastrado Por")
+    p.drawString(inch + 100, y, "Data Cadastro")
+    p.drawString(inch + 200, y, "Nome do Produto")
+    p.drawString(inch + 400, y, "Validade")
+    p.drawString(inch + 480, y, "Status")
+    y -= 5; p.line(inch, y, width - inch, y)
+    p.setFont("Helvetica", 8); y -= 15
+    total, truncado = 0, False
+    for produto_dict in linhas:
+        if maximo_linhas and total >= maximo_linhas:
+            truncado = True
+            break
+        if y < inch:
+            p.showPage(); y = height - inch - 20; p.setFont("Helvetica-Bold", 10); p.drawString(inch, y, "Continuação..."); y -= 25
+            p.setFont("Helvetica", 8)
+        p.drawString(inch, y, produto_dict['criado_por'])
+        p.drawString(inch + 100, y, produto_dict['data_cadastro'])
+        p.drawString(inch + 200, y, produto_dict['nome_produto'])
+        p.drawString(inch + 400, y, produto_dict['validade'])
+        p.drawString(inch + 480, y, produto_dict['status'])
+        y -= 15
+        total += 1
+    if not total:
+        p.drawString(inch, y, "Nenhum produto encontrado para os filtros selecionados.")
+    if truncado:
+        if y < inch + 15: p.showPage(); y = height - inch
+        p.setFont("Helvetica-Bold", 9)
+        p.drawString(inch, y - 5, f"Relatório limitado às primeiras {maximo_linhas} linhas. Use a exportação CSV para a lista completa.")
+    p.showPage()
+    p.save()
+    return total, truncado
@@ -0,0 +1,61 @@
+from datetime import date, timedelta
+from sqlalchemy import case, func
+from .models import db, Produto, ResumoValidade, Loja, Setor
+from .banco import sessao_leitura
+
+# --- PAINEL DE VALIDADES DA REDE ---
+# Consultas sobre a tabela resumo_validade (ver models.py). O tamanho dela depende
+# de lojas x setores x datas de validade x status, não do número de produtos.
+
+FAIXAS = [('vencido', 'Vencidos'), ('0-3', '0 a 3 dias'), ('4-7', '4 a 7 dias'), ('depois', 'Mais de 7 dias')]
+
+
+def _faixa(coluna_validade, hoje):
+    return case(
+        (coluna_validade < hoje, 'vencido'),
+        (coluna_validade <= hoje + timedelta(days=3), '0-3'),
+        (coluna_validade <= hoje + timedelta(days=7), '4-7'),
+        else_='depois')
+
+
+def painel_validades(hoje=None):
+    """Monta as linhas loja x setor com itens/quantidade por faixa e os totais por status."""
+    hoje = hoje or date.today()
+    faixa = _faixa(ResumoValidade.validade, hoje)
+    with sessao_leitura() as sessao:
+        dados = sessao.query(ResumoValidade.loja_id, ResumoValidade.setor_id, faixa, ResumoValidade.status, func.sum(ResumoValidade.total_itens), func.sum(ResumoValidade.total_quantidade)).group_by(ResumoValidade.loja_id, ResumoValidade.setor_id, faixa, ResumoValidade.status).all()
+        lojas = dict(sessao.query(Loja.id, Loja.nome).all())
+        setores = dict(sessao.query(Setor.id, Setor.nome).all())
+
+    linhas, por_status, totais = {}, {}, {f: [0, 0] for f, _ in FAIXAS}
+    for loja_id, setor_id, nome_faixa, status, itens, quantidade in dados:
+        linha = linhas.setdefault((loja_id, setor_id), {'loja': lojas.get(loja_id, f'#{loja_id}'), 'setor': setores.get(setor_id, f'#{setor_id}'), 'faixas': {f: [0, 0] for f, _ in FAIXAS}})
+        linha['faixas'][nome_faixa][0] += itens
+        linha['faixas'][nome_faixa][1] += quantidade
+        totais[nome_faixa][0] += itens
+        totais[nome_faixa][1] += quantidade
+        por_status.setdefault(status, [0, 0])
+        por_status[status][0] += itens
+        por_status[status][1] += quantidade
+    return {'linhas': sorted(linhas.values(), key=lambda l: (l['loja'], l['setor'])), 'totais': totais, 'por_status': por_status, 'faixas': FAIXAS}
+
+
+def _agregado_dos_produtos():
+    return db.session.query(Produto.loja_id, Produto.setor_id, Produto.validade, Produto.status, func.count(Produto.id), func.coalesce(func.sum(Produto.quantidade), 0)).group_by(Produto.loja_id, Produto.setor_id, Produto.validade, Produto.status)
+
+
+def verificar_resumo():
+    """Compara o resumo com um GROUP BY na tabela de produtos; devolve as chaves divergentes."""
+    esperado = {tuple(l[:4]): (l[4], l[5]) for l in _agregado_dos_produtos()}
+    atual = {(r.loja_id, r.setor_id, r.validade, r.status): (r.total_itens, r.total_quantidade) for r in ResumoValidade.query.all()}
+    return [(chave, esperado.get(chave), atual.get(chave)) for chave in set(esperado) | set(atual) if esperado.get(chave) != atual.get(chave)]
+
+
+def reconstruir_resumo():
+    """Recalcula a tabela de resumo inteira numa única transação."""
+    db.session.query(ResumoValidade).delete()
+    linhas = [{'loja_id': l[0], 'setor_id': l[1], 'validade': l[2], 'status': l[3], 'total_itens': l[4], 'total_quantidade': l[5]} for l in _agregado_dos_produtos()]
+    if linhas:
+        db.session.execute(ResumoValidade.__table__.insert(), linhas)
+    db.session.commit()
+    return len(linhas)
@@ -1,48 +1,38 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, current_app, abort, send_file, stream_with_context
 from flask_login import login_required, current_user
-from .models import db, Produto, Usuario, Loja, Setor, ProdutoCatalogo
-from datetime import datetime, date, time
+from .models import db, Produto, Usuario, Loja, ProdutoCatalogo, RelatorioJob
+from datetime import datetime, date, time, timedelta
 from sqlalchemy import cast, Date
-import io
-import requests
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
+import gzip
+import json
+import os
+from .jobs import enfileirar_relatorio, job_para_dict, pode_acessar_job, caminho_arquivo
+from .busca_produto import buscar_produto, invalidar_barcode, estatisticas as estatisticas_busca
+from .cadastro_lote import validar_itens, cadastrar_lote, TAMANHO_MAXIMO_LOTE
+from . import planilhas, busca_texto, catalogo_offline
+from .resumo import painel_validades
+from .paginacao import filtros_da_requisicao, aplicar_filtros, paginar, quer_json, produto_para_dict, url_pagina
+from .banco import linhas_leitura
+from .ciclo_validade import STATUS_ATIVOS, filtro_ativos, filtro_vencidos, status_para_validade
+from .eventos import obter_broker, transmitir, eventos_desde, ultimo_evento, resposta_lotada, LIMITE_REENVIO
+from .identidade import invalidar_usuario
+from .cache_http import condicional, contador_produtos, referencias, versoes_dados
+from .acoes_em_massa import alterar_status_em_massa, excluir_em_massa, purgar_vencidos, MAXIMO_IDS
+from .perdas import analisar_perdas, top_perdas, analise_para_dict, DIMENSOES
 
 routes = Blueprint('routes', __name__)
+routes.add_app_template_global(url_pagina)
 
-# --- FUNÇÃO HELPER PARA DESENHAR O PDF ---
-def draw_pdf_report(buffer, titulo_principal, subtitulo, lista_produtos):
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    p.setTitle(titulo_principal)
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(inch, height - inch, titulo_principal)
-    p.setFont("Helvetica", 10)
-    p.drawString(inch, height - inch - 20, subtitulo)
-    y = height - inch - 60
-    p.setFont("Helvetica-Bold", 9)
-    p.drawString(inch, y, "Cadastrado Por")
-    p.drawString(inch + 100, y, "Data Cadastro")
-    p.drawString(inch + 200, y, "Nome do Produto")
-    p.drawString(inch + 400, y, "Validade")
-    p.drawString(inch + 480, y, "Status")
-    y -= 5; p.line(inch, y, width - inch, y)
-    p.setFont("Helvetica", 8); y -= 15
-    if not lista_produtos:
-        p.drawString(inch, y, "Nenhum produto encontrado para os filtros selecionados.")
-    else:
-        for produto_dict in lista_produtos:
-            if y < inch:
-                p.showPage(); y = height - inch - 20; p.setFont("Helvetica-Bold", 10); p.drawString(inch, y, "Continuação..."); y -= 25
-            p.drawString(inch, y, produto_dict['criado_por'])
-            p.drawString(inch + 100, y, produto_dict['data_cadastro'])
-            p.drawString(inch + 200, y, produto_dict['nome_produto'])
-            p.drawString(inch + 400, y, produto_dict['validade'])
-            p.drawString(inch + 480, y, produto_dict['status'])
-            y -= 15
-    p.showPage()
-    p.save()
+# --- HELPER PARA CARREGAR OS RELACIONAMENTOS USADOS NOS TEMPLATES ---
+# Evita um SELECT extra por linha ao acessar produto.setor, produto.loja e produto.criado_por
+def produtos_com_relacionamentos():
+    return Produto.query.options(joinedload(Produto.setor), joinedload(Produto.loja), joinedload(Produto.criado_por))
+
+# Contador dos produtos visíveis para o cargo (ETag das listagens, ver cache_http.py)
+def _contador_do_cargo():
+    return contador_produtos(current_user.loja_id if current_user.role in ['gerente', 'encarregado_setor'] else None)
 
 # --- ROTA PRINCIPAL E DASHBOARDS ---
 
@@ -73,12 +63,14 @@ def dashboard():
 # --- ROTAS DO GERENTE GERAL ---
 @routes.route('/gerente-geral/dashboard')
 @login_required
+@condicional(_contador_do_cargo, 'referencias')
 def dashboard_gerente_geral():
     if current_user.role != 'gerente_geral': return redirect(url_for('routes.index'))
-    return render_template('gerente_geral/dashboard.html')
+    return render_template('gerente_geral/dashboard.html', painel=painel_validades())
 
 @routes.route('/gerente-geral/lojas', methods=['GET', 'POST'])
 @login_required
+@condicional('referencias')
 def gerenciar_lojas():
     if current_user.role != 'gerente_geral': return redirect(url_for('routes.index'))
     if request.method == 'POST':
@@ -101,6 +93,7 @@ def editar_loja(loja_id):
     loja = Loja.query.get_or_404(loja_id)
     loja.nome, loja.cnpj, loja.endereco, loja.cidade, loja.estado = request.form.get('nome'), request.form.get('cnpj'), request.form.get('endereco'), request.form.get('cidade'), request.form.get('estado')
     db.session.commit()
+    invalidar_usuario()
     flash('Dados da loja atualizados com sucesso!', 'success')
     return redirect(url_for('routes.gerenciar_lojas'))
 
@@ -137,8 +130,7 @@ def gerenciar_usuarios_geral():
             flash(f'Usuário "{username}" criado com sucesso!', 'success')
         return redirect(url_for('routes.gerenciar_usuarios_geral'))
     usuarios = Usuario.query.filter(Usuario.role != 'gerente_geral').order_by(Usuario.loja_id).all()
-    lojas = Loja.query.all()
-    setores = Setor.query.all()
+    lojas, setores = referencias()
     return render_template('gerente_geral/gerenciar_usuarios.html', usuarios=usuarios, lojas=lojas, setores=setores)
 
 @routes.route('/gerente-geral/usuario/editar/<int:usuario_id>', methods=['POST'])
@@ -152,6 +144,7 @@ def editar_usuario(usuario_id):
     if usuario.role == 'gerente_trocas': usuario.loja_id = None
     if usuario.role != 'encarregado_setor': usuario.setor_id = None
     db.session.commit()
+    invalidar_usuario(usuario.id)
     flash('Usuário atualizado com sucesso!', 'success')
     return redirect(url_for('routes.gerenciar_usuarios_geral'))
 
@@ -162,6 +155,7 @@ def excluir_usuario(usuario_id):
     usuario_para_excluir = Usuario.query.get_or_404(usuario_id)
     db.session.delete(usuario_para_excluir)
     db.session.commit()
+    invalidar_usuario(usuario_id)
     flash(f'Usuário "{usuario_para_excluir.username}" foi excluído.', 'success')
     return redirect(url_for('routes.gerenciar_usuarios_geral'))
 
@@ -170,25 +164,38 @@ def excluir_usuario(usuario_id):
 
 @routes.route('/gerente/dashboard')
 @login_required
+@condicional(_contador_do_cargo, 'referencias')
 def dashboard_gerente():
     if current_user.role != 'gerente': return redirect(url_for('routes.index'))
-    produtos_para_rebaixa = Produto.query.filter(Produto.loja_id == current_user.loja_id, Produto.status == 'Para Rebaixa', Produto.validade >= date.today()).order_by(Produto.validade).all()
-    produtos_em_rebaixa = Produto.query.filter(Produto.loja_id == current_user.loja_id, Produto.status == 'Em Rebaixa', Produto.validade >= date.today()).order_by(Produto.validade).all()
-    return render_template('gerente/dashboard_gerente.html', produtos_para_rebaixa=produtos_para_rebaixa, produtos_em_rebaixa=produtos_em_rebaixa, now=datetime.now())
+    filtros = dict(filtros_da_requisicao(), loja_id=current_user.loja_id, status=None)
+    query = aplicar_filtros(produtos_com_relacionamentos(), filtros)
+    query = query.filter(filtro_ativos())
+    produtos_para_rebaixa, proximo_para_rebaixa = paginar(query.filter(Produto.status == 'Para Rebaixa'), request.args.get('apos_para_rebaixa'))
+    produtos_em_rebaixa, proximo_em_rebaixa = paginar(query.filter(Produto.status == 'Em Rebaixa'), request.args.get('apos_em_rebaixa'))
+    if quer_json():
+        return jsonify({'para_rebaixa': {'produtos': [produto_para_dict(p) for p in produtos_para_rebaixa], 'proximo': proximo_para_rebaixa},
+                        'em_rebaixa': {'produtos': [produto_para_dict(p) for p in produtos_em_rebaixa], 'proximo': proximo_em_rebaixa}})
+    _, setores = referencias()
+    return render_template('gerente/dashboard_gerente.html', produtos_para_rebaixa=produtos_para_rebaixa, produtos_em_rebaixa=produtos_em_rebaixa, proximo_para_rebaixa=proximo_para_rebaixa, proximo_em_rebaixa=proximo_em_rebaixa, setores=setores, now=datetime.now())
 
 @routes.route('/gerente/cadastrar')
 @login_required
 def cadastrar_produto_gerente():
     if current_user.role != 'gerente': return redirect(url_for('routes.index'))
-    setores = Setor.query.order_by(Setor.nome).all()
+    _, setores = referencias()
     return render_template('gerente/cadastrar_produto.html', setores=setores)
 
 @routes.route('/encarregado/produtos')
 @login_required
+@condicional(_contador_do_cargo)
 def listar_produtos_encarregado():
     if current_user.role != 'encarregado_setor': return redirect(url_for('routes.index'))
-    produtos = Produto.query.filter(Produto.loja_id == current_user.loja_id, Produto.setor_id == current_user.setor_id, Produto.validade >= date.today()).order_by(Produto.validade).all()
-    return render_template('encarregado/listar_produtos.html', produtos=produtos, now=datetime.now())
+    filtros = dict(filtros_da_requisicao(), loja_id=current_user.loja_id, setor_id=current_user.setor_id)
+    query = aplicar_filtros(produtos_com_relacionamentos().filter(filtro_ativos()), filtros)
+    produtos, proximo = paginar(query, request.args.get('apos'))
+    if quer_json():
+        return jsonify({'produtos': [produto_para_dict(p) for p in produtos], 'proximo': proximo})
+    return render_template('encarregado/listar_produtos.html', produtos=produtos, proximo=proximo, now=datetime.now())
 
 @routes.route('/encarregado/cadastrar')
 @login_required
@@ -198,37 +205,47 @@ def cadastrar_produto_encarregado():
 
 @routes.route('/encarregado/vencidos')
 @login_required
+@condicional(_contador_do_cargo)
 def vencidos_encarregado():
     if current_user.role != 'encarregado_setor': return redirect(url_for('routes.index'))
-    produtos_vencidos = Produto.query.filter(Produto.loja_id == current_user.loja_id, Produto.setor_id == current_user.setor_id, Produto.validade < date.today()).order_by(Produto.validade.desc()).all()
-    return render_template('encarregado/produtos_vencidos.html', produtos=produtos_vencidos, today=date.today())
+    filtros = dict(filtros_da_requisicao(), loja_id=current_user.loja_id, setor_id=current_user.setor_id)
+    query = aplicar_filtros(produtos_com_relacionamentos().filter(filtro_vencidos()), filtros)
+    produtos_vencidos, proximo = paginar(query, request.args.get('apos'), decrescente=True)
+    if quer_json():
+        return jsonify({'produtos': [produto_para_dict(p) for p in produtos_vencidos], 'proximo': proximo})
+    return render_template('encarregado/produtos_vencidos.html', produtos=produtos_vencidos, proximo=proximo, today=date.today())
 
 @routes.route('/auxiliar/dashboard')
 @login_required
+@condicional('referencias')
 def dashboard_auxiliar():
     if current_user.role != 'auxiliar_gestao': return redirect(url_for('routes.index'))
-    setores = Setor.query.all()
+    _, setores = referencias()
     return render_template('auxiliar/dashboard_auxiliar.html', setores=setores)
 
 @routes.route('/gerente-trocas/dashboard')
 @login_required
+@condicional('referencias')
 def dashboard_gerente_trocas():
     if current_user.role != 'gerente_trocas': return redirect(url_for('routes.index'))
-    lojas = Loja.query.order_by(Loja.nome).all()
-    setores = Setor.query.order_by(Setor.nome).all()
+    lojas, setores = referencias()
     return render_template('gerente_trocas/dashboard_trocas.html', lojas=lojas, setores=setores)
 
 @routes.route('/produtos/vencidos')
 @login_required
+@condicional(_contador_do_cargo, 'referencias')
 def pagina_produtos_vencidos():
     if current_user.role not in ['gerente', 'gerente_geral', 'gerente_trocas']: return redirect(url_for('routes.index'))
-    query = Produto.query.filter(Produto.validade < date.today())
+    filtros = filtros_da_requisicao()
+    if current_user.role == 'gerente': filtros['loja_id'] = current_user.loja_id
+    query = aplicar_filtros(produtos_com_relacionamentos().filter(filtro_vencidos()), filtros)
+    produtos_vencidos, proximo = paginar(query, request.args.get('apos'), decrescente=True)
+    if quer_json():
+        return jsonify({'produtos': [produto_para_dict(p) for p in produtos_vencidos], 'proximo': proximo})
+    lojas, setores = referencias()
     if current_user.role == 'gerente':
-        query = query.filter(Produto.loja_id == current_user.loja_id)
-        produtos_vencidos = query.order_by(Produto.validade.desc()).all()
-        return render_template('gerente/produtos_vencidos.html', produtos=produtos_vencidos, today=date.today())
-    produtos_vencidos = query.order_by(Produto.loja_id, Produto.validade.desc()).all()
-    return render_template('geral/produtos_vencidos.html', produtos=produtos_vencidos, today=date.today())
+        return render_template('gerente/produtos_vencidos.html', produtos=produtos_vencidos, proximo=proximo, setores=setores, today=date.today())
+    return render_template('geral/produtos_vencidos.html', produtos=produtos_vencidos, proximo=proximo, setores=setores, lojas=lojas, today=date.today())
 
 # --- ROTAS DE AÇÕES DE PRODUTOS ---
 
@@ -249,6 +266,7 @@ def cadastrar_produto():
             catalogo_item.nome_produto, catalogo_item.plu = nome_produto, plu
         else:
             db.session.add(ProdutoCatalogo(barcode=barcode, nome_produto=nome_produto, plu=plu))
+        invalidar_barcode(barcode)
     novo_produto = Produto(nome_produto=nome_produto, plu=plu, quantidade=int(quantidade), validade=datetime.strptime(validade_str, '%Y-%m-%d').date(), motivo_rebaixa=motivo_rebaixa, setor_id=int(setor_id), loja_id=current_user.loja_id, criado_por_id=current_user.id)
     db.session.add(novo_produto)
     db.session.commit()
@@ -257,6 +275,29 @@ def cadastrar_produto():
     elif current_user.role == 'encarregado_setor': return redirect(url_for('routes.cadastrar_produto_encarregado'))
     else: return redirect(url_for('routes.dashboard_auxiliar'))
 
+@routes.route('/api/produtos/lote', methods=['POST'])
+@login_required
+def api_cadastrar_lote():
+    if current_user.role not in ['gerente', 'encarregado_setor', 'auxiliar_gestao']:
+        return jsonify({"erro": "Você não tem permissão para cadastrar produtos."}), 403
+    dados = request.get_json(silent=True) or {}
+    itens = dados.get('itens')
+    if not isinstance(itens, list) or not itens:
+        return jsonify({"erro": "Envie uma lista de itens em 'itens'."}), 400
+    if len(itens) > TAMANHO_MAXIMO_LOTE:
+        return jsonify({"erro": f"O lote pode ter no máximo {TAMANHO_MAXIMO_LOTE} itens."}), 400
+    # Itens com chave de idempotência já gravada (fila offline reenviada) são ignorados
+    itens, repetidos = catalogo_offline.separar_repetidos(itens, current_user.id)
+    linhas, catalogo, erros = validar_itens(itens, current_user)
+    if erros:
+        return jsonify({"cadastrados": 0, "repetidos": repetidos, "erros": erros}), 400
+    try:
+        cadastrar_lote(linhas, catalogo, catalogo_offline.chaves_do_lote(itens), current_user.id)
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"erro": "Este lote já está sendo gravado; reenvie para confirmar."}), 409
+    return jsonify({"cadastrados": len(linhas), "repetidos": repetidos, "erros": []}), 201 if linhas else 200
+
 @routes.route('/produtos/<int:produto_id>/editar', methods=['POST'])
 @login_required
 def editar_produto(produto_id):
@@ -266,6 +307,7 @@ def editar_produto(produto_id):
         flash('Você só pode editar produtos do seu setor.', 'danger')
         return redirect(url_for('routes.listar_produtos_encarregado'))
     produto.nome_produto, produto.plu, produto.quantidade, produto.validade, produto.motivo_rebaixa = request.form.get('nome_produto'), request.form.get('plu'), int(request.form.get('quantidade')), datetime.strptime(request.form.get('validade'), '%Y-%m-%d').date(), request.form.get('motivo_rebaixa')
+    produto.status = status_para_validade(current_app, produto.status, produto.validade)
     db.session.commit()
     flash('Produto atualizado com sucesso!', 'success')
     return redirect(url_for('routes.listar_produtos_encarregado'))
@@ -277,11 +319,12 @@ def alterar_status(produto_id):
     produto = Produto.query.get_or_404(produto_id)
     if produto.loja_id != current_user.loja_id: return redirect(url_for('routes.dashboard_gerente'))
     novo_status = request.form.get('status')
-    if novo_status in ['Para Rebaixa', 'Em Rebaixa']:
-        produto.status = novo_status
-        db.session.commit()
+    if novo_status not in STATUS_ATIVOS: flash('Status inválido.', 'danger')
+    # Mesmo caminho da ação em massa: vencido ou descartado não volta para a rebaixa
+    elif produto.status not in STATUS_ATIVOS or produto.validade < date.today(): flash(f'O produto {produto.nome_produto} já está vencido.', 'danger')
+    else:
+        alterar_status_em_massa([produto.id], novo_status, current_user)
         flash(f'Status do produto {produto.nome_produto} alterado.', 'success')
-    else: flash('Status inválido.', 'danger')
     return redirect(url_for('routes.dashboard_gerente'))
 
 @routes.route('/produtos/<int:produto_id>/excluir', methods=['POST'])
@@ -291,84 +334,277 @@ def excluir_produto(produto_id):
     produto = Produto.query.get_or_404(produto_id)
     if current_user.role == 'encarregado_setor' and (produto.loja_id != current_user.loja_id or produto.setor_id != current_user.setor_id):
         return redirect(url_for('routes.listar_produtos_encarregado'))
-    db.session.delete(produto)
-    db.session.commit()
+    excluir_em_massa([produto.id], current_user)
     flash('Produto excluído com sucesso!', 'success')
     return redirect(request.referrer or url_for('routes.index'))
 
 
+# --- AÇÕES EM MASSA (ver acoes_em_massa.py) ---
+# Aceitam o formulário das listagens (checkboxes produto_ids) ou JSON ({"ids": [...]}).
+
+def _campo_da_acao(nome):
+    dados = request.get_json(silent=True) if request.is_json else None
+    return (dados or {}).get(nome) if dados is not None else request.form.get(nome)
+
+def _ids_da_acao():
+    dados = request.get_json(silent=True) if request.is_json else None
+    valores = (dados or {}).get('ids') if dados is not None else request.form.getlist('produto_ids')
+    try:
+        ids = {int(v) for v in valores or []}
+    except (TypeError, ValueError):
+        return None
+    return ids if 0 < len(ids) <= MAXIMO_IDS else None
+
+def _responder_acao(mensagem, categoria, destino, codigo=200, **dados):
+    if request.is_json or quer_json():
+        return jsonify(dados if codigo < 400 else {"erro": mensagem}), codigo
+    flash(mensagem, categoria)
+    return redirect(request.referrer or destino)
+
+@routes.route('/produtos/status/lote', methods=['POST'])
+@login_required
+def alterar_status_lote():
+    if current_user.role != 'gerente': return redirect(url_for('routes.index'))
+    ids, novo_status = _ids_da_acao(), _campo_da_acao('status')
+    if ids is None or novo_status not in STATUS_ATIVOS:
+        return _responder_acao(f'Selecione de 1 a {MAXIMO_IDS} produtos e um status válido.', 'danger', url_for('routes.dashboard_gerente'), 400)
+    alterados = alterar_status_em_massa(ids, novo_status, current_user)
+    return _responder_acao(f'{alterados} produto(s) agora {novo_status}.', 'success', url_for('routes.dashboard_gerente'), alterados=alterados, ignorados=len(ids) - alterados)
+
+@routes.route('/produtos/excluir/lote', methods=['POST'])
+@login_required
+def excluir_produtos_lote():
+    if current_user.role not in ['encarregado_setor', 'gerente_geral']: return redirect(url_for('routes.index'))
+    ids = _ids_da_acao()
+    if ids is None:
+        return _responder_acao(f'Selecione de 1 a {MAXIMO_IDS} produtos.', 'danger', url_for('routes.index'), 400)
+    excluidos = excluir_em_massa(ids, current_user)
+    return _responder_acao(f'{excluidos} produto(s) excluído(s).', 'success', url_for('routes.index'), excluidos=excluidos, ignorados=len(ids) - excluidos)
+
+@routes.route('/produtos/vencidos/purgar', methods=['POST'])
+@login_required
+def purgar_produtos_vencidos():
+    if current_user.role not in ['gerente', 'gerente_geral']: return redirect(url_for('routes.index'))
+    dias, loja_id = _campo_da_acao('dias'), _campo_da_acao('loja_id')
+    try:
+        dias = int(dias)
+        loja_id = current_user.loja_id if current_user.role == 'gerente' else (int(loja_id) if loja_id and loja_id != 'todas' else None)
+    except (TypeError, ValueError):
+        dias = -1
+    if dias < 0:
+        return _responder_acao('Informe a quantidade de dias (0 ou mais) e a loja.', 'danger', url_for('routes.pagina_produtos_vencidos'), 400)
+    excluidos = purgar_vencidos(current_user, dias, loja_id)
+    return _responder_acao(f'{excluidos} produto(s) vencido(s) há mais de {dias} dia(s) excluído(s).', 'success', url_for('routes.pagina_produtos_vencidos'), excluidos=excluidos)
+
+
 # --- ROTAS DE RELATÓRIOS E API ---
 
+# Implementação única dos três relatórios; cada rota só define o escopo do cargo.
+# O PDF é gerado na fila de jobs: se já existe no cache é enviado na hora, senão
+# devolvemos o job (JSON) ou uma página que acompanha o processamento.
+def _gerar_relatorio_pdf(escopo, titulo, nome_arquivo, rota_erro, loja_id=None, setor_id=None):
+    data_inicio_str, data_fim_str = request.args.get('data_inicio'), request.args.get('data_fim')
+    if not data_inicio_str or not data_fim_str:
+        flash('Datas são obrigatórias.', 'danger')
+        return redirect(rota_erro)
+    parametros = {'escopo': escopo, 'titulo': titulo, 'nome_arquivo': nome_arquivo, 'loja_id': loja_id, 'setor_id': setor_id, 'data_inicio': data_inicio_str, 'data_fim': data_fim_str}
+    # O relatório geral abre com o resumo de perdas do período (ver perdas.py)
+    if escopo == 'geral': parametros['resumo_perdas'] = True
+    job = enfileirar_relatorio(current_app._get_current_object(), parametros)
+    if job.status == 'concluido':
+        return redirect(url_for('routes.download_relatorio_job', job_id=job.id))
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job_para_dict(job)), 202
+    return render_template('geral/relatorio_aguardando.html', job=job)
+
 @routes.route('/encarregado/relatorio/pdf')
 @login_required
 def gerar_relatorio_encarregado_pdf():
     if current_user.role != 'encarregado_setor': return redirect(url_for('routes.index'))
-    data_inicio_str, data_fim_str = request.args.get('data_inicio'), request.args.get('data_fim')
-    if not data_inicio_str or not data_fim_str:
-        flash('Datas são obrigatórias.', 'danger')
-        return redirect(url_for('routes.listar_produtos_encarregado'))
-    start_datetime = datetime.combine(datetime.strptime(data_inicio_str, '%Y-%m-%d').date(), time.min)
-    end_datetime = datetime.combine(datetime.strptime(data_fim_str, '%Y-%m-%d').date(), time.max)
-    produtos_db = Produto.query.join(Usuario).filter(Produto.loja_id == current_user.loja_id, Produto.setor_id == current_user.setor_id, Produto.data_cadastro.between(start_datetime, end_datetime)).order_by(Produto.data_cadastro).all()
-    lista_simples = [{'criado_por': p.criado_por.nome_display, 'data_cadastro': p.data_cadastro.strftime('%d/%m/%Y'), 'nome_produto': p.nome_produto[:45], 'validade': p.validade.strftime('%d/%m/%Y'), 'status': p.status} for p in produtos_db]
-    buffer = io.BytesIO()
-    draw_pdf_report(buffer, f"Relatório do Setor: {current_user.setor.nome}", f"Produtos cadastrados de {data_inicio_str} a {data_fim_str}", lista_simples)
-    buffer.seek(0)
-    return Response(buffer, mimetype='application/pdf', headers={'Content-Disposition': 'inline;filename=relatorio_setor.pdf'})
+    return _gerar_relatorio_pdf('setor', f"Relatório do Setor: {current_user.setor.nome}", 'relatorio_setor.pdf', url_for('routes.listar_produtos_encarregado'), loja_id=current_user.loja_id, setor_id=current_user.setor_id)
 
 @routes.route('/gerente/relatorio/pdf')
 @login_required
 def gerar_relatorio_gerente_pdf():
     if current_user.role != 'gerente': return redirect(url_for('routes.index'))
-    data_inicio_str, data_fim_str = request.args.get('data_inicio'), request.args.get('data_fim')
-    if not data_inicio_str or not data_fim_str:
-        flash('Datas são obrigatórias.', 'danger')
-        return redirect(url_for('routes.dashboard_gerente'))
-    start_datetime = datetime.combine(datetime.strptime(data_inicio_str, '%Y-%m-%d').date(), time.min)
-    end_datetime = datetime.combine(datetime.strptime(data_fim_str, '%Y-%m-%d').date(), time.max)
-    produtos_db = Produto.query.join(Usuario).filter(Produto.loja_id == current_user.loja_id, Produto.data_cadastro.between(start_datetime, end_datetime)).order_by(Produto.setor_id, Produto.data_cadastro).all()
-    lista_simples = [{'criado_por': p.criado_por.nome_display, 'data_cadastro': p.data_cadastro.strftime('%d/%m/%Y'), 'nome_produto': p.nome_produto[:45], 'validade': p.validade.strftime('%d/%m/%Y'), 'status': p.status} for p in produtos_db]
-    buffer = io.BytesIO()
-    draw_pdf_report(buffer, f"Relatório da Loja: {current_user.loja.nome}", f"Produtos cadastrados de {data_inicio_str} a {data_fim_str}", lista_simples)
-    buffer.seek(0)
-    return Response(buffer, mimetype='application/pdf', headers={'Content-Disposition': 'inline;filename=relatorio_loja.pdf'})
+    return _gerar_relatorio_pdf('loja', f"Relatório da Loja: {current_user.loja.nome}", 'relatorio_loja.pdf', url_for('routes.dashboard_gerente'), loja_id=current_user.loja_id)
 
 @routes.route('/relatorio/pdf')
 @login_required
 def gerar_relatorio_pdf():
     if current_user.role not in ['gerente_geral', 'gerente_trocas']: return redirect(url_for('routes.index'))
-    data_inicio_str, data_fim_str, loja_id, setor_id = request.args.get('data_inicio'), request.args.get('data_fim'), request.args.get('loja_id'), request.args.get('setor_id')
-    if not data_inicio_str or not data_fim_str:
-        flash('Datas são obrigatórias.', 'danger')
-        return redirect(request.referrer)
-    start_datetime = datetime.combine(datetime.strptime(data_inicio_str, '%Y-%m-%d').date(), time.min)
-    end_datetime = datetime.combine(datetime.strptime(data_fim_str, '%Y-%m-%d').date(), time.max)
-    query = Produto.query.join(Usuario).filter(Produto.data_cadastro.between(start_datetime, end_datetime))
-    if loja_id and loja_id != 'todas': query = query.filter(Produto.loja_id == int(loja_id))
-    if setor_id and setor_id != 'todos': query = query.filter(Produto.setor_id == int(setor_id))
-    produtos_db = query.order_by(Produto.loja_id, Produto.setor_id, Produto.data_cadastro).all()
-    lista_simples = [{'criado_por': p.criado_por.nome_display, 'data_cadastro': p.data_cadastro.strftime('%d/%m/%Y'), 'nome_produto': p.nome_produto[:45], 'validade': p.validade.strftime('%d/%m/%Y'), 'status': p.status} for p in produtos_db]
-    buffer = io.BytesIO()
-    draw_pdf_report(buffer, "Relatório Geral de Produtos", f"Produtos cadastrados de {data_inicio_str} a {data_fim_str}", lista_simples)
-    buffer.seek(0)
-    return Response(buffer, mimetype='application/pdf', headers={'Content-Disposition': 'inline;filename=relatorio_geral_cadastro.pdf'})
+    loja_id, setor_id = request.args.get('loja_id'), request.args.get('setor_id')
+    loja_id = int(loja_id) if loja_id and loja_id != 'todas' else None
+    setor_id = int(setor_id) if setor_id and setor_id != 'todos' else None
+    return _gerar_relatorio_pdf('geral', "Relatório Geral de Produtos", 'relatorio_geral_cadastro.pdf', request.referrer or url_for('routes.index'), loja_id=loja_id, setor_id=setor_id)
+
+
+@routes.route('/relatorios/jobs/<string:job_id>')
+@login_required
+def status_relatorio_job(job_id):
+    job = RelatorioJob.query.get_or_404(job_id)
+    if not pode_acessar_job(job, current_user): abort(403)
+    return jsonify(job_para_dict(job))
+
+@routes.route('/relatorios/jobs/<string:job_id>/download')
+@login_required
+def download_relatorio_job(job_id):
+    job = RelatorioJob.query.get_or_404(job_id)
+    if not pode_acessar_job(job, current_user): abort(403)
+    caminho = caminho_arquivo(current_app, job)
+    if job.status != 'concluido' or not os.path.exists(caminho): abort(404)
+    return send_file(caminho, mimetype='application/pdf', download_name=json.loads(job.parametros)['nome_arquivo'], conditional=True)
+
+
+# --- EXPORTAÇÃO CSV/XLSX ---
+
+def _responder_planilha(colunas, linhas, nome_base):
+    if request.args.get('formato') == 'xlsx':
+        try:
+            caminho = planilhas.xlsx_temporario(colunas, linhas)
+        except RuntimeError as e:
+            return jsonify({"erro": str(e)}), 501
+        resposta = send_file(caminho, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', as_attachment=True, download_name=f'{nome_base}.xlsx')
+        resposta.call_on_close(lambda: os.remove(caminho))
+        return resposta
+    return Response(stream_with_context(planilhas.gerar_csv(colunas, linhas)), mimetype='text/csv', headers={'Content-Disposition': f'attachment;filename={nome_base}.csv'})
+
+@routes.route('/exportar/produtos')
+@login_required
+def exportar_produtos():
+    if current_user.role in ['gerente_geral', 'gerente_trocas']:
+        loja_id, setor_id = request.args.get('loja_id', type=int), request.args.get('setor_id', type=int)
+    elif current_user.role == 'gerente':
+        loja_id, setor_id = current_user.loja_id, request.args.get('setor_id', type=int)
+    elif current_user.role == 'encarregado_setor':
+        loja_id, setor_id = current_user.loja_id, current_user.setor_id
+    else:
+        return redirect(url_for('routes.index'))
+    return _responder_planilha(planilhas.COLUNAS_PRODUTOS, linhas_leitura(planilhas.consultar_produtos_exportacao, loja_id, setor_id), 'produtos')
+
+@routes.route('/exportar/catalogo')
+@login_required
+def exportar_catalogo():
+    if current_user.role != 'gerente_geral': return redirect(url_for('routes.index'))
+    return _responder_planilha(planilhas.COLUNAS_CATALOGO, linhas_leitura(planilhas.consultar_catalogo_exportacao), 'catalogo')
+
+
+# --- ANÁLISE DE PERDAS (ver perdas.py) ---
+# Período por data de cadastro (padrão: últimas 12 semanas); o cargo limita a loja/setor.
+
+def _parametros_perdas():
+    hoje = date.today()
+    try:
+        inicio = datetime.strptime(request.args.get('data_inicio') or (hoje - timedelta(weeks=12)).isoformat(), '%Y-%m-%d')
+        fim = datetime.combine(datetime.strptime(request.args.get('data_fim') or hoje.isoformat(), '%Y-%m-%d').date(), time.max)
+    except ValueError:
+        return None
+    if inicio > fim or (fim - inicio).days > 366 * 2: return None
+    loja_id, setor_id = request.args.get('loja_id', type=int), request.args.get('setor_id', type=int)
+    if current_user.role == 'gerente': loja_id = current_user.loja_id
+    elif current_user.role == 'encarregado_setor': loja_id, setor_id = current_user.loja_id, current_user.setor_id
+    elif current_user.role not in ['gerente_geral', 'gerente_trocas']: abort(403)
+    return inicio, fim, loja_id, setor_id
+
+@routes.route('/api/perdas')
+@login_required
+@condicional(_contador_do_cargo, 'referencias', 'perdas')
+def api_perdas():
+    parametros, por = _parametros_perdas(), request.args.get('por', 'loja')
+    if parametros is None or por not in DIMENSOES:
+        return jsonify({"erro": f"Informe data_inicio e data_fim (AAAA-MM-DD, até 2 anos) e por = {', '.join(DIMENSOES)}."}), 400
+    inicio, fim, loja_id, setor_id = parametros
+    limite = min(max(request.args.get('limite', 100, type=int), 1), 1000)
+    return jsonify(analise_para_dict(analisar_perdas(inicio, fim, por, loja_id, setor_id, limite=limite)))
+
+@routes.route('/api/perdas/top')
+@login_required
+@condicional(_contador_do_cargo, 'referencias', 'perdas')
+def api_top_perdas():
+    parametros = _parametros_perdas()
+    if parametros is None:
+        return jsonify({"erro": "Informe data_inicio e data_fim (AAAA-MM-DD, até 2 anos)."}), 400
+    inicio, fim, loja_id, setor_id = parametros
+    n = min(max(request.args.get('n', 10, type=int), 1), 100)
+    return jsonify(analise_para_dict(top_perdas(inicio, fim, n, loja_id, setor_id)))
 
 
+@routes.route('/api/buscar')
+@login_required
+@condicional(lambda: 'catalogo' if request.args.get('fonte', 'catalogo') == 'catalogo' else _contador_do_cargo())
+def api_buscar():
+    termo, fonte = (request.args.get('q') or '').strip(), request.args.get('fonte', 'catalogo')
+    limite = max(1, min(request.args.get('limite', 10, type=int), 50))
+    if len(termo) < 2:
+        return jsonify({"resultados": []})
+    if fonte == 'catalogo':
+        return jsonify({"resultados": busca_texto.buscar_catalogo(termo, limite)})
+    if current_user.role in ['gerente_geral', 'gerente_trocas']: loja_id, setor_id = None, None
+    elif current_user.role == 'gerente': loja_id, setor_id = current_user.loja_id, None
+    elif current_user.role == 'encarregado_setor': loja_id, setor_id = current_user.loja_id, current_user.setor_id
+    else: abort(403)
+    ids = busca_texto.buscar_produtos(termo, loja_id=loja_id, setor_id=setor_id, limite=limite)
+    produtos = {p.id: p for p in produtos_com_relacionamentos().filter(Produto.id.in_(ids)).all()} if ids else {}
+    return jsonify({"resultados": [produto_para_dict(produtos[i]) for i in ids if i in produtos]})
+
 @routes.route('/api/buscar-produto/<string:barcode>')
 @login_required
 def api_buscar_produto(barcode):
-    produto_catalogo = ProdutoCatalogo.query.filter_by(barcode=barcode).first()
-    if produto_catalogo:
-        return jsonify({"nome": produto_catalogo.nome_produto, "plu": produto_catalogo.plu or barcode, "encontrado": True, "fonte": "Catálogo Interno"})
-    url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("status") == 1 and data.get("product"):
-                produto = data.get("product")
-                nome = produto.get("product_name_pt") or produto.get("product_name", "")
-                return jsonify({"nome": nome.strip(), "plu": barcode, "encontrado": True, "fonte": "Open Food Facts"})
-    except requests.exceptions.RequestException:
-        return jsonify({"encontrado": False, "mensagem": "Erro de conexão com a API."})
-    return jsonify({"encontrado": False, "mensagem": "Produto não encontrado."})
\ No newline at end of file
+    return jsonify(buscar_produto(barcode))
+
+@routes.route('/api/buscar-produto/estatisticas')
+@login_required
+def api_estatisticas_busca():
+    if current_user.role != 'gerente_geral': abort(403)
+    return jsonify(estatisticas_busca())
+
+
+# --- CATÁLOGO OFFLINE DO SCANNER ---
+
+@routes.route('/api/catalogo/snapshot')
+@login_required
+def api_catalogo_snapshot():
+    desde = request.args.get('desde', type=int) or 0
+    # Confere a ETag pelo contador do catálogo antes de montar o snapshot
+    etag = f"catalogo-{desde}-{versoes_dados(['catalogo'])['catalogo'][0]}"
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    versao, corpo = catalogo_offline.snapshot(desde)
+    etag = f'catalogo-{desde}-{versao}'
+    if 'gzip' in request.accept_encodings:
+        resposta = Response(corpo, mimetype='application/json', headers={'Content-Encoding': 'gzip'})
+    else:
+        resposta = Response(gzip.decompress(corpo), mimetype='application/json')
+    resposta.set_etag(etag)
+    resposta.headers['Vary'] = 'Accept-Encoding'
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+
+# --- EVENTOS EM TEMPO REAL (SSE) ---
+
+@routes.route('/eventos/produtos')
+@login_required
+def eventos_produtos():
+    if current_user.role == 'encarregado_setor': loja_id, setor_id = current_user.loja_id, current_user.setor_id
+    elif current_user.role == 'gerente': loja_id, setor_id = current_user.loja_id, request.args.get('setor_id', type=int)
+    elif current_user.role in ['gerente_geral', 'gerente_trocas']: loja_id, setor_id = request.args.get('loja_id', type=int), request.args.get('setor_id', type=int)
+    else: abort(403)
+    broker = obter_broker()
+    if broker.conexoes() >= current_app.config['SSE_MAX_CONEXOES']:
+        # Um 503 faria o EventSource desistir; com o retry o navegador volta mais tarde
+        return Response(resposta_lotada(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    # Assina antes de ler os eventos perdidos, para não haver janela entre os dois
+    assinatura, ultimo_id, perdidos = broker.assinar(loja_id, setor_id), request.headers.get('Last-Event-ID', type=int), []
+    if ultimo_id is None:
+        ultimo_id = ultimo_evento(broker.engine)
+    else:
+        perdidos = eventos_desde(broker.engine, ultimo_id)
+        # Muitas alterações desde a última conexão: o cliente recarrega a página
+        assinatura.atrasada = len(perdidos) >= LIMITE_REENVIO
+        perdidos = [] if assinatura.atrasada else [e for e in perdidos if assinatura.aceita(e[2], e[3])]
+    # Sem stream_with_context: o contexto (e a conexão com o banco) é liberado antes do streaming
+    resposta = Response(transmitir(broker, assinatura, ultimo_id, perdidos, duracao_maxima=current_app.config['SSE_DURACAO_MAXIMA']), mimetype='text/event-stream')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
@@ -0,0 +1,79 @@
+// Atualiza as listagens de produtos a partir dos eventos do servidor (SSE), sem recarregar a página.
+// Linhas existentes são editadas ou removidas no lugar; produtos novos e mudanças da
+// varredura de validade aparecem num aviso com o botão "Atualizar lista".
+document.addEventListener('DOMContentLoaded', function () {
+    const aviso = document.getElementById('avisoEventos');
+    if (!aviso || typeof EventSource === 'undefined') {
+        return;
+    }
+    const avisoTexto = document.getElementById('avisoEventosTexto');
+    let novos = 0;
+
+    function mostrarAviso(texto) {
+        avisoTexto.textContent = texto;
+        aviso.classList.remove('d-none');
+    }
+
+    function formatarData(iso) {
+        const [ano, mes, dia] = iso.split('-');
+        return `${dia}/${mes}/${ano}`;
+    }
+
+    function diasRestantes(iso) {
+        const hoje = new Date();
+        hoje.setHours(0, 0, 0, 0);
+        return Math.round((new Date(iso + 'T00:00:00') - hoje) / 86400000);
+    }
+
+    function linhasDoProduto(id) {
+        return document.querySelectorAll(`tr[data-produto-id="${id}"]`);
+    }
+
+    function atualizarLinha(produto) {
+        linhasDoProduto(produto.id).forEach(function (linha) {
+            const statusDaTabela = (linha.closest('tbody').dataset.status || '').split(',');
+            if (!statusDaTabela.includes(produto.status)) {
+                // Mudou para um status que esta tabela não lista (ex.: Em Rebaixa, Vencido)
+                linha.remove();
+                return;
+            }
+            const campos = {
+                nome_produto: produto.nome_produto,
+                validade: formatarData(produto.validade),
+                dias: diasRestantes(produto.validade),
+                status: produto.status,
+            };
+            linha.querySelectorAll('[data-campo]').forEach(function (celula) {
+                if (celula.dataset.campo in campos) {
+                    celula.textContent = campos[celula.dataset.campo];
+                }
+            });
+        });
+        const tabela = document.querySelector(`tbody[data-status*="${produto.status}"]`);
+        if (tabela && !linhasDoProduto(produto.id).length) {
+            mostrarAviso('Há produtos com status alterado.');
+        }
+    }
+
+    const fonte = new EventSource(aviso.dataset.url);
+    const dados = (evento) => JSON.parse(evento.data);
+
+    fonte.addEventListener('criado', function () {
+        novos += 1;
+        mostrarAviso(`${novos} novo(s) produto(s) cadastrado(s).`);
+    });
+    fonte.addEventListener('lote', function (evento) {
+        novos += dados(evento).quantidade;
+        mostrarAviso(`${novos} novo(s) produto(s) cadastrado(s).`);
+    });
+    fonte.addEventListener('editado', (evento) => atualizarLinha(dados(evento)));
+    fonte.addEventListener('status', (evento) => atualizarLinha(dados(evento)));
+    fonte.addEventListener('removido', function (evento) {
+        linhasDoProduto(dados(evento).id).forEach((linha) => linha.remove());
+    });
+    fonte.addEventListener('ciclo', () => mostrarAviso('A validade de alguns produtos foi atualizada.'));
+    fonte.addEventListener('recarregar', function () {
+        fonte.close();
+        mostrarAviso('Muitas alterações desde a última atualização.');
+    });
+});
@@ -32,6 +32,14 @@ document.addEventListener('DOMContentLoaded', function () {
     const btnParar = document.getElementById('btnPararScan');
     const imagemContainer = document.getElementById('imagemContainer');
     const imagemProduto = document.getElementById('imagemProduto');
+    const quantidadeInput = document.getElementById('quantidade');
+    const validadeInput = document.getElementById('validade');
+    const setorSelect = document.getElementById('setor_id'); // Não existe para o encarregado
+    const modoContinuo = document.getElementById('modoContinuo');
+    const painelLote = document.getElementById('painelLote');
+    const filaLote = document.getElementById('filaLote');
+    const btnEnviarLote = document.getElementById('btnEnviarLote');
+    const contadorLote = document.getElementById('contadorLote');
     
     const hints = new Map();
     const formats = [ZXing.BarcodeFormat.EAN_13, ZXing.BarcodeFormat.CODE_128, ZXing.BarcodeFormat.EAN_8, ZXing.BarcodeFormat.UPC_A, ZXing.BarcodeFormat.ITF];
@@ -41,6 +49,50 @@ document.addEventListener('DOMContentLoaded', function () {
     const codeReader = new ZXing.BrowserMultiFormatReader(hints);
     let selectedDeviceId;
 
+    // --- Armazenamento local (IndexedDB): catálogo para consulta offline e fila de cadastros ---
+    const bancoLocal = new Promise((resolve, reject) => {
+        if (!window.indexedDB) { reject(new Error('IndexedDB indisponível')); return; }
+        const pedido = indexedDB.open('controle_validade', 1);
+        pedido.onupgradeneeded = () => {
+            const banco = pedido.result;
+            banco.createObjectStore('catalogo', { keyPath: 'barcode' });
+            banco.createObjectStore('meta');
+            banco.createObjectStore('fila', { keyPath: 'chave' });
+        };
+        pedido.onsuccess = () => resolve(pedido.result);
+        pedido.onerror = () => reject(pedido.error);
+    });
+    let filaPersistida = true;
+    bancoLocal.catch(() => { filaPersistida = false; });
+
+    function operacaoLocal(loja, modo, executar) {
+        return bancoLocal.then(banco => new Promise((resolve, reject) => {
+            const transacao = banco.transaction(loja, modo);
+            const resultado = executar(transacao.objectStore(loja));
+            transacao.oncomplete = () => resolve(resultado && 'result' in resultado ? resultado.result : undefined);
+            transacao.onerror = () => reject(transacao.error);
+        }));
+    }
+
+    function sincronizarCatalogo() {
+        if (!navigator.onLine) { return Promise.resolve(); }
+        return operacaoLocal('meta', 'readonly', loja => loja.get('versao_catalogo'))
+            .then(versao => fetch(`/api/catalogo/snapshot?desde=${versao || 0}`))
+            .then(response => (response.ok ? response.json() : null))
+            .then(snapshot => {
+                if (!snapshot) { return; }
+                return operacaoLocal('catalogo', 'readwrite', loja => {
+                    if (snapshot.completo) { loja.clear(); }
+                    snapshot.itens.forEach(([barcode, nome, plu]) => loja.put({ barcode: barcode, nome: nome, plu: plu }));
+                }).then(() => operacaoLocal('meta', 'readwrite', loja => loja.put(snapshot.versao, 'versao_catalogo')));
+            })
+            .catch(() => {});
+    }
+
+    function novaChave() {
+        return window.crypto && crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    }
+
     // Sincroniza o campo visível com o oculto sempre que o usuário digita
     barcodeInput.addEventListener('input', function() {
         barcodeFormInput.value = this.value;
@@ -65,8 +117,18 @@ document.addEventListener('DOMContentLoaded', function () {
         }
         statusBusca.textContent = 'Buscando informações do produto...';
         buscarManualmenteBtn.disabled = true;
-        fetch(`/api/buscar-produto/${barcode}`)
-            .then(response => response.json())
+        // Primeiro o catálogo local; a API só é chamada para códigos que ele ainda não tem
+        operacaoLocal('catalogo', 'readonly', loja => loja.get(barcode))
+            .catch(() => undefined)
+            .then(item => {
+                if (item) {
+                    return { encontrado: true, fonte: 'Catálogo local', nome: item.nome, plu: item.plu || barcode };
+                }
+                if (!navigator.onLine) {
+                    return { encontrado: false, mensagem: 'Sem conexão e código fora do catálogo local; preencha o nome manualmente.' };
+                }
+                return fetch(`/api/buscar-produto/${barcode}`).then(response => response.json());
+            })
             .then(data => {
                 statusBusca.textContent = data.encontrado ? `Encontrado: ${data.fonte}` : data.mensagem;
                 if (data.encontrado) {
@@ -87,6 +149,175 @@ document.addEventListener('DOMContentLoaded', function () {
 
     buscarManualmenteBtn.addEventListener('click', buscarInformacoesDoProduto);
 
+    // --- Autocompletar o nome pelo catálogo (busca por prefixo, sem acentos) ---
+    const sugestoesProduto = document.getElementById('sugestoesProduto');
+    let sugestoes = [];
+    let temporizadorSugestao;
+
+    nomeInput.addEventListener('input', () => {
+        const selecionada = sugestoes.find(s => s.nome_produto === nomeInput.value);
+        if (selecionada) {
+            pluInput.value = selecionada.plu || selecionada.barcode;
+            barcodeInput.value = selecionada.barcode;
+            barcodeFormInput.value = selecionada.barcode;
+            return;
+        }
+        clearTimeout(temporizadorSugestao);
+        const termo = nomeInput.value.trim();
+        if (termo.length < 2) { return; }
+        temporizadorSugestao = setTimeout(() => {
+            fetch(`/api/buscar?fonte=catalogo&q=${encodeURIComponent(termo)}`)
+                .then(response => response.json())
+                .then(data => {
+                    sugestoes = data.resultados;
+                    sugestoesProduto.innerHTML = '';
+                    sugestoes.forEach(s => {
+                        const opcao = document.createElement('option');
+                        opcao.value = s.nome_produto;
+                        opcao.label = `${s.barcode}${s.plu ? ' · PLU ' + s.plu : ''}`;
+                        sugestoesProduto.appendChild(opcao);
+                    });
+                })
+                .catch(() => {});
+        }, 200);
+    });
+
+    // --- Leitura contínua: as leituras vão para uma fila e são enviadas em lote ---
+    // A fila fica no IndexedDB até o servidor confirmar, então sobrevive a quedas de
+    // Wi-Fi e ao fechamento da página; a chave de cada item evita cadastro duplicado
+    // quando um envio chega ao servidor mas a resposta se perde.
+    const TAMANHO_LOTE = 20;
+    const fila = [];
+    let ultimaLeitura = { codigo: null, momento: 0 };
+    let enviandoLote = false;
+
+    function renderizarFila() {
+        filaLote.innerHTML = '';
+        fila.forEach((item, indice) => {
+            const li = document.createElement('li');
+            li.className = 'list-group-item d-flex justify-content-between align-items-center';
+            li.textContent = `${item.barcode || item.nome_produto} · qtd ${item.quantidade} · ${item.validade.split('-').reverse().join('/')}`;
+            const btnRemover = document.createElement('button');
+            btnRemover.type = 'button';
+            btnRemover.className = 'btn btn-sm btn-outline-danger';
+            btnRemover.innerHTML = '<i class="bi bi-x"></i>';
+            btnRemover.addEventListener('click', () => {
+                const [removido] = fila.splice(indice, 1);
+                operacaoLocal('fila', 'readwrite', loja => loja.delete(removido.chave)).catch(() => {});
+                renderizarFila();
+            });
+            li.appendChild(btnRemover);
+            filaLote.appendChild(li);
+        });
+        contadorLote.textContent = fila.length;
+        btnEnviarLote.disabled = enviandoLote || fila.length === 0;
+    }
+
+    function enfileirarLeitura(codigo) {
+        const agora = Date.now();
+        // A mesma etiqueta continua na frente da câmera por alguns quadros
+        if (codigo === ultimaLeitura.codigo && agora - ultimaLeitura.momento < 2000) { return; }
+        ultimaLeitura = { codigo: codigo, momento: agora };
+        if (!quantidadeInput.value || !validadeInput.value || (setorSelect && !setorSelect.value)) {
+            statusBusca.textContent = 'Preencha quantidade, validade e setor antes de usar a leitura contínua.';
+            return;
+        }
+        adicionarNaFila({
+            barcode: codigo,
+            quantidade: quantidadeInput.value,
+            validade: validadeInput.value,
+            setor_id: setorSelect ? setorSelect.value : null,
+            motivo_rebaixa: document.querySelector('input[name="motivo_rebaixa"]').value || null
+        });
+        statusBusca.textContent = `Lido: ${codigo} (${fila.length} na fila)`;
+    }
+
+    function adicionarNaFila(item) {
+        item.chave = novaChave();
+        fila.push(item);
+        operacaoLocal('fila', 'readwrite', loja => loja.put(item)).catch(() => {});
+        renderizarFila();
+        if (fila.length >= TAMANHO_LOTE && navigator.onLine) { enviarLote(); }
+    }
+
+    function enviarLote() {
+        if (enviandoLote || fila.length === 0) { return; }
+        enviandoLote = true;
+        const lote = fila.splice(0, fila.length);
+        renderizarFila();
+        statusBusca.textContent = `Enviando ${lote.length} item(ns)...`;
+        fetch('/api/produtos/lote', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ itens: lote })
+        })
+            .then(response => response.json().then(data => ({ ok: response.ok, data: data })))
+            .then(({ ok, data }) => {
+                if (ok) {
+                    operacaoLocal('fila', 'readwrite', loja => lote.forEach(item => loja.delete(item.chave))).catch(() => {});
+                    statusBusca.textContent = `${data.cadastrados} produto(s) cadastrado(s) com sucesso.` + (data.repetidos ? ` ${data.repetidos} já tinham sido enviados.` : '');
+                    return;
+                }
+                // Nada foi gravado: o lote volta para a fila para ser corrigido
+                fila.unshift(...lote);
+                const detalhes = (data.erros || []).map(e => `${e.barcode || '#' + (e.posicao + 1)}: ${e.erro}`).join(' | ');
+                statusBusca.textContent = `Lote não enviado. ${data.erro || detalhes}`;
+            })
+            .catch(() => {
+                fila.unshift(...lote);
+                statusBusca.textContent = 'Falha de conexão; os itens continuam na fila.';
+            })
+            .finally(() => {
+                enviandoLote = false;
+                renderizarFila();
+            });
+    }
+
+    modoContinuo.addEventListener('change', () => {
+        painelLote.style.display = modoContinuo.checked ? 'block' : 'none';
+    });
+    btnEnviarLote.addEventListener('click', enviarLote);
+    window.addEventListener('beforeunload', (event) => {
+        // Sem IndexedDB a fila só existe nesta página
+        if (!filaPersistida && fila.length > 0) { event.preventDefault(); event.returnValue = ''; }
+    });
+
+    // Sem conexão, o cadastro pelo formulário também vai para a fila local
+    const formProduto = document.getElementById('formProduto');
+    formProduto.addEventListener('submit', (event) => {
+        if (navigator.onLine) { return; }
+        event.preventDefault();
+        adicionarNaFila({
+            barcode: barcodeFormInput.value || null,
+            nome_produto: nomeInput.value,
+            plu: pluInput.value,
+            quantidade: quantidadeInput.value,
+            validade: validadeInput.value,
+            setor_id: setorSelect ? setorSelect.value : null,
+            motivo_rebaixa: formProduto.querySelector('input[name="motivo_rebaixa"]').value || null
+        });
+        painelLote.style.display = 'block';
+        statusBusca.textContent = 'Sem conexão: produto guardado na fila e será enviado quando a rede voltar.';
+        formProduto.reset();
+    });
+
+    // Restaura a fila pendente de visitas anteriores e sincroniza quando a rede volta
+    operacaoLocal('fila', 'readonly', loja => loja.getAll())
+        .then(pendentes => {
+            if (!pendentes || !pendentes.length) { return; }
+            fila.push(...pendentes);
+            painelLote.style.display = 'block';
+            statusBusca.textContent = `${pendentes.length} cadastro(s) pendente(s) de envio.`;
+            renderizarFila();
+            enviarLote();
+        })
+        .catch(() => {});
+    sincronizarCatalogo();
+    window.addEventListener('online', () => {
+        sincronizarCatalogo();
+        enviarLote();
+    });
+
     btnIniciar.addEventListener('click', () => {
         btnIniciar.disabled = true;
         statusBusca.textContent = "Iniciando câmera...";
@@ -101,7 +332,9 @@ document.addEventListener('DOMContentLoaded', function () {
                 statusBusca.textContent = "Aponte o código de barras para a câmera...";
 
                 codeReader.decodeFromVideoDevice(selectedDeviceId, 'video', (result, err) => {
-                    if (result) {
+                    if (result && modoContinuo.checked) {
+                        enfileirarLeitura(result.text);
+                    } else if (result) {
                         pararScanner();
                         barcodeInput.value = result.text;
                         barcodeFormInput.value = result.text;
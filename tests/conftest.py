@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+import pytest
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, datetime, timedelta
+
+# Cada teste roda num banco SQLite novo em tmp_path, criado pelo próprio
+# 'flask init-db', com bcrypt de custo baixo e sem limite de tentativas de login.
+
+SENHA = 'senha-teste'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "teste.db"}')
+    monkeypatch.setenv('BCRYPT_LOG_ROUNDS', '4')
+    from app import create_app, db
+    from app.autenticacao import limite_ip, limite_usuario
+    from app.busca_produto import cache_produtos, cache_negativo
+    from app.identidade import invalidar_usuario
+    monkeypatch.setattr(limite_ip, 'ativo', False)
+    monkeypatch.setattr(limite_usuario, 'ativo', False)
+    cache_produtos.limpar()
+    cache_negativo.limpar()
+    invalidar_usuario()
+    app = create_app()
+    app.config['TESTING'] = True
+    app.instance_path = str(tmp_path)
+    resultado = app.test_cli_runner().invoke(args=['init-db'])
+    assert resultado.exit_code == 0, resultado.output
+    yield app
+    app.extensions['eventos'].parar()
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    invalidar_usuario()
+
+
+@pytest.fixture
+def base(app):
+    """Ids da loja e do setor padrão e um usuário de cada cargo (username = cargo@teste)."""
+    from app import db
+    from app.models import Loja, Setor, Usuario
+    with app.app_context():
+        loja, setor = Loja.query.first(), Setor.query.first()
+        ids = {'loja_id': loja.id, 'setor_id': setor.id}
+        for cargo in ['gerente_geral', 'gerente_trocas', 'gerente', 'encarregado_setor', 'auxiliar_gestao']:
+            usuario = Usuario(username=f'{cargo}@teste', role=cargo,
+                              loja_id=loja.id if cargo in ['gerente', 'encarregado_setor', 'auxiliar_gestao'] else None,
+                              setor_id=setor.id if cargo == 'encarregado_setor' else None)
+            usuario.set_password(SENHA)
+            db.session.add(usuario)
+            db.session.flush()
+            ids[cargo] = usuario.id
+        db.session.commit()
+    return ids
+
+
+@pytest.fixture
+def login(app, base):
+    def entrar(cargo):
+        cliente = app.test_client()
+        # Segue até o dashboard do cargo, que consome o flash do login (ele desliga as ETags)
+        resposta = cliente.post('/login', data={'username': f'{cargo}@teste', 'password': SENHA}, follow_redirects=True)
+        assert resposta.status_code == 200 and resposta.request.path != '/login'
+        return cliente
+    return entrar
+
+
+@pytest.fixture
+def cadastrar(app, base):
+    """Grava `quantidade` produtos na loja/setor padrão, com o encarregado como autor."""
+    def gravar(quantidade, status='Para Rebaixa', dias_validade=5):
+        from app import db
+        from app.models import Produto
+        with app.app_context():
+            db.session.add_all([Produto(nome_produto=f'Produto {i}', plu=str(1000 + i), quantidade=1 + i % 5,
+                                        validade=date.today() + timedelta(days=dias_validade), status=status,
+                                        data_cadastro=datetime.utcnow(), loja_id=base['loja_id'], setor_id=base['setor_id'],
+                                        criado_por_id=base['encarregado_setor']) for i in range(quantidade)])
+            db.session.commit()
+    return gravar
+
+
+# --- OPEN FOOD FACTS LOCAL ---
+# Um http.server de verdade em 127.0.0.1 (porta livre), numa thread, no lugar da
+# API: o cliente passa pelo requests, pelo pool de conexões e pelos timeouts reais.
+# Responde conforme `respostas` (corpo JSON, com '_status' opcional); códigos em
+# `desconectados` fecham a conexão sem resposta e `atrasos` segura a resposta por
+# alguns segundos. Com `segurar`, cada resposta fica pendente até `liberar`,
+# mandando um cabeçalho de tempos em tempos (upstream lento, mas vivo).
+
+class ServidorHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, pedido, endereco):
+        pass  # cliente que desistiu por timeout fecha o socket antes da resposta
+
+
+class OpenFoodFactsLocal:
+    def __init__(self):
+        self.respostas, self.atrasos, self.desconectados = {}, {}, set()
+        self.chamadas = []
+        self.segurar = False
+        self.liberar = threading.Event()
+        self.em_andamento = threading.Event()
+        servidor = self
+
+        class Manipulador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                servidor._responder(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ServidorHTTP(('127.0.0.1', 0), Manipulador)
+        self.url = f'http://127.0.0.1:{self.http.server_address[1]}/{{barcode}}.json'
+        threading.Thread(target=self.http.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    def _responder(self, pedido):
+        barcode = pedido.path.rsplit('/', 1)[-1].split('.')[0]
+        self.chamadas.append(barcode)
+        if barcode in self.desconectados:
+            pedido.close_connection = True
+            return
+        time.sleep(self.atrasos.get(barcode, 0))
+        corpo = dict(self.respostas.get(barcode, {'status': 0}))
+        status = corpo.pop('_status', 200)
+        conteudo = json.dumps(corpo).encode('utf-8')
+        pedido.wfile.write(f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\nContent-Length: {len(conteudo)}\r\n'.encode())
+        if self.segurar:
+            self.em_andamento.set()
+            while not self.liberar.wait(0.05):
+                pedido.wfile.write(b'X-Aguarde: 1\r\n')
+        pedido.wfile.write(b'\r\n' + conteudo)
+
+    def encerrar(self):
+        self.liberar.set()
+        self.http.shutdown()
+        self.http.server_close()
+
+
+@pytest.fixture
+def upstream(app, monkeypatch):
+    from app.busca_produto import contadores
+    from app.open_food_facts import cliente_off
+    servidor = OpenFoodFactsLocal()
+    monkeypatch.setattr(cliente_off, 'sessao', None)
+    monkeypatch.setattr(cliente_off, 'url', servidor.url)
+    monkeypatch.setattr(cliente_off, 'falhas_seguidas', 0)
+    monkeypatch.setattr(cliente_off, 'aberto_ate', 0.0)
+    monkeypatch.setattr(cliente_off, 'latencia_media', None)
+    for chave in contadores:
+        monkeypatch.setitem(contadores, chave, 0)
+    yield servidor
+    servidor.encerrar()
+    if cliente_off.sessao is not None:
+        cliente_off.sessao.close()
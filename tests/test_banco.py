@@ -0,0 +1,28 @@
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import pytest
+
+# Gravações concorrentes enquanto um relatório de toda a rede é lido: com WAL e
+# busy_timeout nenhuma escrita pode falhar com "database is locked".
+
+
+def test_escritas_seguem_durante_a_leitura_de_um_relatorio(app):
+    from app import db
+    from app.benchmark import gerar_dados, estresse_concorrencia
+    with app.app_context():
+        gerar_dados(lojas=2, produtos=10000, catalogo=100)
+    resultado = estresse_concorrencia(app, segundos=2, escritores=4)
+    assert resultado['escritas_com_erro'] == 0
+    assert resultado['escritas'] >= 20 and resultado['relatorios_lidos'] >= 1
+    assert resultado['linhas_lidas'] >= 10000
+    with app.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+
+
+def test_bind_de_leitura_nao_grava(app):
+    from app.banco import sessao_leitura
+    with app.app_context():
+        with sessao_leitura() as sessao:
+            assert sessao.execute(text('SELECT count(*) FROM produto')).scalar() == 0
+            with pytest.raises(OperationalError):
+                sessao.execute(text("INSERT INTO setor (nome) VALUES ('X')"))
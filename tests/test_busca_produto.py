@@ -0,0 +1,165 @@
+import threading
+
+# A busca por código de barras roda contra um Open Food Facts local (ver o fixture upstream no conftest).
+
+
+def _buscar(app, barcode):
+    from app.busca_produto import buscar_produto
+    with app.app_context():
+        return buscar_produto(barcode)
+
+
+def test_catalogo_interno_sem_chamada_externa(app, upstream):
+    from app import db
+    from app.models import ProdutoCatalogo
+    from app.busca_produto import cache_produtos
+    with app.app_context():
+        db.session.add(ProdutoCatalogo(barcode='789', nome_produto='Café', plu='42'))
+        db.session.commit()
+    assert _buscar(app, '789') == {'nome': 'Café', 'plu': '42', 'encontrado': True, 'fonte': 'Catálogo Interno'}
+    hits = cache_produtos.estatisticas()['hits']
+    assert _buscar(app, '789')['nome'] == 'Café'
+    assert cache_produtos.estatisticas()['hits'] == hits + 1
+    assert upstream.chamadas == []
+
+
+def test_resultado_externo_vai_para_o_catalogo_e_o_cache(app, upstream):
+    from app.models import ProdutoCatalogo
+    upstream.respostas['111'] = {'status': 1, 'product': {'product_name_pt': 'Leite Integral'}}
+    assert _buscar(app, '111') == {'nome': 'Leite Integral', 'plu': '111', 'encontrado': True, 'fonte': 'Open Food Facts'}
+    assert _buscar(app, '111')['nome'] == 'Leite Integral'
+    assert upstream.chamadas == ['111']
+    with app.app_context():
+        assert ProdutoCatalogo.query.filter_by(barcode='111').one().nome_produto == 'Leite Integral'
+
+
+def test_codigo_desconhecido_entra_no_cache_negativo(app, upstream):
+    from app.busca_produto import cache_negativo, invalidar_barcode
+    assert _buscar(app, '222')['encontrado'] is False
+    assert _buscar(app, '222')['encontrado'] is False
+    assert upstream.chamadas == ['222']
+    assert cache_negativo.estatisticas()['itens'] == 1
+    # Cadastrar o código no catálogo invalida o cache negativo
+    invalidar_barcode('222')
+    _buscar(app, '222')
+    assert upstream.chamadas == ['222', '222']
+
+
+def test_erro_de_rede_nao_entra_no_cache_negativo(app, upstream):
+    from app.busca_produto import contadores
+    upstream.desconectados.add('333')
+    assert _buscar(app, '333') == {'encontrado': False, 'mensagem': 'Erro de conexão com a API.'}
+    upstream.desconectados.clear()
+    upstream.respostas['333'] = {'status': 1, 'product': {'product_name': 'Arroz'}}
+    assert _buscar(app, '333')['nome'] == 'Arroz'
+    assert upstream.chamadas == ['333', '333']
+    assert (contadores['externo_erro'], contadores['externo_encontrado']) == (1, 1)
+
+
+def test_erro_5xx_conta_como_falha(app, upstream):
+    upstream.respostas['444'] = {'_status': 503}
+    assert _buscar(app, '444')['mensagem'] == 'Erro de conexão com a API.'
+    from app.open_food_facts import cliente_off
+    assert cliente_off.falhas_seguidas == 1
+
+
+# --- COALESCÊNCIA E DISJUNTOR ---
+
+def _em_segundo_plano(app, barcode):
+    resultado = {}
+    thread = threading.Thread(target=lambda: resultado.update(_buscar(app, barcode)))
+    thread.start()
+    return thread, resultado
+
+
+def test_espera_esgotada_nao_vira_nao_encontrado(app, upstream, monkeypatch):
+    from app.busca_produto import cache_negativo
+    from app.open_food_facts import cliente_off
+    upstream.segurar = True
+    upstream.respostas['555'] = {'status': 1, 'product': {'product_name': 'Feijão'}}
+    monkeypatch.setattr(cliente_off, 'timeout_maximo', 0.2)
+    lider, resultado = _em_segundo_plano(app, '555')
+    assert upstream.em_andamento.wait(5)
+    # Quem espera a mesma consulta desiste no timeout com erro, sem cache negativo
+    assert _buscar(app, '555') == {'encontrado': False, 'mensagem': 'Erro de conexão com a API.'}
+    assert cache_negativo.get('555') is None
+    upstream.liberar.set()
+    lider.join(5)
+    assert resultado['nome'] == 'Feijão'
+    assert upstream.chamadas == ['555']
+
+
+def test_disjuntor_abre_e_deixa_uma_consulta_de_teste(app, upstream, monkeypatch):
+    from app.busca_produto import contadores
+    from app.open_food_facts import cliente_off
+    monkeypatch.setattr(cliente_off, 'limite_falhas', 2)
+    monkeypatch.setattr(cliente_off, 'timeout_maximo', 0.1)
+    upstream.atrasos.update({'1': 0.3, '2': 0.3})
+    _buscar(app, '1'), _buscar(app, '2')
+    assert cliente_off.estado == 'aberto'
+    # Aberto: responde na hora, sem chamar o upstream
+    assert _buscar(app, '3') == {'encontrado': False, 'mensagem': 'Produto não encontrado.'}
+    assert (upstream.chamadas, contadores['circuito_aberto']) == (['1', '2'], 1)
+
+    # Passado o tempo aberto, só uma consulta de teste chega ao upstream
+    monkeypatch.setattr(cliente_off, 'aberto_ate', 0.0)
+    assert cliente_off.estado == 'meio_aberto'
+    upstream.chamadas.clear()
+    upstream.segurar = True
+    upstream.respostas['4'] = {'status': 1, 'product': {'product_name': 'Sonda'}}
+    sonda, resultado = _em_segundo_plano(app, '4')
+    assert upstream.em_andamento.wait(5)
+    assert _buscar(app, '5')['mensagem'] == 'Produto não encontrado.'
+    assert contadores['circuito_aberto'] == 2
+    upstream.liberar.set()
+    sonda.join(5)
+    assert resultado['nome'] == 'Sonda' and upstream.chamadas == ['4']
+    assert cliente_off.estado == 'fechado'
+
+
+def test_consulta_de_teste_com_falha_reabre(app, upstream, monkeypatch):
+    from app.open_food_facts import cliente_off
+    monkeypatch.setattr(cliente_off, 'limite_falhas', 1)
+    upstream.desconectados.update({'1', '2'})
+    _buscar(app, '1')
+    monkeypatch.setattr(cliente_off, 'aberto_ate', 0.0)
+    _buscar(app, '2')
+    assert cliente_off.estado == 'aberto'
+    _buscar(app, '3')
+    assert upstream.chamadas == ['1', '2']
+
+
+# --- TIMEOUT ADAPTATIVO ---
+
+def test_timeout_volta_a_crescer_quando_o_upstream_fica_lento(app, upstream, monkeypatch):
+    from app.open_food_facts import cliente_off
+    monkeypatch.setattr(cliente_off, 'timeout_minimo', 0.05)
+    monkeypatch.setattr(cliente_off, 'timeout_maximo', 1.0)
+    monkeypatch.setattr(cliente_off, 'limite_falhas', 3)
+    for barcode in '123':
+        upstream.respostas[barcode] = {'status': 1, 'product': {'product_name': f'Produto {barcode}'}}
+    _buscar(app, '1')
+    assert cliente_off.timeout == 0.05
+    # O upstream passa a levar 0,15 s: a primeira chamada estoura o timeout curto...
+    upstream.atrasos.update({'2': 0.15, '3': 0.15})
+    assert _buscar(app, '2')['mensagem'] == 'Erro de conexão com a API.'
+    # ...e o timeout estourado puxa a média para cima, então a seguinte já passa
+    assert cliente_off.timeout > 0.15
+    assert _buscar(app, '3')['nome'] == 'Produto 3'
+    assert cliente_off.estado == 'fechado'
+
+
+def test_consulta_de_teste_usa_o_timeout_maximo(app, upstream, monkeypatch):
+    from app.open_food_facts import cliente_off
+    monkeypatch.setattr(cliente_off, 'timeout_minimo', 0.05)
+    monkeypatch.setattr(cliente_off, 'timeout_maximo', 1.0)
+    monkeypatch.setattr(cliente_off, 'limite_falhas', 1)
+    monkeypatch.setattr(cliente_off, 'latencia_media', 0.001)
+    upstream.atrasos['7'] = 0.2
+    upstream.respostas['7'] = {'status': 1, 'product': {'product_name': 'Lento'}}
+    _buscar(app, '7')
+    assert cliente_off.estado == 'aberto'
+    monkeypatch.setattr(cliente_off, 'aberto_ate', 0.0)
+    monkeypatch.setattr(cliente_off, 'latencia_media', 0.001)
+    assert _buscar(app, '7')['nome'] == 'Lento'
+    assert cliente_off.estado == 'fechado'
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.mark.parametrize('limite,esperado', [(-1, 1), (0, 1), (3, 3), (100, 12)])
+def test_limite_da_busca_textual(app, login, limite, esperado):
+    from app import db
+    from app.models import ProdutoCatalogo
+    with app.app_context():
+        db.session.add_all([ProdutoCatalogo(barcode=str(7000 + i), nome_produto=f'Arroz Tipo {i}', plu=str(i)) for i in range(12)])
+        db.session.commit()
+    resposta = login('encarregado_setor').get(f'/api/buscar?q=arroz&limite={limite}')
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['resultados']) == esperado
@@ -0,0 +1,73 @@
+import time
+from datetime import date, timedelta
+
+# Cadastro em lote pela API (/api/produtos/lote), com o Open Food Facts falso do conftest.
+
+VALIDADE = (date.today() + timedelta(days=10)).isoformat()
+
+
+def _item(barcode, chave=None, **extra):
+    item = {'barcode': barcode, 'quantidade': 2, 'validade': VALIDADE}
+    if chave:
+        item['chave'] = chave
+    item.update(extra)
+    return item
+
+
+def _catalogados(app):
+    from app.models import ProdutoCatalogo
+    with app.app_context():
+        return {c.barcode: c.nome_produto for c in ProdutoCatalogo.query.all()}
+
+
+def test_codigo_externo_entra_no_catalogo_junto_com_o_lote(app, login, upstream):
+    upstream.respostas['111'] = {'status': 1, 'product': {'product_name': 'Leite'}}
+    cliente = login('encarregado_setor')
+    resposta = cliente.post('/api/produtos/lote', json={'itens': [_item('111')]})
+    assert resposta.status_code == 201, resposta.get_json()
+    assert _catalogados(app) == {'111': 'Leite'}
+
+
+def test_lote_recusado_nao_grava_o_catalogo(app, login, upstream):
+    upstream.respostas['111'] = {'status': 1, 'product': {'product_name': 'Leite'}}
+    cliente = login('encarregado_setor')
+    resposta = cliente.post('/api/produtos/lote', json={'itens': [_item('111'), _item('222', quantidade=0)]})
+    assert resposta.status_code == 400
+    assert [e['posicao'] for e in resposta.get_json()['erros']] == [1]
+    assert _catalogados(app) == {}
+
+
+def test_consultas_externas_respeitam_o_prazo_do_lote(app, login, upstream):
+    app.config['LOTE_BUSCA_PRAZO'] = 0.2
+    upstream.segurar = True
+    cliente = login('encarregado_setor')
+    inicio = time.monotonic()
+    resposta = cliente.post('/api/produtos/lote', json={'itens': [_item(str(b)) for b in range(300, 320)]})
+    assert time.monotonic() - inicio < 2
+    assert resposta.status_code == 400
+    erros = resposta.get_json()['erros']
+    assert len(erros) == 20 and erros[0]['erro'].startswith('Não foi possível consultar o produto agora')
+    # As consultas saem em paralelo (uma por thread do pool); as que não começaram no prazo são canceladas
+    assert len(upstream.chamadas) == 10
+
+
+def test_chave_de_idempotencia_vale_por_usuario(app, base, login, upstream):
+    item = _item('555', chave='fila-1', nome_produto='Arroz', plu='55', setor_id=base['setor_id'])
+    for cargo in ['encarregado_setor', 'auxiliar_gestao']:
+        resposta = login(cargo).post('/api/produtos/lote', json={'itens': [item]})
+        assert resposta.get_json() == {'cadastrados': 1, 'repetidos': 0, 'erros': []}
+    from app.models import Produto
+    with app.app_context():
+        assert Produto.query.count() == 2
+
+
+def test_reenvio_de_fila_ja_gravada(app, login, upstream):
+    itens = [_item(str(b), chave=f'fila-{b}', nome_produto='Arroz', plu='55') for b in range(600, 603)]
+    cliente = login('encarregado_setor')
+    assert cliente.post('/api/produtos/lote', json={'itens': itens}).get_json() == {'cadastrados': 3, 'repetidos': 0, 'erros': []}
+    resposta = cliente.post('/api/produtos/lote', json={'itens': itens})
+    assert resposta.status_code == 200
+    assert resposta.get_json() == {'cadastrados': 0, 'repetidos': 3, 'erros': []}
+    from app.models import Produto
+    with app.app_context():
+        assert Produto.query.count() == 3
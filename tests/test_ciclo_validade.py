@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+
+# As listagens classificam pela validade mesmo sem a varredura (cron/agendador) ter rodado.
+
+
+def _nomes(cliente, url):
+    return sorted(p['nome_produto'] for p in cliente.get(url + '?formato=json').get_json()['produtos'])
+
+
+def test_vencido_sem_varredura_aparece_nos_vencidos(app, login, cadastrar):
+    cadastrar(1, dias_validade=-1)
+    cadastrar(1, status='Vencido', dias_validade=-3)
+    cliente = login('encarregado_setor')
+    assert _nomes(cliente, '/encarregado/produtos') == []
+    assert len(_nomes(cliente, '/encarregado/vencidos')) == 2
+    assert len(_nomes(login('gerente'), '/produtos/vencidos')) == 2
+    painel = login('gerente').get('/gerente/dashboard?formato=json').get_json()
+    assert painel['para_rebaixa']['produtos'] == []
+
+
+def test_editar_validade_recalcula_o_status(app, login, cadastrar):
+    from app.models import Produto
+    cadastrar(1, status='Vencido', dias_validade=-1)
+    cliente = login('encarregado_setor')
+
+    def editar(dias):
+        with app.app_context():
+            produto = Produto.query.one()
+        cliente.post(f'/produtos/{produto.id}/editar', data={'nome_produto': produto.nome_produto, 'plu': produto.plu, 'quantidade': '1',
+                                                             'validade': (date.today() + timedelta(days=dias)).isoformat()})
+        with app.app_context():
+            return Produto.query.one().status
+
+    assert editar(10) == 'Para Rebaixa'
+    assert editar(1) == 'Em Rebaixa'
+    assert editar(10) == 'Em Rebaixa'
+    assert editar(-1) == 'Vencido'
+
+
+def test_vencido_nao_volta_para_a_rebaixa(app, login, cadastrar):
+    from app.models import Produto
+    cadastrar(1, status='Vencido', dias_validade=-1)
+    cadastrar(1, dias_validade=-1)
+    cadastrar(1, status='Descartado', dias_validade=-10)
+    cadastrar(1)
+    cliente = login('gerente')
+    with app.app_context():
+        ids = [p.id for p in Produto.query.order_by(Produto.id)]
+    for produto_id in ids:
+        cliente.post(f'/produtos/{produto_id}/status', data={'status': 'Em Rebaixa'})
+    with app.app_context():
+        assert [Produto.query.get(i).status for i in ids] == ['Vencido', 'Para Rebaixa', 'Descartado', 'Em Rebaixa']
+
+
+def test_purga_leva_os_vencidos_da_listagem_antes_da_varredura(app, login, cadastrar):
+    from app.models import Produto
+    cadastrar(1, dias_validade=-5)
+    cadastrar(1, status='Vencido', dias_validade=-5)
+    cadastrar(1, dias_validade=-1)
+    resposta = login('gerente').post('/produtos/vencidos/purgar', json={'dias': 2})
+    assert resposta.get_json()['excluidos'] == 2
+    with app.app_context():
+        assert [p.validade for p in Produto.query.all()] == [date.today() - timedelta(days=1)]
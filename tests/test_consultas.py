@@ -0,0 +1,85 @@
+import pytest
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from sqlalchemy import event
+
+# As listagens e dashboards carregam loja, setor e autor junto com os produtos:
+# o número de comandos SQL por página não pode crescer com a quantidade de
+# linhas nem com a variedade de lojas/setores/autores exibidos.
+
+ROTAS = [
+    ('encarregado_setor', '/encarregado/produtos'),
+    ('encarregado_setor', '/encarregado/vencidos'),
+    ('gerente', '/gerente/dashboard'),
+    ('gerente', '/produtos/vencidos'),
+    ('gerente_geral', '/produtos/vencidos'),
+    ('gerente_geral', '/gerente-geral/dashboard'),
+]
+MAXIMO_CONSULTAS = 10
+
+
+@contextmanager
+def contar_consultas(app):
+    from app import db
+    comandos = []
+    def registrar(conexao, cursor, sql, parametros, contexto, executemany):
+        comandos.append(sql)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        yield comandos
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', registrar)
+
+
+def _povoar(app, base, autores, setores):
+    """Um produto de cada status ativo e um vencido por autor e setor."""
+    from app import db
+    from app.models import Produto, Setor, Usuario
+    with app.app_context():
+        ids_setores = [s.id for s in Setor.query.order_by(Setor.id).limit(setores)]
+        ids_autores = [base['encarregado_setor']]
+        for i in range(autores - 1):
+            autor = Usuario(username=f'autor{i}-{autores}@teste', role='auxiliar_gestao', loja_id=base['loja_id'], password_hash='x')
+            db.session.add(autor)
+            db.session.flush()
+            ids_autores.append(autor.id)
+        for setor_id in ids_setores:
+            for autor_id in ids_autores:
+                for status, dias in [('Para Rebaixa', 10), ('Em Rebaixa', 1), ('Vencido', -2)]:
+                    db.session.add(Produto(nome_produto=f'{status} {autor_id}', plu=str(autor_id), quantidade=1, validade=date.today() + timedelta(days=dias),
+                                           status=status, data_cadastro=datetime.utcnow(), loja_id=base['loja_id'], setor_id=setor_id, criado_por_id=autor_id))
+        db.session.commit()
+
+
+@pytest.mark.parametrize('formato', ['', '?formato=json'])
+@pytest.mark.parametrize('cargo,url', ROTAS)
+def test_consultas_por_pagina_nao_dependem_das_linhas(app, base, login, cargo, url, formato):
+    cliente = login(cargo)
+    _povoar(app, base, autores=1, setores=1)
+    cliente.get(url + formato)  # aquece os caches de usuário e referências
+    with contar_consultas(app) as poucas_linhas:
+        assert cliente.get(url + formato).status_code == 200
+    _povoar(app, base, autores=8, setores=4)
+    with contar_consultas(app) as muitas_linhas:
+        assert cliente.get(url + formato).status_code == 200
+    assert len(muitas_linhas) == len(poucas_linhas)
+    assert len(muitas_linhas) <= MAXIMO_CONSULTAS
+
+
+def test_snapshot_do_catalogo_revalidado_nao_consulta_o_catalogo(app, login):
+    from app import db
+    from app.models import ProdutoCatalogo
+    with app.app_context():
+        db.session.add_all([ProdutoCatalogo(barcode=str(8000 + i), nome_produto=f'Item {i}', plu=str(i)) for i in range(3)])
+        db.session.commit()
+    cliente = login('encarregado_setor')
+    resposta = cliente.get('/api/catalogo/snapshot?desde=1')
+    assert resposta.status_code == 200
+    with contar_consultas(app) as comandos:
+        resposta = cliente.get('/api/catalogo/snapshot?desde=1', headers={'If-None-Match': resposta.headers['ETag']})
+    assert resposta.status_code == 304
+    assert not any('produto_catalogo' in sql for sql in comandos)
@@ -0,0 +1,96 @@
+import json
+import threading
+
+# As conexões SSE recebem os eventos pela tabela evento_produto, então alterações
+# feitas fora do processo do servidor (cron, CLI, outro worker) também chegam.
+
+
+def _abrir(app, cliente, cabecalhos=None):
+    """Lê o stream em segundo plano até ele se encerrar por SSE_DURACAO_MAXIMA."""
+    partes, pronto = [], threading.Event()
+    resposta = cliente.get('/eventos/produtos', headers=cabecalhos or {}, buffered=False)
+    assert resposta.status_code == 200
+
+    def ler():
+        for parte in resposta.response:
+            partes.append(parte.decode() if isinstance(parte, bytes) else parte)
+            pronto.set()
+    thread = threading.Thread(target=ler)
+    thread.start()
+    assert pronto.wait(5)
+    return thread, partes
+
+
+def _eventos(partes):
+    eventos = []
+    for bloco in ''.join(partes).split('\n\n'):
+        campos = dict(linha.split(': ', 1) for linha in bloco.split('\n') if ': ' in linha and not linha.startswith(':'))
+        if 'event' in campos:
+            eventos.append((campos['event'], json.loads(campos['data'])))
+    return eventos
+
+
+def _configurar(app):
+    app.config.update(SSE_DURACAO_MAXIMA=1.0, SSE_INTERVALO_CONSULTA=0.05)
+    app.extensions['eventos'].intervalo = 0.05
+
+
+def test_cadastro_e_varredura_pelo_cli_chegam_ao_stream(app, login, cadastrar):
+    _configurar(app)
+    cadastrar(1, dias_validade=-1)
+    cliente = login('encarregado_setor')
+    thread, partes = _abrir(app, cliente)
+    cliente.post('/produtos', data={'nome_produto': 'Novo', 'plu': '9', 'quantidade': '1', 'validade': '2099-01-01'})
+    resultado = app.test_cli_runner().invoke(args=['ciclo-validade'])
+    assert resultado.exit_code == 0, resultado.output
+    thread.join(5)
+    assert [tipo for tipo, _ in _eventos(partes)] == ['criado', 'ciclo']
+
+
+def test_reconexao_reenvia_so_os_eventos_do_escopo(app, base, login):
+    from app import db
+    from app.eventos import gravar_evento, ultimo_evento
+    _configurar(app)
+    with app.app_context():
+        inicio = ultimo_evento(db.engine)
+        with db.engine.begin() as conexao:
+            gravar_evento(conexao, 'lote', base['loja_id'], base['setor_id'], {'quantidade': 3})
+            gravar_evento(conexao, 'lote', base['loja_id'], base['setor_id'] + 1, {'quantidade': 9})
+    thread, partes = _abrir(app, login('encarregado_setor'), {'Last-Event-ID': str(inicio)})
+    thread.join(5)
+    assert _eventos(partes) == [('lote', {'quantidade': 3, 'loja_id': base['loja_id'], 'setor_id': base['setor_id']})]
+
+
+def test_rollback_nao_grava_evento(app, base):
+    from app import db
+    from app.models import EventoProduto
+    from app.eventos import agendar_evento
+    with app.app_context():
+        agendar_evento(db.session, 'lote', base['loja_id'], base['setor_id'], {'quantidade': 1})
+        db.session.rollback()
+        assert EventoProduto.query.count() == 0
+
+
+def test_limite_de_conexoes_por_processo_pede_reconexao(app, login):
+    app.config['SSE_MAX_CONEXOES'] = 0
+    resposta = login('encarregado_setor').get('/eventos/produtos')
+    # Um erro faria o EventSource desistir; o retry só adia a reconexão
+    assert resposta.status_code == 200 and resposta.mimetype == 'text/event-stream'
+    assert 15000 <= int(resposta.get_data(as_text=True).split('\n')[0].removeprefix('retry: ')) <= 45000
+
+
+def test_varredura_apaga_os_eventos_antigos(app, base):
+    from datetime import datetime, timedelta
+    from app import db
+    from app.models import EventoProduto
+    from app.eventos import gravar_evento
+    with app.app_context():
+        with db.engine.begin() as conexao:
+            gravar_evento(conexao, 'lote', base['loja_id'], base['setor_id'], {'quantidade': 1})
+            gravar_evento(conexao, 'lote', base['loja_id'], base['setor_id'], {'quantidade': 2})
+        antigo = db.session.get(EventoProduto, 1)
+        antigo.criado_em = datetime.utcnow() - timedelta(minutes=app.config['SSE_RETENCAO_MINUTOS'] + 1)
+        db.session.commit()
+    assert app.test_cli_runner().invoke(args=['ciclo-validade']).exit_code == 0
+    with app.app_context():
+        assert [e.id for e in EventoProduto.query.all()] == [2]
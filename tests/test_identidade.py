@@ -0,0 +1,51 @@
+# O usuário da sessão fica em cache por processo; uma alteração gravada por outro
+# processo (aqui, direto pelo ORM, sem passar por invalidar_usuario) vale já na
+# requisição seguinte.
+
+
+def test_alteracao_em_outro_processo_vale_na_proxima_requisicao(app, base, login):
+    from app import db
+    from app.models import Usuario
+    cliente = login('encarregado_setor')
+    assert cliente.get('/encarregado/produtos').status_code == 200
+    with app.app_context():
+        db.session.get(Usuario, base['encarregado_setor']).role = 'auxiliar_gestao'
+        db.session.commit()
+    resposta = cliente.get('/encarregado/produtos')
+    assert resposta.status_code == 302 and resposta.location.endswith('/')
+
+
+def test_usuario_excluido_perde_a_sessao(app, base, login):
+    from app import db
+    from app.models import Usuario
+    cliente = login('encarregado_setor')
+    with app.app_context():
+        db.session.delete(db.session.get(Usuario, base['encarregado_setor']))
+        db.session.commit()
+    assert '/login' in cliente.get('/encarregado/produtos').location
+
+
+def test_nome_da_loja_alterado_aparece_sem_esperar_o_ttl(app, base):
+    from app import db
+    from app.identidade import carregar_usuario
+    from app.models import Loja
+    with app.test_request_context():
+        assert carregar_usuario(base['gerente']).loja.nome != 'Loja Renomeada'
+    with app.app_context():
+        db.session.get(Loja, base['loja_id']).nome = 'Loja Renomeada'
+        db.session.commit()
+    with app.test_request_context():
+        assert carregar_usuario(base['gerente']).loja.nome == 'Loja Renomeada'
+
+
+def test_troca_de_senha_nao_invalida_o_cache(app, base):
+    from app import db
+    from app.models import Usuario, versao_atual
+    with app.app_context():
+        antes = versao_atual(db.session.connection(), 'usuarios')
+        db.session.get(Usuario, base['gerente']).set_password('outra-senha')
+        db.session.commit()
+        assert versao_atual(db.session.connection(), 'usuarios') == antes
+        db.session.get(Usuario, base['gerente']).setor_id = base['setor_id']
+        db.session.commit()
+        assert versao_atual(db.session.connection(), 'usuarios') > antes
@@ -0,0 +1,32 @@
+import os
+
+# create_app() não importa as bibliotecas pesadas (ReportLab, requests, openpyxl)
+# e cabe no orçamento de importação; os comandos de provisionamento não são interativos.
+
+
+def test_importacao_do_create_app_dentro_do_orcamento(app):
+    from app.benchmark import medir_inicializacao
+    resultado = medir_inicializacao(os.path.dirname(app.root_path), repeticoes=3)
+    assert resultado['sob_demanda_importados'] == []
+    assert resultado['total_ms'] <= app.config['INICIALIZACAO_ORCAMENTO_MS'], resultado['pacotes_ms']
+
+
+def test_gerente_geral_criado_sem_perguntas(app, monkeypatch):
+    from app.models import Usuario
+    monkeypatch.setenv('GERENTE_GERAL_USUARIO', 'chefe@teste')
+    monkeypatch.setenv('GERENTE_GERAL_SENHA', 'segredo')
+    resultado = app.test_cli_runner().invoke(args=['create-general-manager'], input='')
+    assert resultado.exit_code == 0, resultado.output
+    with app.app_context():
+        assert Usuario.query.filter_by(username='chefe@teste').one().check_password('segredo')
+
+
+def test_gerente_geral_sem_senha_falha_sem_perguntar(app, monkeypatch):
+    from app.models import Usuario
+    monkeypatch.setenv('GERENTE_GERAL_USUARIO', 'chefe@teste')
+    monkeypatch.delenv('GERENTE_GERAL_SENHA', raising=False)
+    resultado = app.test_cli_runner().invoke(args=['create-general-manager'], input='segredo\nsegredo\n')
+    assert resultado.exit_code == 2
+    assert 'GERENTE_GERAL_SENHA' in resultado.output
+    with app.app_context():
+        assert Usuario.query.filter_by(username='chefe@teste').first() is None
@@ -0,0 +1,96 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+
+
+def _job(chave='c', status='processando', processado_por=None, pulsacao_ha=0):
+    from app.models import RelatorioJob
+    return RelatorioJob(id=os.urandom(8).hex(), chave=chave, status=status, parametros=json.dumps({}), processado_por=processado_por,
+                        atualizado_em=datetime.utcnow() - timedelta(seconds=pulsacao_ha))
+
+
+def _pid_encerrado():
+    processo = subprocess.Popen([sys.executable, '-c', 'pass'])
+    processo.wait()
+    return processo.pid
+
+
+def test_so_retoma_jobs_de_donos_parados(app):
+    from app import db
+    from app.jobs import _liberar_abandonados
+    from app.models import RelatorioJob
+    host = socket.gethostname()
+    with app.app_context():
+        ativo_outro_host = _job('a', processado_por='outro-host:1', pulsacao_ha=10)
+        ativo_neste_host = _job('b', processado_por=f'{host}:{os.getppid()}', pulsacao_ha=10)
+        dono_morto = _job('c', processado_por=f'{host}:{_pid_encerrado()}', pulsacao_ha=10)
+        sem_pulsacao = _job('d', processado_por='outro-host:1', pulsacao_ha=app.config['RELATORIO_JOB_TIMEOUT'] + 60)
+        db.session.add_all([ativo_outro_host, ativo_neste_host, dono_morto, sem_pulsacao])
+        db.session.commit()
+        assert _liberar_abandonados(app, RelatorioJob.query.all()) == 2
+        status = {j.chave: j.status for j in RelatorioJob.query.all()}
+    assert status == {'a': 'processando', 'b': 'processando', 'c': 'pendente', 'd': 'pendente'}
+
+
+def test_dono_antigo_para_quando_o_job_e_retomado(app):
+    from app import db
+    from app.jobs import _com_pulsacao, JobRetomado
+    from app.models import RelatorioJob
+    with app.app_context():
+        job = _job(processado_por='eu:1')
+        db.session.add(job)
+        db.session.commit()
+        linhas = _com_pulsacao(iter(range(10)), job.id, 'eu:1', intervalo=0)
+        assert next(linhas) == 0
+        RelatorioJob.query.filter_by(id=job.id).update({'processado_por': 'outro:2'})
+        db.session.commit()
+        with pytest.raises(JobRetomado):
+            next(linhas)
+
+
+def test_um_job_ativo_por_chave(app):
+    from app import db
+    with app.app_context():
+        db.session.add_all([_job('x', status='concluido'), _job('x', status='concluido'), _job('x', status='pendente')])
+        db.session.commit()
+        db.session.add(_job('x', status='processando'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_pedido_simultaneo_usa_o_job_da_outra_requisicao(app, monkeypatch):
+    from app import db
+    from app import jobs
+    from app.models import RelatorioJob
+    parametros = {'escopo': 'setor', 'titulo': 'T', 'nome_arquivo': 'r.pdf', 'loja_id': 1, 'setor_id': 1, 'data_inicio': '2026-01-01', 'data_fim': '2026-01-31'}
+    obter_executor = jobs._obter_executor
+    def outra_requisicao_grava_antes(app):
+        # Chamado entre a procura pelo job existente e a gravação do novo
+        db.session.add(_job(jobs.calcular_chave(parametros, 0), processado_por='outro-host:1'))
+        db.session.commit()
+        return obter_executor(app)
+    monkeypatch.setattr(jobs, '_obter_executor', outra_requisicao_grava_antes)
+    with app.app_context():
+        job = jobs.enfileirar_relatorio(app, parametros)
+        assert RelatorioJob.query.count() == 1
+        assert job.id == RelatorioJob.query.one().id
+
+
+def test_benchmark_de_pdf_so_remove_os_proprios_jobs(app):
+    from app import db
+    from app.benchmark import gerar_dados, executar_benchmark
+    from app.models import RelatorioJob
+    with app.app_context():
+        gerar_dados(lojas=1, produtos=200, catalogo=10)
+        db.session.add(_job('de-um-usuario', status='concluido'))
+        db.session.commit()
+    resultado = executar_benchmark(app, repeticoes=2, filtro='relatorio_setor_pdf')
+    assert resultado['cenarios']['relatorio_setor_pdf']['status_http'] == [200]
+    with app.app_context():
+        assert [j.chave for j in RelatorioJob.query.all()] == ['de-um-usuario']
@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+REMOTO = {'REMOTE_ADDR': '10.0.0.9'}
+
+
+def test_metricas_sem_token_ficam_desligadas(app, login):
+    # Nem localhost (o proxy reverso) nem o gerente geral passam sem o token
+    assert app.test_client().get('/metrics').status_code == 404
+    assert login('gerente_geral').get('/metrics').status_code == 404
+    app.config['METRICAS_PUBLICO'] = True
+    assert app.test_client().get('/metrics', environ_base=REMOTO).status_code == 200
+
+
+def test_metricas_com_token(app):
+    app.config['METRICAS_TOKEN'] = 'segredo'
+    cliente = app.test_client()
+    assert cliente.get('/metrics').status_code == 401
+    assert cliente.get('/metrics', headers={'Authorization': 'Bearer errado'}).status_code == 401
+    resposta = cliente.get('/metrics', headers={'Authorization': 'Bearer segredo'})
+    assert resposta.status_code == 200 and b'http_request_duration_seconds' in resposta.data
+
+
+def test_comando_com_erro_nao_deixa_inicio_na_conexao(app):
+    from app import db
+    with app.app_context():
+        with db.engine.connect() as conexao:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conexao.execute(text('SELECT * FROM tabela_que_nao_existe'))
+                conexao.rollback()
+            conexao.execute(text('SELECT 1'))
+            assert conexao.info.get('inicio_sql') == []
+
+
+def test_amostragem_pula_quando_ja_ha_perfil_ativo(app):
+    import os
+    from app import metricas
+    app.config['PROFILER_AMOSTRAGEM'] = 1.0
+    pasta = os.path.join(app.instance_path, 'perfis')
+    assert metricas._perfil_ativo.acquire(blocking=False)
+    try:
+        assert app.test_client().get('/login').status_code == 200
+    finally:
+        metricas._perfil_ativo.release()
+    assert not os.path.isdir(pasta)
+    assert app.test_client().get('/login').status_code == 200
+    assert len(os.listdir(pasta)) == 1 and not metricas._perfil_ativo.locked()
@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.mark.parametrize('limite,esperado', [(-1, 1), (3, 3), (10**6, 7)])
+def test_limite_fica_entre_1_e_o_maximo(app, login, cadastrar, monkeypatch, limite, esperado):
+    from app import paginacao
+    monkeypatch.setattr(paginacao, 'LIMITE_MAXIMO', 7)
+    cadastrar(10)
+    cliente = login('encarregado_setor')
+    resposta = cliente.get(f'/encarregado/produtos?formato=json&limite={limite}')
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['produtos']) == esperado
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+# A análise só lê o agregado perda_diaria; quem o atualiza é a varredura do ciclo de validade.
+
+
+def _analise(cliente, **parametros):
+    resposta = cliente.get('/api/perdas', query_string=parametros)
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def test_analise_nao_grava_e_le_o_agregado_da_ultima_varredura(app, login, cadastrar):
+    from tests.test_consultas import contar_consultas
+    cadastrar(2, status='Vencido', dias_validade=-1)
+    cliente = login('gerente')
+    with contar_consultas(app) as comandos:
+        assert _analise(cliente)['totais']['itens_cadastrados'] == 0
+    assert not any(sql.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')) for sql in comandos)
+    assert app.test_cli_runner().invoke(args=['ciclo-validade']).exit_code == 0
+    totais = _analise(cliente)['totais']
+    assert totais['itens_cadastrados'] == 2 and totais['itens_perdidos'] == 2
+
+
+def test_ranking_de_produtos_ordena_e_corta_no_banco(app, login, cadastrar):
+    from tests.test_consultas import contar_consultas
+    cadastrar(5, status='Vencido', dias_validade=-1)
+    with contar_consultas(app) as comandos:
+        analise = _analise(login('gerente'), por='produto', limite=2)
+    assert analise['total_linhas'] == 5
+    # O cadastrar grava a quantidade 1 + i % 5: os PLUs 1004 e 1003 perderam mais
+    assert [l['chave'] for l in analise['linhas']] == ['1004', '1003']
+    assert any('ORDER BY' in sql and 'LIMIT' in sql for sql in comandos)
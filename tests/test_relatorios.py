@@ -0,0 +1,47 @@
+import time
+from datetime import date, timedelta
+
+
+def _aguardar_job(cliente, job_id, segundos=10):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        job = cliente.get(f'/relatorios/jobs/{job_id}').get_json()
+        if job['status'] in ('concluido', 'erro'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} não terminou')
+
+
+def _pedir_relatorio(cliente):
+    hoje = date.today()
+    resposta = cliente.get(f'/encarregado/relatorio/pdf?data_inicio={(hoje - timedelta(days=1)).isoformat()}&data_fim={hoje.isoformat()}', headers={'Accept': 'application/json'})
+    assert resposta.status_code == 202
+    return resposta.get_json()['id']
+
+
+def test_relatorio_para_no_maximo_de_linhas(app, login, cadastrar):
+    app.config['RELATORIO_MAXIMO_LINHAS'] = 5
+    cadastrar(8)
+    cliente = login('encarregado_setor')
+    job = _aguardar_job(cliente, _pedir_relatorio(cliente))
+    assert job['status'] == 'concluido', job
+    assert (job['total_linhas'], job['truncado']) == (5, True)
+    assert cliente.get(f"/relatorios/jobs/{job['id']}/download").data.startswith(b'%PDF')
+
+
+def test_relatorio_completo_abaixo_do_maximo(app, login, cadastrar):
+    cadastrar(8)
+    cliente = login('encarregado_setor')
+    job = _aguardar_job(cliente, _pedir_relatorio(cliente))
+    assert (job['status'], job['total_linhas'], job['truncado']) == ('concluido', 8, False)
+
+
+def test_consulta_do_relatorio_limita_no_banco(app, cadastrar):
+    from app.relatorios import consultar_produtos_relatorio
+    from tests.test_consultas import contar_consultas
+    cadastrar(8)
+    hoje = date.today()
+    with app.app_context(), contar_consultas(app) as comandos:
+        linhas = list(consultar_produtos_relatorio(hoje - timedelta(days=1), hoje + timedelta(days=1), limite=3))
+    assert len(linhas) == 3
+    assert any('LIMIT' in sql for sql in comandos)